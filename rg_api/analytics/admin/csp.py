@@ -2,6 +2,7 @@
 Admin configuration for CSPReport model.
 """
 from django.contrib import admin
+from utils.admin_filters import GeotaggedListFilter
 from ..models import CSPReport
 
 
@@ -23,6 +24,7 @@ class CSPReportAdmin(admin.ModelAdmin):
         'violated_directive',
         'effective_directive',
         'status_code',
+        GeotaggedListFilter,
     )
     search_fields = (
         'document_uri',
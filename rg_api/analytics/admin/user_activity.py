@@ -6,6 +6,7 @@ from django.urls import path, reverse
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.utils.html import format_html
+from utils.admin_filters import GeotaggedListFilter
 from ..models import UserActivity
 
 
@@ -16,7 +17,8 @@ class UserActivityAdmin(admin.ModelAdmin):
     """
     list_display = ('user', 'session_link', 'action', 'path', 'method',
                     'ip_address', 'country', 'city', 'timestamp')
-    list_filter = ('action', 'method', 'timestamp', 'country')
+    list_filter = ('action', 'method', 'timestamp', 'country',
+                   GeotaggedListFilter)
     search_fields = ('user__username', 'path', 'ip_address', 'city', 'country')
     readonly_fields = ('timestamp', 'latitude', 'longitude', 'city', 'country')
     list_select_related = ('user', 'session')
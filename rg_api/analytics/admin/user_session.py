@@ -4,6 +4,7 @@ Admin configuration for UserSession model.
 import json
 from django.contrib import admin
 from django.core.serializers.json import DjangoJSONEncoder
+from utils.admin_filters import GeotaggedListFilter
 from ..models import UserSession
 
 
@@ -18,7 +19,7 @@ class UserSessionAdmin(admin.ModelAdmin):
                        'duration', 'tracking_id', 'device_fingerprint')
     search_fields = ('ip_address', 'city', 'country',
                      'user_agent', 'tracking_id', 'device_fingerprint')
-    list_filter = ('country', 'started_at')
+    list_filter = ('country', 'started_at', GeotaggedListFilter)
 
     def duration(self, obj):
         """Format duration as readable string."""
@@ -45,16 +46,9 @@ class UserSessionAdmin(admin.ModelAdmin):
         except (AttributeError, KeyError):
             return response
 
-        # Aggregate geo data
-        sessions = qs.exclude(
-            latitude__isnull=True
-        ).exclude(
-            longitude__isnull=True
-        ).exclude(
-            latitude=0
-        ).exclude(
-            longitude=0
-        ).values('latitude', 'longitude', 'city', 'country', 'ip_address')
+        # Aggregate geo data (the geohash index finds located sessions)
+        sessions = qs.geotagged().values(
+            'latitude', 'longitude', 'city', 'country', 'ip_address')
 
         response.context_data['map_locations'] = json.dumps(
             list(sessions), cls=DjangoJSONEncoder)
@@ -0,0 +1,32 @@
+"""Management command to backfill the geohash index of located rows."""
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from utils.mixins import GeoIndexMixin, backfill_geohashes
+
+
+class Command(BaseCommand):
+    """
+    Management command to recompute the geohash of every located row.
+
+    Covers all models using `GeoIndexMixin` (gallery images and the
+    analytics sessions, activities and CSP reports). Saves and bulk writes
+    keep the geohash current; this repairs rows written around them. The
+    migration adding the column leaves existing activities unindexed, so run
+    it once after migrating.
+    """
+    help = 'Recompute the geohash index of every model with coordinates'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per batch (default: 1000)')
+
+    def handle(self, *args, **options):
+        """Execute the command to backfill geohashes."""
+        batch_size = max(1, options['batch_size'])
+        for model in apps.get_models():
+            if not issubclass(model, GeoIndexMixin):
+                continue
+            updated = backfill_geohashes(model, batch_size)
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.label}: updated {updated} rows."))
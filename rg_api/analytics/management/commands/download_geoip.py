@@ -39,13 +39,17 @@ class Command(BaseCommand):
         self.stdout.write(
             "downloading GeoIP database... this might take a minute.")
 
+        # Download next to the target and swap it in atomically, so running
+        # workers never map a half-written file and pick up the new one.
+        temp_path = f"{dest_path}.tmp"
         try:
             # Stream download to handle large file size
             with requests.get(db_url, stream=True, timeout=120) as req:
                 req.raise_for_status()
-                with open(dest_path, 'wb') as file_obj:
+                with open(temp_path, 'wb') as file_obj:
                     for chunk in req.iter_content(chunk_size=8192):
                         file_obj.write(chunk)
+            os.replace(temp_path, dest_path)
 
             self.stdout.write(getattr(self.style, 'SUCCESS')(
                 f"Successfully downloaded GeoIP database to {dest_path}"))
@@ -56,3 +60,6 @@ class Command(BaseCommand):
         except OSError as exc:
             self.stderr.write(getattr(self.style, 'ERROR')(
                 f"File system error: {exc}"))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
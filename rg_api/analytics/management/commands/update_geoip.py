@@ -1,5 +1,5 @@
 """Management command to update the GeoLite2-City.mmdb file from a free alternative source."""
-import shutil
+import os
 import urllib.request
 import urllib.error
 from pathlib import Path
@@ -13,9 +13,10 @@ class Command(BaseCommand):
     Management command to update the GeoLite2-City database file.
 
     This command downloads the latest GeoLite2-City.mmdb file from a public mirror
-    and saves it to the configured GEOIP_PATH directory. It handles the creation
-    of the directory if it doesn't exist and ensures a safe download process using
-    a temporary file.
+    and saves it to the configured GEOIP_PATH. It handles the creation of the
+    directory if it doesn't exist and downloads to a temporary file that is then
+    atomically renamed over the old database, so running workers (which watch
+    the file) switch to the new one without a restart.
     """
     help = 'Updates the GeoLite2-City.mmdb file from a free alternative source'
 
@@ -25,11 +26,12 @@ class Command(BaseCommand):
         # This is a direct download of the .mmdb file
         url = "https://github.com/P3TERX/GeoLite.mmdb/raw/download/GeoLite2-City.mmdb"
 
-        # Determine the destination path
+        # Determine the destination path (GEOIP_PATH is the .mmdb file itself)
         if hasattr(settings, 'GEOIP_PATH'):
-            geoip_path = Path(settings.GEOIP_PATH)
+            target_file = Path(settings.GEOIP_PATH)
         else:
-            geoip_path = settings.BASE_DIR / 'geoip'
+            target_file = settings.BASE_DIR / 'geoip' / 'GeoLite2-City.mmdb'
+        geoip_path = target_file.parent
 
         if not geoip_path.exists():
             try:
@@ -39,8 +41,6 @@ class Command(BaseCommand):
                     f'Failed to create directory {geoip_path}: {exc}'))
                 return
 
-        target_file = geoip_path / 'GeoLite2-City.mmdb'
-
         self.stdout.write(f"Downloading GeoIP database from {url}...")
         self.stdout.write(f"Target file: {target_file}")
 
@@ -60,8 +60,9 @@ class Command(BaseCommand):
             try:
                 urllib.request.urlretrieve(url, temp_file)  # nosec B310
 
-                # If download successful, move/rename to target
-                shutil.move(temp_file, target_file)
+                # If download successful, atomically rename over the target
+                # (same directory, so readers see either the old or new file)
+                os.replace(temp_file, target_file)
 
                 self.stdout.write(getattr(self.style, 'SUCCESS')(
                     f'Successfully updated {target_file}'))
@@ -72,6 +73,9 @@ class Command(BaseCommand):
             except OSError as exc:
                 self.stdout.write(getattr(self.style, 'ERROR')(
                     f'File operation failed: {exc}'))
+            finally:
+                if temp_file.exists():
+                    temp_file.unlink()
 
         except (urllib.error.URLError, OSError) as exc:
             # Fallback catch-all for unexpected errors
@@ -7,14 +7,9 @@ import hashlib
 import uuid
 from django.conf import settings
 from django.utils import timezone
-try:
-    import geoip2.database
-    import geoip2.errors
-    GEOIP_LIB = geoip2
-except ImportError:
-    GEOIP_LIB = None
 
-from ..models import UserActivity, UserSession
+from ..models import UserSession
+from ..services import get_analytics_writer, get_geo_resolver, get_session_store
 
 logger = logging.getLogger(__name__)
 
@@ -30,28 +25,23 @@ class AnalyticsMiddleware:
     Key Functionalities:
     - **IP Address Resolution**: Extracts client IPs handling potential proxy
       headers (X-Forwarded-For).
-    - **Geolocation**: Uses GeoIP2 to resolve IP addresses to physical locations
-      (City, Country, Lat/Lon).
+    - **Geolocation**: Resolves IP addresses to physical locations
+      (City, Country, Lat/Lon) through the shared, memoized `GeoResolver`.
     - **Session Tracking**: Manages `UserSession` records using a combination of
       Django session IDs, persistent cookies ('rg_tid'), and device fingerprinting
       to track users consistently across browser restarts.
     - **Activity Logging**: Creates discrete `UserActivity` records for tracked
       interactions (excluding admin and static paths).
+    - **Buffered Writes**: Active session state lives in the cache
+      (`SessionStore`) and activity rows are handed to the `AnalyticsWriter`,
+      which persists them in batches off the response path.
 
     Attributes:
         get_response (callable): The next middleware or view in the chain.
-        reader (geoip2.database.Reader | None): The GeoIP2 database reader instance used for
-            location lookups, or None if the library/database is missing.
     """
 
     def __init__(self, get_response):
         self.get_response = get_response
-        self.reader = None
-        if GEOIP_LIB and hasattr(settings, 'GEOIP_PATH'):
-            try:
-                self.reader = GEOIP_LIB.database.Reader(settings.GEOIP_PATH)
-            except (FileNotFoundError, PermissionError, ValueError) as e:
-                logger.warning("GeoIP database not found or invalid: %s", e)
 
     def __call__(self, request):
         # Process request before view (and before cache check if cache middleware was used globaly,
@@ -119,31 +109,15 @@ class AnalyticsMiddleware:
 
     def _get_geo_data(self, ip):
         """Resolve IP to location using GeoIP2."""
-        city, country, lat, lon = None, None, None, None
-
         if not ip:
-            return city, country, lat, lon
+            return None, None, None, None
 
         # 1. Check Localhost / Dev
         if ip in ['127.0.0.1', '::1'] and settings.DEBUG:
             return "Rome (Localhost)", "Italy", 41.9028, 12.4964
 
-        # 2. Use GeoIP if available
-        if self.reader:
-            try:
-                geo_response = self.reader.city(ip)
-                city = geo_response.city.name
-                country = geo_response.country.name
-                lat = geo_response.location.latitude
-                lon = geo_response.location.longitude
-            except (GEOIP_LIB.errors.GeoIP2Error, ValueError, TypeError):
-                # Using broad geoip exception base class if possible or specific ones
-                # Since we import errors conditionally, we need to be careful.
-                # But here self.reader implies GEOIP_LIB is loaded.
-                pass
-            # We can also catch standard exceptions that might occur during lookup
-
-        return city, country, lat, lon
+        # 2. Use GeoIP (memoized, unresolvable IPs resolve to Nones)
+        return get_geo_resolver().lookup(ip)
 
     def _get_tracking_id(self, request, response, device_fingerprint):
         """Retrieve or generate tracking ID."""
@@ -151,8 +125,15 @@ class AnalyticsMiddleware:
         current_time = timezone.now()
 
         if not tracking_id:
-            # Attempt recovery via Fingerprint
+            # Attempt recovery via Fingerprint (active sessions first)
             if device_fingerprint:
+                try:
+                    tracking_id = get_session_store().recover_tracking_id(
+                        device_fingerprint)
+                except Exception as e:  # pylint: disable=broad-except
+                    # Cache unreachable: fall back to the database lookup.
+                    logger.warning("Analytics session cache error: %s", e)
+            if not tracking_id and device_fingerprint:
                 recent_session = UserSession.objects.filter(
                     device_fingerprint=device_fingerprint,
                     last_seen_at__gte=current_time -
@@ -175,83 +156,8 @@ class AnalyticsMiddleware:
             )
         return tracking_id
 
-    def _update_session(self, user_session, session_data):
-        """Update existing user session."""
-        session_key = session_data['session_key']
-        user = session_data['user']
-        ip = session_data['ip']
-        city = session_data['city']
-
-        # Update session_key if it changed
-        if user_session.session_key != session_key:
-            if not UserSession.objects.filter(session_key=session_key).exists():
-                user_session.session_key = session_key
-
-        user_session.last_seen_at = timezone.now()
-        user_session.page_count += 1
-
-        if user and not user_session.user:
-            user_session.user = user
-
-        # Update geo if missing or changed
-        if not user_session.ip_address:
-            user_session.ip_address = ip
-
-        if city and (user_session.city != city):
-            user_session.city = city
-            user_session.country = session_data['country']
-            user_session.latitude = session_data['lat']
-            user_session.longitude = session_data['lon']
-
-        user_session.save(update_fields=[
-            'session_key', 'last_seen_at', 'page_count', 'user',
-            'ip_address', 'city', 'country', 'latitude',
-            'longitude'
-        ])
-
-    def _create_session(self, session_data):
-        """Create a new user session."""
-        current_time = timezone.now()
-        defaults = {
-            'user': session_data['user'],
-            'ip_address': session_data['ip'],
-            'city': session_data['city'],
-            'country': session_data['country'],
-            'latitude': session_data['lat'],
-            'longitude': session_data['lon'],
-            'user_agent': session_data['user_agent'],
-            'started_at': current_time,
-            'last_seen_at': current_time,
-            'page_count': 1,
-            'tracking_id': session_data['tracking_id'],
-            'device_fingerprint': session_data['device_fingerprint']
-        }
-
-        user_session, created = UserSession.objects.get_or_create(
-            session_key=session_data['session_key'],
-            defaults=defaults
-        )
-
-        if not created:
-            user_session.last_seen_at = current_time
-            user_session.page_count += 1
-
-            if not user_session.tracking_id:
-                user_session.tracking_id = session_data['tracking_id']
-                user_session.device_fingerprint = session_data['device_fingerprint']
-
-            user_session.save(
-                update_fields=[
-                    'last_seen_at',
-                    'page_count',
-                    'tracking_id',
-                    'device_fingerprint'
-                ]
-            )
-        return user_session
-
     def _manage_session(self, request, response, ip, geo_data):
-        """Orchestrate session management."""
+        """Build the session payload queued alongside the activity."""
         # Ensure Django session exists
         if not request.session.session_key:
             request.session.save()
@@ -260,11 +166,10 @@ class AnalyticsMiddleware:
         tracking_id = self._get_tracking_id(
             request, response, device_fingerprint)
         city, country, lat, lon = geo_data
-        user = request.user if request.user.is_authenticated else None
 
-        session_data = {
+        return {
             'session_key': session_key,
-            'user': user,
+            'user_id': request.user.pk if request.user.is_authenticated else None,
             'ip': ip,
             'city': city,
             'country': country,
@@ -272,27 +177,14 @@ class AnalyticsMiddleware:
             'lon': lon,
             'user_agent': request.META.get('HTTP_USER_AGENT', ''),
             'tracking_id': tracking_id,
-            'device_fingerprint': device_fingerprint
+            'device_fingerprint': device_fingerprint,
+            'seen_at': timezone.now(),
         }
 
-        # Try to find an ACTIVE session by Tracking ID
-        user_session = None
-        if tracking_id:
-            user_session = UserSession.objects.filter(
-                tracking_id=tracking_id,
-                last_seen_at__gte=timezone.now() - timezone.timedelta(minutes=30)
-            ).order_by('-last_seen_at').first()
-
-        if user_session:
-            self._update_session(user_session, session_data)
-        else:
-            user_session = self._create_session(session_data)
-
-        return user_session
-
     def track_activity(self, request, response):
         """
-        Captures and records analytics data for a successfully processed HTTP request.
+        Captures analytics data for a successfully processed HTTP request and
+        queues it for the background writer.
         """
         if not 200 <= response.status_code < 300:
             return
@@ -310,24 +202,35 @@ class AnalyticsMiddleware:
 
             geo_data = self._get_geo_data(ip)
             city, country, lat, lon = geo_data
-            user_session = self._manage_session(
+            session_data = self._manage_session(
                 request, response, ip, geo_data)
-            user = request.user if request.user.is_authenticated else None
-
-            UserActivity.objects.create(
-                session=user_session,
-                user=user,
-                action=f"{request.method} {request.path}"[:200].replace('\n', '').replace('\r', ''),
-                path=request.path[:500].replace('\n', '').replace('\r', ''),
-                method=request.method,
-                ip_address=ip,
-                city=city,
-                country=country,
-                latitude=lat,
-                longitude=lon,
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                payload={}
-            )
+            try:
+                get_session_store().touch(session_data)
+            except Exception as e:  # pylint: disable=broad-except
+                # A cache outage (e.g. Redis down) must not fail the response.
+                logger.warning(
+                    "Analytics session cache error, not tracking %s: %s",
+                    request.path, e)
+                return
+
+            get_analytics_writer().submit({
+                'session': session_data,
+                'activity': {
+                    'user_id': session_data['user_id'],
+                    'action': f"{request.method} {request.path}"[:200].replace(
+                        '\n', '').replace('\r', ''),
+                    'path': request.path[:500].replace('\n', '').replace('\r', ''),
+                    'method': request.method,
+                    'ip_address': ip,
+                    'city': city,
+                    'country': country,
+                    'latitude': lat,
+                    'longitude': lon,
+                    'user_agent': session_data['user_agent'],
+                    'payload': {},
+                    'timestamp': session_data['seen_at'],
+                },
+            })
         except (ValueError, AttributeError) as e:
             # Catch specific errors that might happen during data gathering/storage
             logger.error("Analytics tracking specific error: %s", e)
@@ -2,11 +2,14 @@
 Base models and mixins for analytics application.
 """
 from django.db import models
+from utils.mixins import GeoIndexMixin
 
 
-class GeoLocationMixin(models.Model):
+class GeoLocationMixin(GeoIndexMixin):
     """
     Abstract mixin containing common geo-location and client info fields.
+
+    The coordinates are indexed by geohash (see `GeoIndexMixin`).
     """
     ip_address = models.GenericIPAddressField(
         null=True, blank=True, db_index=True
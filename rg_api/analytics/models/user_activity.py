@@ -3,6 +3,8 @@ User activity tracking models.
 """
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+from utils.mixins import GeoQuerySet
 from .user_session import UserSession
 from .base import GeoLocationMixin
 
@@ -11,7 +13,7 @@ class UserActivity(GeoLocationMixin, models.Model):
     """
     Model for storing individual user actions and events.
     """
-    objects = models.Manager()
+    objects = GeoQuerySet.as_manager()
 
     session = models.ForeignKey(
         UserSession,
@@ -31,7 +33,9 @@ class UserActivity(GeoLocationMixin, models.Model):
     path = models.CharField(max_length=1024, blank=True)
     method = models.CharField(max_length=10, blank=True)
     payload = models.JSONField(default=dict, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Set explicitly by the buffered writer so batched rows keep request time.
+    timestamp = models.DateTimeField(
+        default=timezone.now, editable=False, db_index=True)
 
     class Meta:
         """Meta options for UserActivity."""
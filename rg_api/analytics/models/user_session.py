@@ -3,6 +3,7 @@ User session tracking models.
 """
 from django.db import models
 from django.conf import settings
+from utils.mixins import GeoQuerySet
 from .base import GeoLocationMixin
 
 
@@ -10,7 +11,7 @@ class UserSession(GeoLocationMixin, models.Model):
     """
     Model for tracking user sessions and device info.
     """
-    objects = models.Manager()
+    objects = GeoQuerySet.as_manager()
 
     session_key = models.CharField(max_length=40, unique=True)
     user = models.ForeignKey(
@@ -0,0 +1,6 @@
+"""
+Analytics services.
+"""
+from .activity_writer import AnalyticsWriter, get_analytics_writer
+from .session_store import SessionStore, get_session_store
+from .geo_resolver import GeoResolver, get_geo_resolver
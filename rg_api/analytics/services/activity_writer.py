@@ -0,0 +1,213 @@
+"""
+Buffered, asynchronous writer for analytics rows.
+
+The middleware only builds plain dictionaries describing the session and the
+activity of a request and hands them to the writer. A background thread drains
+the queue and persists whole batches with ``bulk_create``/``bulk_update``, so
+request latency no longer depends on analytics write latency.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+
+from ..models import UserActivity
+from .session_store import get_session_store
+
+logger = logging.getLogger(__name__)
+
+_writer_lock = threading.Lock()
+
+
+class AnalyticsWriter:
+    """
+    In-process buffered writer for `UserSession` and `UserActivity` rows.
+
+    Events are queued by `submit` and written by a daemon thread whenever
+    `batch_size` events are pending or `flush_interval` seconds have elapsed.
+    The queue is bounded: when it is full, events are either dropped
+    (``'drop'`` policy, the default) or the caller blocks for at most
+    `block_timeout` seconds (``'block'`` policy). Pending events are flushed
+    on interpreter shutdown.
+
+    Session counters are kept in the cache by `SessionStore`. A batch only
+    creates rows for sessions seen for the first time (so activities can point
+    at them); the background thread writes back the counters of every touched
+    session each `write_back_interval` seconds.
+
+    Each event is a dictionary with two keys:
+        session (dict): Session payload built by the middleware.
+        activity (dict): `UserActivity` field values (without ``session``).
+    """
+    POLICY_DROP = 'drop'
+    POLICY_BLOCK = 'block'
+
+    def __init__(self, batch_size=200, flush_interval=2.0, max_queue_size=10000,
+                 policy=POLICY_DROP, block_timeout=0.5, asynchronous=None,
+                 write_back_interval=30.0, session_store=None):
+        self.session_store = session_store or get_session_store()
+        self.write_back_interval = write_back_interval
+        self._last_write_back = time.monotonic()
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._asynchronous = asynchronous
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    @property
+    def asynchronous(self):
+        """Whether events are written by the background thread."""
+        if self._asynchronous is not None:
+            return self._asynchronous
+        return getattr(settings, 'ANALYTICS_ASYNC_WRITES', True)
+
+    def submit(self, event):
+        """
+        Queue an event for writing.
+
+        Returns:
+            bool: False if the event was dropped because the queue was full.
+        """
+        if not self.asynchronous:
+            self._write_safely([event])
+            self._write_back_safely()
+            return True
+
+        self._ensure_started()
+        try:
+            if self.policy == self.POLICY_BLOCK:
+                self.queue.put(event, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(
+                    "Analytics queue full, %d events dropped so far", self.dropped)
+            return False
+        return True
+
+    def flush(self):
+        """Synchronously write every queued event."""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write_safely(batch)
+
+    def stop(self, timeout=5.0):
+        """Stop the background thread and flush what is left in the queue."""
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self.flush()
+        self._write_back_safely()
+
+    def _ensure_started(self):
+        """Start the background thread on first use."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='analytics-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Background loop: collect a batch, write it, repeat."""
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write_safely(batch)
+            if time.monotonic() - self._last_write_back >= self.write_back_interval:
+                self._write_back_safely()
+            if batch:
+                close_old_connections()
+
+    def _collect_batch(self):
+        """Wait for a full batch or for the flush interval to elapse."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_safely(self, events):
+        """Write a batch, logging instead of raising on database errors."""
+        with self._write_lock:
+            try:
+                self._write_batch(events)
+            except (DatabaseError, ValueError, TypeError) as e:
+                logger.error(
+                    "Failed to write %d analytics events: %s", len(events), e)
+
+    def _write_back_safely(self):
+        """Write back cached session state, logging database errors."""
+        self._last_write_back = time.monotonic()
+        with self._write_lock:
+            try:
+                self.session_store.write_back()
+            except (DatabaseError, ValueError, TypeError) as e:
+                logger.error("Failed to write back analytics sessions: %s", e)
+
+    def _write_batch(self, events):
+        """Persist a batch of events in a single transaction."""
+        with transaction.atomic():
+            sessions = self.session_store.resolve(
+                {event['session']['tracking_id'] for event in events})
+            UserActivity.objects.bulk_create([
+                UserActivity(
+                    session_id=sessions.get(event['session']['tracking_id']),
+                    **event['activity']
+                )
+                for event in events
+            ], batch_size=self.batch_size)
+
+
+def get_analytics_writer():
+    """Return the process-wide writer, creating it from settings on first use."""
+    writer = getattr(get_analytics_writer, 'writer', None)
+    if writer is not None:
+        return writer
+    with _writer_lock:
+        writer = getattr(get_analytics_writer, 'writer', None)
+        if writer is not None:
+            return writer
+        writer = AnalyticsWriter(
+            batch_size=getattr(settings, 'ANALYTICS_WRITE_BATCH_SIZE', 200),
+            flush_interval=getattr(
+                settings, 'ANALYTICS_WRITE_FLUSH_INTERVAL', 2.0),
+            max_queue_size=getattr(
+                settings, 'ANALYTICS_WRITE_QUEUE_SIZE', 10000),
+            policy=getattr(settings, 'ANALYTICS_WRITE_QUEUE_POLICY',
+                           AnalyticsWriter.POLICY_DROP),
+            write_back_interval=getattr(
+                settings, 'ANALYTICS_SESSION_WRITEBACK_INTERVAL', 30.0),
+        )
+        get_analytics_writer.writer = writer
+        atexit.register(writer.stop)
+    return writer
@@ -0,0 +1,219 @@
+"""
+Shared, memoized GeoIP lookups.
+
+Both the analytics middleware and the CSP report endpoint resolve client IPs
+to a location. `GeoResolver` opens the GeoLite2 database once, memory-mapped,
+and keeps a bounded LRU of recent results, including negative results for
+addresses the database cannot resolve, so repeat visitors never hit the
+database again within the TTL.
+
+The database file is watched for replacement (``update_geoip`` and
+``download_geoip`` swap it atomically), so a refreshed database is picked up
+by running workers without a restart.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+try:
+    import geoip2.database
+    import geoip2.errors
+    GEOIP_LIB = geoip2
+except ImportError:
+    GEOIP_LIB = None
+
+logger = logging.getLogger(__name__)
+
+_resolver_lock = threading.Lock()
+
+EMPTY_LOCATION = (None, None, None, None)
+
+# Sentinel stamp forcing the first reader load.
+_UNCHECKED = object()
+
+
+class GeoResolver:
+    """
+    Resolves IP addresses to ``(city, country, latitude, longitude)``.
+
+    Results are memoized in an LRU of at most `max_entries` addresses. Resolved
+    entries live for `ttl` seconds, unresolvable ones for `negative_ttl`
+    seconds. The reader is opened lazily with ``MODE_MMAP`` so every worker
+    process shares the page cache instead of holding its own copy, and is
+    reopened when the file changes (checked every `reload_interval` seconds,
+    0 disables the check).
+
+    Attributes:
+        hits (int): Lookups answered from the memo.
+        misses (int): Lookups that went to the database.
+    """
+
+    def __init__(self, path=None, max_entries=10000, ttl=3600, negative_ttl=300,
+                 reload_interval=60):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.reload_interval = reload_interval
+        self.hits = 0
+        self.misses = 0
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self._reader = None
+        self._reader_stamp = _UNCHECKED
+        self._generation = 0
+        self._next_check = 0.0
+        self._reader_lock = threading.Lock()
+
+    @property
+    def reader(self):
+        """The GeoIP2 reader, or None if the library or database is missing."""
+        self._maybe_reload()
+        return self._reader
+
+    def _file_stamp(self):
+        """Identify the database file on disk by inode, mtime and size."""
+        try:
+            stat = os.stat(self.path)
+        except (OSError, TypeError):
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _maybe_reload(self):
+        """
+        Swap in a new reader if the database file was replaced.
+
+        The file is stat'ed at most once every `reload_interval` seconds. The
+        old reader is not closed: lookups still running keep their reference
+        and its memory map stays valid until they finish, even though the file
+        was replaced. Memoized results are dropped on swap.
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._reader_lock:
+            if now < self._next_check:
+                return
+            if self.reload_interval and self.reload_interval > 0:
+                self._next_check = now + self.reload_interval
+            else:
+                self._next_check = float('inf')
+
+            stamp = self._file_stamp()
+            if stamp == self._reader_stamp:
+                return
+            self._reader_stamp = stamp
+            reader = self._open_reader()
+            if reader is None:
+                # Keep serving from the previous database, if any.
+                return
+            reloaded = self._reader is not None
+            self._reader = reader
+            with self._lock:
+                self._generation += 1
+                self._memo.clear()
+        if reloaded:
+            logger.info("GeoIP database reloaded from %s", self.path)
+
+    def _open_reader(self):
+        """Open the database memory-mapped; return None on failure."""
+        if GEOIP_LIB is None or not self.path:
+            return None
+        try:
+            return GEOIP_LIB.database.Reader(
+                self.path, mode=GEOIP_LIB.database.MODE_MMAP)
+        except (GEOIP_LIB.errors.GeoIP2Error, OSError, ValueError) as e:
+            logger.warning("GeoIP database not found or invalid: %s", e)
+            return None
+
+    def lookup(self, ip):
+        """
+        Resolve `ip` to a location.
+
+        Returns:
+            tuple: ``(city, country, latitude, longitude)``; every element is
+            None when the address cannot be resolved.
+        """
+        if not ip:
+            return EMPTY_LOCATION
+
+        self._maybe_reload()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memo.get(ip)
+            if entry is not None and entry[0] > now:
+                self._memo.move_to_end(ip)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        location = self._resolve(ip)
+        if location is None:
+            location = EMPTY_LOCATION
+            expires_at = now + self.negative_ttl
+        else:
+            expires_at = now + self.ttl
+
+        with self._lock:
+            if generation != self._generation:
+                # The database was swapped mid-lookup; don't memoize.
+                return location
+            self._memo[ip] = (expires_at, location)
+            self._memo.move_to_end(ip)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return location
+
+    def _resolve(self, ip):
+        """Query the database; return None if the address is unknown."""
+        reader = self._reader
+        if reader is None:
+            return None
+        try:
+            response = reader.city(ip)
+        except (GEOIP_LIB.errors.GeoIP2Error, ValueError, TypeError):
+            return None
+        return (
+            response.city.name,
+            response.country.name,
+            response.location.latitude,
+            response.location.longitude,
+        )
+
+    def clear(self):
+        """Drop every memoized result."""
+        with self._lock:
+            self._memo.clear()
+
+    def stats(self):
+        """Return memo counters, e.g. for logging or health checks."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._memo),
+            }
+
+
+def get_geo_resolver():
+    """Return the process-wide resolver, configured from settings."""
+    resolver = getattr(get_geo_resolver, 'resolver', None)
+    if resolver is not None:
+        return resolver
+    with _resolver_lock:
+        resolver = getattr(get_geo_resolver, 'resolver', None)
+        if resolver is None:
+            resolver = GeoResolver(
+                path=getattr(settings, 'GEOIP_PATH', None),
+                max_entries=getattr(settings, 'GEOIP_CACHE_SIZE', 10000),
+                ttl=getattr(settings, 'GEOIP_CACHE_TTL', 3600),
+                negative_ttl=getattr(settings, 'GEOIP_NEGATIVE_CACHE_TTL', 300),
+                reload_interval=getattr(settings, 'GEOIP_RELOAD_INTERVAL', 60),
+            )
+            get_geo_resolver.resolver = resolver
+    return resolver
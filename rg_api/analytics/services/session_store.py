@@ -0,0 +1,394 @@
+"""
+Cache-resident state for active analytics sessions.
+
+Active `UserSession` state lives in the configured Django cache (Redis in
+production), keyed by tracking ID. Page views only touch the cache: the page
+counter is bumped with an atomic ``incr`` and the last-seen timestamp is
+overwritten. `SessionStore.write_back` periodically persists the aggregated
+state of the sessions touched since the previous call, so database writes
+scale with the number of active sessions rather than with the number of
+requests.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from ..models import UserSession
+
+_store_lock = threading.Lock()
+
+SESSION_TIMEOUT = timezone.timedelta(minutes=30)
+
+# State outlives the inactivity window so a session can still be written back
+# after it went idle; liveness is tracked by the short-lived "seen" key.
+STATE_TIMEOUT = 60 * 60 * 24
+
+SESSION_FIELDS = [
+    'last_seen_at', 'page_count', 'user', 'ip_address',
+    'city', 'country', 'latitude', 'longitude',
+]
+
+
+class SessionStore:
+    """
+    Keeps active session state in the cache and writes it back in bulk.
+
+    Three cache keys are kept per tracking ID:
+        state: dict with the session attributes and, once persisted, the
+            primary key of the matching `UserSession` row.
+        pages: integer page counter, incremented atomically.
+        seen: last-seen timestamp, expiring after `SESSION_TIMEOUT` of
+            inactivity. Its absence starts a new session.
+    """
+
+    def __init__(self, cache_alias='default', timeout=SESSION_TIMEOUT):
+        self.cache_alias = cache_alias
+        self.timeout = int(timeout.total_seconds())
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+
+    @property
+    def cache(self):
+        """The cache backend holding session state."""
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def _key(tracking_id, part):
+        return f"analytics:session:{tracking_id}:{part}"
+
+    @staticmethod
+    def fingerprint_key(device_fingerprint):
+        """Cache key mapping a device fingerprint to its latest tracking ID."""
+        return f"analytics:fingerprint:{device_fingerprint}"
+
+    def touch(self, data):
+        """
+        Record one page view for the session described by `data`.
+
+        Args:
+            data (dict): Session payload built by the middleware.
+
+        Returns:
+            int: The page count of the session after this view.
+        """
+        cache = self.cache
+        tracking_id = data['tracking_id']
+        state_key = self._key(tracking_id, 'state')
+        pages_key = self._key(tracking_id, 'pages')
+        seen_key = self._key(tracking_id, 'seen')
+
+        values = cache.get_many([state_key, seen_key])
+        state = values.get(state_key)
+
+        if state is None:
+            # New session. A concurrent first hit may already have counted
+            # its view, so only create the counter if it is missing.
+            state = self._new_state(data)
+            cache.set(state_key, state, STATE_TIMEOUT)
+            cache.add(pages_key, 0, STATE_TIMEOUT)
+        elif seen_key not in values:
+            # Expired session: start counting from scratch.
+            state = self._new_state(data)
+            cache.set_many({state_key: state, pages_key: 0}, STATE_TIMEOUT)
+        elif self._merge(state, data):
+            cache.set(state_key, state, STATE_TIMEOUT)
+
+        try:
+            pages = cache.incr(pages_key)
+        except ValueError:
+            cache.add(pages_key, 0, STATE_TIMEOUT)
+            pages = cache.incr(pages_key)
+
+        cache.set_many({
+            seen_key: data['seen_at'],
+            self.fingerprint_key(data['device_fingerprint']): tracking_id,
+        }, self.timeout)
+
+        with self._dirty_lock:
+            self._dirty.add(tracking_id)
+        return pages
+
+    def recover_tracking_id(self, device_fingerprint):
+        """Return the tracking ID last seen for a fingerprint, if still active."""
+        return self.cache.get(self.fingerprint_key(device_fingerprint))
+
+    def resolve(self, tracking_ids):
+        """
+        Return the `UserSession` primary key of each session in `tracking_ids`.
+
+        Sessions seen for the first time get their row created here, so that
+        activities can reference it; counters are left to `write_back`.
+
+        Returns:
+            dict: Mapping of tracking ID to `UserSession` primary key.
+        """
+        keys, states, _counters = self._load(tracking_ids)
+
+        # Rows may have been purged while their state was still cached.
+        known = [s['session_id'] for s in states.values()
+                 if s.get('session_id') is not None]
+        if known:
+            existing = set(UserSession.objects.filter(
+                pk__in=known).values_list('pk', flat=True))
+            for state in states.values():
+                if state.get('session_id') not in existing:
+                    state['session_id'] = None
+
+        attached = self._attach_rows({
+            tid: s for tid, s in states.items() if s.get('session_id') is None
+        })
+        self._save_states(keys, states, attached)
+        return {
+            tid: state['session_id'] for tid, state in states.items()
+            if state.get('session_id') is not None
+        }
+
+    def write_back(self):
+        """
+        Persist the cached state of every session touched since the last call.
+
+        Rows are created for sessions that have none yet; existing rows are
+        updated with ``bulk_update`` without being read first. If writing
+        fails, the sessions stay pending for the next call.
+
+        Returns:
+            int: Number of sessions written.
+        """
+        with self._dirty_lock:
+            pending = self._dirty
+            self._dirty = set()
+        if not pending:
+            return 0
+
+        try:
+            keys, states, counters = self._load(pending)
+            attached = self._attach_rows({
+                tid: s for tid, s in states.items()
+                if s.get('session_id') is None
+            })
+            # Record the rows found or created right away, so a failure below
+            # does not leave them to be attached (and counted) again.
+            self._save_states(keys, states, attached)
+            renamed = self._update_rows(states, counters)
+            self._save_states(keys, states, renamed)
+        except Exception:
+            # Keep the sessions for the next call rather than losing them.
+            with self._dirty_lock:
+                self._dirty |= pending
+            raise
+        return len(states)
+
+    def _load(self, tracking_ids):
+        """Fetch state, page counter and last-seen time for each tracking ID."""
+        keys = {
+            tracking_id: (
+                self._key(tracking_id, 'state'),
+                self._key(tracking_id, 'pages'),
+                self._key(tracking_id, 'seen'),
+            )
+            for tracking_id in tracking_ids
+        }
+        values = self.cache.get_many(
+            [k for triple in keys.values() for k in triple])
+
+        states = {}
+        counters = {}
+        for tracking_id, (state_key, pages_key, seen_key) in keys.items():
+            state = values.get(state_key)
+            if state is None:
+                continue
+            states[tracking_id] = state
+            counters[tracking_id] = (
+                values.get(pages_key, 0),
+                values.get(seen_key, state['started_at']),
+            )
+        return keys, states, counters
+
+    def _save_states(self, keys, states, tracking_ids):
+        """Store back the states in `tracking_ids`."""
+        # Only rewrite state we changed, to avoid clobbering concurrent merges.
+        if tracking_ids:
+            self.cache.set_many({
+                keys[tid][0]: states[tid] for tid in tracking_ids
+            }, STATE_TIMEOUT)
+
+    def _attach_rows(self, states):
+        """
+        Find or create the `UserSession` row of each new cached session.
+
+        Returns:
+            set: Tracking IDs whose state now references a row.
+        """
+        if not states:
+            return set()
+
+        # A row may already exist if the cache was flushed or restarted.
+        active = UserSession.objects.filter(
+            tracking_id__in=list(states),
+            last_seen_at__gte=timezone.now() - SESSION_TIMEOUT
+        ).order_by('-last_seen_at')
+        by_tracking_id = {}
+        for user_session in active:
+            by_tracking_id.setdefault(user_session.tracking_id, user_session)
+
+        by_session_key = UserSession.objects.in_bulk(
+            [s['session_key'] for s in states.values()], field_name='session_key')
+
+        attached = set()
+        new_rows = {}
+        for tracking_id, state in states.items():
+            row = by_tracking_id.get(tracking_id) or \
+                by_session_key.get(state['session_key'])
+            if row is not None:
+                attached.add(tracking_id)
+                state['session_id'] = row.pk
+                state['page_base'] = row.page_count
+                state['persisted_key'] = row.session_key
+                if not row.tracking_id:
+                    UserSession.objects.filter(pk=row.pk).update(
+                        tracking_id=tracking_id,
+                        device_fingerprint=state['device_fingerprint'])
+            elif state['session_key'] not in new_rows:
+                new_rows[state['session_key']] = self._new_row(state)
+
+        if not new_rows:
+            return attached
+
+        UserSession.objects.bulk_create(
+            list(new_rows.values()), ignore_conflicts=True)
+        # Primary keys are not returned when conflicts are ignored.
+        persisted = UserSession.objects.in_bulk(
+            list(new_rows), field_name='session_key')
+        for tracking_id, state in states.items():
+            row = persisted.get(state['session_key'])
+            if state.get('session_id') is None and row is not None:
+                state['session_id'] = row.pk
+                state['page_base'] = 0
+                state['persisted_key'] = row.session_key
+                attached.add(tracking_id)
+        return attached
+
+    def _update_rows(self, states, counters):
+        """
+        Write the aggregated counters and attributes of persisted sessions.
+
+        Returns:
+            set: Tracking IDs whose row took over a new Django session key.
+        """
+        rows = []
+        renamed = []
+        for tracking_id, state in states.items():
+            if state.get('session_id') is None:
+                continue
+            pages, seen_at = counters[tracking_id]
+            row = UserSession(
+                pk=state['session_id'],
+                session_key=state['session_key'],
+                last_seen_at=seen_at,
+                page_count=state.get('page_base', 0) + pages,
+                user_id=state['user_id'],
+                ip_address=state['ip'],
+                city=state['city'],
+                country=state['country'],
+                latitude=state['lat'],
+                longitude=state['lon'],
+            )
+            if state['session_key'] != state.get('persisted_key'):
+                renamed.append((tracking_id, state, row))
+            else:
+                rows.append(row)
+
+        taken_over = set()
+        if renamed:
+            # Only take over a new Django session key if no other row owns it.
+            taken = set(UserSession.objects.filter(
+                session_key__in=[s['session_key'] for _, s, _ in renamed]
+            ).values_list('session_key', flat=True))
+            renamed_rows = []
+            for tracking_id, state, row in renamed:
+                if state['session_key'] in taken:
+                    rows.append(row)
+                else:
+                    state['persisted_key'] = state['session_key']
+                    renamed_rows.append(row)
+                    taken_over.add(tracking_id)
+            if renamed_rows:
+                UserSession.objects.bulk_update(
+                    renamed_rows, SESSION_FIELDS + ['session_key'])
+
+        if rows:
+            UserSession.objects.bulk_update(rows, SESSION_FIELDS)
+        return taken_over
+
+    @staticmethod
+    def _new_state(data):
+        """Build the cached state for a session seen for the first time."""
+        return {
+            'session_id': None,
+            'session_key': data['session_key'],
+            'user_id': data['user_id'],
+            'ip': data['ip'],
+            'city': data['city'],
+            'country': data['country'],
+            'lat': data['lat'],
+            'lon': data['lon'],
+            'user_agent': data['user_agent'],
+            'tracking_id': data['tracking_id'],
+            'device_fingerprint': data['device_fingerprint'],
+            'started_at': data['seen_at'],
+        }
+
+    @staticmethod
+    def _merge(state, data):
+        """Apply changed request attributes to `state`; return True if modified."""
+        changed = False
+        if state['session_key'] != data['session_key']:
+            state['session_key'] = data['session_key']
+            changed = True
+        if data['user_id'] and not state['user_id']:
+            state['user_id'] = data['user_id']
+            changed = True
+        if not state['ip']:
+            state['ip'] = data['ip']
+            changed = True
+        if data['city'] and state['city'] != data['city']:
+            state['city'] = data['city']
+            state['country'] = data['country']
+            state['lat'] = data['lat']
+            state['lon'] = data['lon']
+            changed = True
+        return changed
+
+    @staticmethod
+    def _new_row(state):
+        """Build an unsaved `UserSession` from cached state."""
+        return UserSession(
+            session_key=state['session_key'],
+            user_id=state['user_id'],
+            ip_address=state['ip'],
+            city=state['city'],
+            country=state['country'],
+            latitude=state['lat'],
+            longitude=state['lon'],
+            user_agent=state['user_agent'],
+            page_count=1,
+            tracking_id=state['tracking_id'],
+            device_fingerprint=state['device_fingerprint'],
+        )
+
+
+def get_session_store():
+    """Return the process-wide session store."""
+    store = getattr(get_session_store, 'store', None)
+    if store is not None:
+        return store
+    with _store_lock:
+        store = getattr(get_session_store, 'store', None)
+        if store is None:
+            store = SessionStore(
+                cache_alias=getattr(
+                    settings, 'ANALYTICS_SESSION_CACHE_ALIAS', 'default'))
+            get_session_store.store = store
+    return store
@@ -4,11 +4,19 @@ Analytics test suite.
 This package contains all test cases for the analytics application,
 organized by model and functionality.
 """
-from .test_user_session import UserSessionModelTest
+from .test_user_session import UserSessionModelTest, UserSessionGeoIndexTest
 from .test_user_activity import UserActivityModelTest, UserActivityAPITest
+from .test_activity_writer import AnalyticsWriterTest
+from .test_session_store import SessionStoreTest
+from .test_geo_resolver import GeoResolverTest, GeoResolverReloadTest
 
 __all__ = [
     'UserSessionModelTest',
+    'UserSessionGeoIndexTest',
     'UserActivityModelTest',
     'UserActivityAPITest',
+    'AnalyticsWriterTest',
+    'SessionStoreTest',
+    'GeoResolverTest',
+    'GeoResolverReloadTest',
 ]
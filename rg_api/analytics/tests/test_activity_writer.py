@@ -0,0 +1,112 @@
+"""
+Test cases for the buffered analytics writer.
+
+This module verifies that queued session and activity events are persisted
+in batches, that page views are folded into a single session row, and that
+the bounded queue honours its drop policy.
+"""
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from ..models import UserActivity, UserSession
+from ..services import AnalyticsWriter, SessionStore
+
+
+def make_event(tracking_id='tid-1', session_key='key-1', path='/blog/posts'):
+    """Build an event shaped like the ones queued by the middleware."""
+    now = timezone.now()
+    return {
+        'session': {
+            'session_key': session_key,
+            'user_id': None,
+            'ip': '10.0.0.1',
+            'city': 'Rome',
+            'country': 'Italy',
+            'lat': 41.9,
+            'lon': 12.5,
+            'user_agent': 'TestAgent/1.0',
+            'tracking_id': tracking_id,
+            'device_fingerprint': 'fp',
+            'seen_at': now,
+        },
+        'activity': {
+            'user_id': None,
+            'action': f"GET {path}",
+            'path': path,
+            'method': 'GET',
+            'ip_address': '10.0.0.1',
+            'city': 'Rome',
+            'country': 'Italy',
+            'latitude': 41.9,
+            'longitude': 12.5,
+            'user_agent': 'TestAgent/1.0',
+            'payload': {},
+            'timestamp': now,
+        },
+    }
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class AnalyticsWriterTest(TestCase):
+    """
+    Test suite for AnalyticsWriter.
+
+    The writer is exercised without its background thread: events are queued
+    and then drained with `flush`, which runs the same batch write. As in the
+    middleware, each event is first recorded in the session store.
+    """
+
+    def setUp(self):
+        """Start every test with an empty session cache."""
+        cache.clear()
+        self.store = SessionStore()
+
+    def submit(self, writer, event):
+        """Touch the session of `event` and hand the event to `writer`."""
+        self.store.touch(event['session'])
+        return writer.submit(event)
+
+    def test_flush_writes_batch(self):
+        """Queued events for one visitor produce one session and N activities."""
+        writer = AnalyticsWriter(
+            batch_size=10, asynchronous=True, session_store=self.store)
+        writer._ensure_started = lambda: None  # keep the test single-threaded
+
+        for path in ('/blog/posts', '/portfolio/images', '/blog/pages'):
+            self.assertTrue(self.submit(writer, make_event(path=path)))
+        self.assertEqual(UserActivity.objects.count(), 0)
+
+        writer.flush()
+        self.assertEqual(UserSession.objects.get().page_count, 1)
+
+        writer.stop()
+
+        self.assertEqual(UserSession.objects.count(), 1)
+        session = UserSession.objects.get()
+        self.assertEqual(session.page_count, 3)
+        self.assertEqual(session.tracking_id, 'tid-1')
+        self.assertEqual(
+            UserActivity.objects.filter(session=session).count(), 3)
+
+    def test_existing_session_is_updated(self):
+        """A later batch bumps the active session instead of creating a new one."""
+        writer = AnalyticsWriter(asynchronous=False, session_store=self.store)
+        self.submit(writer, make_event())
+        self.submit(writer, make_event(session_key='key-2'))
+
+        session = UserSession.objects.get()
+        self.assertEqual(session.page_count, 2)
+        self.assertEqual(session.session_key, 'key-2')
+
+    def test_full_queue_drops_events(self):
+        """With the drop policy a full queue rejects events instead of blocking."""
+        writer = AnalyticsWriter(
+            max_queue_size=1, asynchronous=True, session_store=self.store)
+        writer._ensure_started = lambda: None
+
+        self.assertTrue(self.submit(writer, make_event()))
+        with self.assertLogs('analytics.services.activity_writer', 'WARNING'):
+            self.assertFalse(self.submit(writer, make_event()))
+        self.assertEqual(writer.dropped, 1)
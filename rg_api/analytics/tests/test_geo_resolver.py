@@ -0,0 +1,133 @@
+"""
+Test cases for the memoized GeoIP resolver.
+
+This module verifies that repeated lookups are answered from the memo, that
+unresolvable addresses are cached negatively, that the memo stays bounded,
+and that a replaced database file is picked up without a restart.
+The GeoIP2 reader is replaced by a stub so no real database is needed.
+"""
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from ..services import GeoResolver
+from ..services.geo_resolver import EMPTY_LOCATION
+
+
+class StubReader:
+    """Minimal stand-in for `geoip2.database.Reader`."""
+
+    def __init__(self, city='Rome'):
+        self.city_name = city
+        self.calls = 0
+
+    def city(self, ip):
+        """Resolve documentation addresses, reject everything else."""
+        self.calls += 1
+        if not ip.startswith('192.0.2.'):
+            raise ValueError(f"{ip} is not in the database")
+        return SimpleNamespace(
+            city=SimpleNamespace(name=self.city_name),
+            country=SimpleNamespace(name='Italy'),
+            location=SimpleNamespace(latitude=41.9, longitude=12.5),
+        )
+
+
+class GeoResolverTest(SimpleTestCase):
+    """Test suite for GeoResolver."""
+
+    def setUp(self):
+        """Build a resolver backed by a stub reader."""
+        self.stub = StubReader()
+        patcher = patch.object(
+            GeoResolver, '_open_reader', return_value=self.stub)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.resolver = GeoResolver(path='unused.mmdb', max_entries=2)
+
+    def test_repeat_lookup_is_memoized(self):
+        """The second lookup of an address does not query the reader."""
+        expected = ('Rome', 'Italy', 41.9, 12.5)
+        self.assertEqual(self.resolver.lookup('192.0.2.1'), expected)
+        self.assertEqual(self.resolver.lookup('192.0.2.1'), expected)
+        self.assertEqual(self.stub.calls, 1)
+        self.assertEqual(self.resolver.stats()['hits'], 1)
+        self.assertEqual(self.resolver.stats()['misses'], 1)
+
+    def test_unresolvable_ip_is_cached(self):
+        """Addresses the database cannot resolve are memoized as empty."""
+        self.assertEqual(self.resolver.lookup('10.0.0.1'), EMPTY_LOCATION)
+        self.assertEqual(self.resolver.lookup('10.0.0.1'), EMPTY_LOCATION)
+        self.assertEqual(self.stub.calls, 1)
+
+    def test_expired_entry_is_refreshed(self):
+        """Entries older than the TTL are resolved again."""
+        self.resolver.ttl = 0
+        self.resolver.lookup('192.0.2.1')
+        self.resolver.lookup('192.0.2.1')
+        self.assertEqual(self.stub.calls, 2)
+
+    def test_memo_is_bounded(self):
+        """The least recently used address is evicted first."""
+        for ip in ('192.0.2.1', '192.0.2.2', '192.0.2.1', '192.0.2.3'):
+            self.resolver.lookup(ip)
+        self.assertEqual(self.resolver.stats()['entries'], 2)
+        self.resolver.lookup('192.0.2.1')
+        self.assertEqual(self.stub.calls, 3)
+        self.resolver.lookup('192.0.2.2')
+        self.assertEqual(self.stub.calls, 4)
+
+
+class GeoResolverReloadTest(SimpleTestCase):
+    """Test suite for GeoResolver hot reload."""
+
+    def setUp(self):
+        """Create a database file to watch."""
+        handle, self.path = tempfile.mkstemp(suffix='.mmdb')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def replace_database(self):
+        """Atomically swap the watched file, as the update commands do."""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'wb') as file_obj:
+            file_obj.write(b'new database')
+        os.replace(temp_path, self.path)
+
+    def test_replaced_file_swaps_reader(self):
+        """A new file is opened and memoized results are dropped."""
+        readers = [StubReader('Rome'), StubReader('Milan')]
+        with patch.object(GeoResolver, '_open_reader', side_effect=readers):
+            resolver = GeoResolver(path=self.path, reload_interval=0.01)
+            self.assertEqual(resolver.lookup('192.0.2.1')[0], 'Rome')
+
+            self.replace_database()
+            resolver._next_check = 0.0  # don't wait for the interval
+
+            self.assertEqual(resolver.lookup('192.0.2.1')[0], 'Milan')
+            self.assertEqual(resolver.stats()['entries'], 1)
+
+    def test_unchanged_file_keeps_reader(self):
+        """The reader is not reopened while the file stays the same."""
+        with patch.object(
+                GeoResolver, '_open_reader', return_value=StubReader()) as opener:
+            resolver = GeoResolver(path=self.path, reload_interval=0.01)
+            resolver.lookup('192.0.2.1')
+            resolver._next_check = 0.0
+            resolver.lookup('192.0.2.2')
+            self.assertEqual(opener.call_count, 1)
+
+    def test_invalid_file_keeps_previous_reader(self):
+        """A replacement that cannot be opened leaves the old reader in place."""
+        with patch.object(
+                GeoResolver, '_open_reader', side_effect=[StubReader(), None]):
+            resolver = GeoResolver(path=self.path, reload_interval=0.01)
+            resolver.lookup('192.0.2.1')
+
+            self.replace_database()
+            resolver._next_check = 0.0
+
+            self.assertEqual(resolver.lookup('192.0.2.2')[0], 'Rome')
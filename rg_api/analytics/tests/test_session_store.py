@@ -0,0 +1,146 @@
+"""
+Test cases for the cache-resident session store.
+
+This module verifies that page views only touch the cache, that write-back
+persists aggregated counters with a single row per session, and that
+fingerprints map back to the active tracking ID.
+"""
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from ..models import UserSession
+from ..services import SessionStore
+
+
+def make_session(tracking_id='tid-1', session_key='key-1', city='Rome'):
+    """Build a session payload shaped like the one built by the middleware."""
+    return {
+        'session_key': session_key,
+        'user_id': None,
+        'ip': '10.0.0.1',
+        'city': city,
+        'country': 'Italy',
+        'lat': 41.9,
+        'lon': 12.5,
+        'user_agent': 'TestAgent/1.0',
+        'tracking_id': tracking_id,
+        'device_fingerprint': f"fp-{tracking_id}",
+        'seen_at': timezone.now(),
+    }
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class SessionStoreTest(TestCase):
+    """Test suite for SessionStore."""
+
+    def setUp(self):
+        """Start every test with an empty session cache."""
+        cache.clear()
+        self.store = SessionStore()
+
+    def test_touch_does_not_write(self):
+        """Page views are counted in the cache only."""
+        for _ in range(3):
+            pages = self.store.touch(make_session())
+        self.assertEqual(pages, 3)
+        self.assertEqual(UserSession.objects.count(), 0)
+
+    def test_concurrent_first_hit_is_counted(self):
+        """A new session keeps a view counted by a concurrent first hit."""
+        cache.set(SessionStore._key('tid-1', 'pages'), 1)
+        self.assertEqual(self.store.touch(make_session()), 2)
+
+    def test_write_back_persists_counters(self):
+        """Write-back creates one row per session with the aggregated count."""
+        for _ in range(3):
+            self.store.touch(make_session())
+        self.store.touch(make_session(tracking_id='tid-2', session_key='key-2'))
+
+        self.assertEqual(self.store.write_back(), 2)
+
+        session = UserSession.objects.get(tracking_id='tid-1')
+        self.assertEqual(session.page_count, 3)
+        self.assertEqual(
+            UserSession.objects.get(tracking_id='tid-2').page_count, 1)
+
+        # Later views update the same row without creating new ones.
+        self.store.touch(make_session(city='Milan'))
+        self.store.write_back()
+        session.refresh_from_db()
+        self.assertEqual(session.page_count, 4)
+        self.assertEqual(session.city, 'Milan')
+        self.assertEqual(UserSession.objects.count(), 2)
+
+    def test_failed_write_back_is_retried(self):
+        """Sessions stay pending when a write-back fails."""
+        for _ in range(2):
+            self.store.touch(make_session())
+        with patch.object(UserSession.objects, 'bulk_update',
+                          side_effect=DatabaseError('database down')):
+            with self.assertRaises(DatabaseError):
+                self.store.write_back()
+
+        self.assertEqual(self.store.write_back(), 1)
+        session = UserSession.objects.get(tracking_id='tid-1')
+        self.assertEqual(session.page_count, 2)
+
+    def test_write_back_without_activity(self):
+        """Nothing is written when no session was touched."""
+        self.assertEqual(self.store.write_back(), 0)
+
+    def test_resolve_creates_row_once(self):
+        """Resolving twice returns the same row for the same session."""
+        self.store.touch(make_session())
+        first = self.store.resolve(['tid-1'])
+        second = self.store.resolve(['tid-1'])
+        self.assertEqual(first, second)
+        self.assertEqual(UserSession.objects.count(), 1)
+
+    def test_resume_existing_row(self):
+        """A session still active in the database is resumed, not duplicated."""
+        UserSession.objects.create(
+            session_key='key-1', tracking_id='tid-1', page_count=5)
+        self.store.touch(make_session())
+        self.store.write_back()
+
+        session = UserSession.objects.get()
+        self.assertEqual(session.page_count, 6)
+
+    def test_recover_tracking_id(self):
+        """A fingerprint maps back to the tracking ID of its active session."""
+        self.store.touch(make_session())
+        self.assertEqual(self.store.recover_tracking_id('fp-tid-1'), 'tid-1')
+        self.assertIsNone(self.store.recover_tracking_id('unknown'))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYTICS_ASYNC_WRITES=False,
+)
+class SessionCacheOutageTest(TestCase):
+    """Test suite for the middleware when the session cache is down."""
+
+    def setUp(self):
+        """Keep the response cached by the request out of other tests."""
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @patch('analytics.middleware.analytics_middleware.get_session_store')
+    def test_cache_errors_skip_tracking(self, get_session_store):
+        """Requests are still answered; the view is just not tracked."""
+        store = get_session_store.return_value
+        store.touch.side_effect = ConnectionError('cache down')
+        store.recover_tracking_id.side_effect = ConnectionError('cache down')
+
+        with self.assertLogs(
+                'analytics.middleware.analytics_middleware', 'WARNING'):
+            response = self.client.get('/portfolio/galleries')
+
+        self.assertEqual(response.status_code, 200)
+        store.touch.assert_called_once()
+        self.assertEqual(UserSession.objects.count(), 0)
@@ -4,7 +4,11 @@ Test cases for the UserSession model.
 This module contains comprehensive tests for the UserSession model,
 including instance creation, string representation, and duration calculation.
 """
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
+from utils import geohash
 from ..models import UserSession
 
 
@@ -43,3 +47,70 @@ class UserSessionModelTest(TestCase):
         # Since started_at and last_seen_at are auto fields,
         # they might be virtually identical - just checking type or that it doesn't crash
         self.assertIsNotNone(self.session.duration)
+
+
+class UserSessionGeoIndexTest(TestCase):
+    """Test suite for the geohash index of UserSession (GeoIndexMixin)."""
+
+    def create(self, key, latitude, longitude):
+        """Create a session at the given coordinates."""
+        return UserSession.objects.create(
+            session_key=key, latitude=latitude, longitude=longitude)
+
+    def test_geohash_follows_writes(self):
+        """Saves, bulk writes and update() keep the geohash in sync."""
+        rome = self.create('rome', 41.9, 12.5)
+        self.assertEqual(rome.geohash, geohash.encode(41.9, 12.5))
+
+        created = UserSession.objects.bulk_create(
+            [UserSession(session_key='milan', latitude=45.46, longitude=9.19)])
+        self.assertEqual(created[0].geohash, geohash.encode(45.46, 9.19))
+
+        rome.latitude, rome.longitude = 48.85, 2.35
+        UserSession.objects.bulk_update([rome], ['latitude', 'longitude'])
+        rome.refresh_from_db()
+        self.assertEqual(rome.geohash, geohash.encode(48.85, 2.35))
+
+        UserSession.objects.filter(pk=rome.pk).update(
+            latitude=None, longitude=None)
+        rome.refresh_from_db()
+        self.assertEqual(rome.geohash, '')
+
+    def test_bbox_and_radius(self):
+        """Bounding box and radius lookups match the expected rows."""
+        self.create('rome', 41.9028, 12.4964)
+        self.create('tivoli', 41.9633, 12.7988)
+        self.create('milan', 45.4642, 9.19)
+        self.create('fiji', -17.7, 179.9)
+        self.create('samoa', -13.8, -171.8)
+
+        def keys(queryset):
+            return sorted(queryset.values_list('session_key', flat=True))
+
+        self.assertEqual(
+            keys(UserSession.objects.in_bbox(12, 41.5, 13, 42.5)),
+            ['rome', 'tivoli'])
+        # Across the antimeridian.
+        self.assertEqual(
+            keys(UserSession.objects.in_bbox(170, -20, -170, -10)),
+            ['fiji', 'samoa'])
+
+        near = UserSession.objects.within_radius(41.9028, 12.4964, 30)
+        self.assertEqual(keys(near), ['rome', 'tivoli'])
+        self.assertAlmostEqual(
+            near.get(session_key='tivoli').distance, 25.9, delta=1)
+        self.assertEqual(
+            keys(UserSession.objects.within_radius(41.9028, 12.4964, 10)),
+            ['rome'])
+
+    def test_backfill_command(self):
+        """The backfill command repairs geohashes written around the ORM."""
+        rome = self.create('rome', 41.9, 12.5)
+        UserSession.objects.filter(pk=rome.pk).update(geohash='')
+
+        call_command('backfill_geohashes', stdout=StringIO())
+
+        rome.refresh_from_db()
+        self.assertEqual(rome.geohash, geohash.encode(41.9, 12.5))
+        self.assertEqual(
+            list(UserSession.objects.geotagged()), [rome])
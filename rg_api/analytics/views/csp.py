@@ -3,48 +3,17 @@ Docstring for rg_api.analytics.views.csp
 """
 import json
 import logging
-from django.conf import settings
 from django.core.cache import cache
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from rg_api.permissions import get_client_ip
 
-try:
-    import geoip2.database
-    import geoip2.errors
-    GEOIP_LIB = geoip2
-except ImportError:
-    GEOIP_LIB = None
-
 from ..models import CSPReport
+from ..services import get_geo_resolver
 
 logger = logging.getLogger('django.security.csp')
 
 
-class GeoIPReaderCache:
-    """Utility class to cache the GeoIP reader instance."""
-    _reader = None
-
-    @classmethod
-    def get_reader(cls):
-        """Get the cached GeoIP reader instance, initializing it if necessary."""
-        if cls._reader is None and hasattr(settings, 'GEOIP_PATH'):
-            try:
-                cls._reader = geoip2.database.Reader(settings.GEOIP_PATH)
-            except (geoip2.errors.GeoIP2Error, OSError) as e:
-                logger.warning(
-                    "Failed to initialize GeoIP reader with path %s: %s",
-                    getattr(settings, 'GEOIP_PATH', None),
-                    e,
-                )
-        return cls._reader
-
-
-def get_geoip_reader():
-    """Helper function to get the GeoIP reader instance."""
-    return GeoIPReaderCache.get_reader()
-
-
 @csrf_exempt
 def csp_report(request):
     """
@@ -92,28 +61,12 @@ def csp_report(request):
                                    .replace('\r', '')) if ip_address is not None else ''
                 user_agent = request.META.get('HTTP_USER_AGENT', '')
 
-                # Resolve location
-                city = None
-                country = None
-                latitude = None
-                longitude = None
-
-                if ip_address and GEOIP_LIB:
-                    reader = get_geoip_reader()
-                    if reader:
-                        try:
-                            response = reader.city(ip_address)
-                            city = response.city.name
-                            country = response.country.name
-                            latitude = response.location.latitude
-                            longitude = response.location.longitude
-                        except (geoip2.errors.GeoIP2Error, OSError) as e:
-                            # Log debug info but continue saving the report
-                            safe_error_message = str(e).replace(
-                                '\n', '').replace('\r', '')
-                            logger.debug(
-                                "Could not resolve location for IP %s: %s",
-                                safe_ip_address, safe_error_message)
+                # Resolve location (shared memoized resolver)
+                city, country, latitude, longitude = \
+                    get_geo_resolver().lookup(ip_address)
+                if city is None and country is None:
+                    logger.debug(
+                        "Could not resolve location for IP %s", safe_ip_address)
 
                 # We use get_or_create to filter out identical reports that happen
                 # in the same context
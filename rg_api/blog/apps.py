@@ -10,3 +10,9 @@ class BlogConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        """
+        Connect the signal handlers.
+        """
+        from blog import signals  # pylint: disable=import-outside-toplevel,unused-import
@@ -0,0 +1,45 @@
+"""
+Blog signals.
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from blog.models import Category, Page, Post
+from utils.response_cache import (
+    instance_tags, invalidate_on_commit, model_tag, remember_lookups)
+
+# Lookup fields of the cached detail endpoints, per model.
+CACHE_LOOKUPS = {
+    Category: ('pk',),
+    Page: ('tag',),
+    Post: ('pk',),
+}
+
+
+@receiver(pre_save, sender=Page)
+def remember_cache_lookups(sender, instance, **_kwargs):
+    """Record lookup values a save may change, to purge their cached details."""
+    remember_lookups(instance, CACHE_LOOKUPS[sender])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_cached_responses(sender, instance, **_kwargs):
+    """Purge the cached list and detail responses of a changed instance."""
+    # Tags are taken now: a deleted instance loses its pk before the commit.
+    invalidate_on_commit(*instance_tags(instance, CACHE_LOOKUPS[sender]))
+
+
+@receiver(m2m_changed, sender=Post.categories.through)
+def invalidate_cached_categories(instance, action, **_kwargs):
+    """Purge cached posts and categories when a post's categories change."""
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Post):
+        invalidate_on_commit(*instance_tags(instance, CACHE_LOOKUPS[Post]))
+    else:
+        invalidate_on_commit(model_tag(Post))
+    invalidate_on_commit(model_tag(Category))
@@ -10,7 +10,8 @@ from blog.models import Category, Post
 
 
 @override_settings(
-    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYTICS_ASYNC_WRITES=False,
 )
 class BlogAPITest(APITestCase):
     """
@@ -60,3 +61,13 @@ class BlogAPITest(APITestCase):
 
         self.assertEqual(len(data), 1)
         self.assertEqual(data[0]['name'], 'API Category')
+
+    def test_list_posts_with_cursor(self):
+        """
+        Test keyset pagination of posts.
+        """
+        response = self.client.get('/blog/posts?cursor=')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(response.data['results'][0]['title'], 'API Post')
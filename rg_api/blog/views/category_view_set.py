@@ -2,15 +2,13 @@
 Category view set.
 """
 from django.db.models import Count
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from rest_framework import viewsets, permissions
-from blog.models import Category
+from blog.models import Category, Post
 from blog.serializers import CategorySerializer
+from utils.viewset_decorators import cached_viewset
 
 
-@method_decorator(cache_page(60 * 60 * 2), name='list')
-@method_decorator(cache_page(60 * 60 * 24), name='retrieve')
+@cached_viewset(depends_on=[Post])
 class CategoryViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
@@ -1,15 +1,13 @@
 """
 Page view set.
 """
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from rest_framework import viewsets, permissions
 from blog.models import Page
 from blog.serializers import PageSerializer
+from utils.viewset_decorators import cached_viewset
 
 
-@method_decorator(cache_page(60 * 60 * 2), name='list')
-@method_decorator(cache_page(60 * 60 * 24), name='retrieve')
+@cached_viewset()
 class PageViewSet(viewsets.ModelViewSet):
     """
     Page view set.
@@ -2,9 +2,11 @@
 Gallery Admin Module.
 """
 from django.contrib import admin
-from ..models import Gallery, ImageGallery
+from ..models import Gallery, ImageGallery, ProcessingJob
 from .gallery import GalleryAdmin
 from .image_gallery import ImageGalleryAdmin
+from .processing_job import ProcessingJobAdmin
 
 admin.site.register(Gallery, GalleryAdmin)
 admin.site.register(ImageGallery, ImageGalleryAdmin)
+admin.site.register(ProcessingJob, ProcessingJobAdmin)
@@ -7,19 +7,30 @@ from typing import Tuple, List
 from PIL import Image as PilImage, UnidentifiedImageError
 
 from django.contrib import admin, messages
+from django.db.models import Count, Q
 from django.http import JsonResponse
 from django.shortcuts import redirect, render
-from django.urls import path
+from django.urls import path, reverse
+from django.utils.html import format_html
 
-from gallery.exif_utils import get_gps_data
-from gallery.ml import classify_image
-from ..models import Gallery, ImageGallery
+from gallery.jobs import enqueue_jobs
+from utils.admin_filters import GeotaggedListFilter
+from ..models import Gallery, ImageGallery, ProcessingJob
 from .forms import ImageGalleryForm, BulkUploadForm
 from .constants import ALLOWED_IMAGE_EXTENSIONS
 
 
+# Work queued for every new or re-uploaded image (see gallery.jobs).
+UPLOAD_JOBS = [ProcessingJob.Kind.GPS, ProcessingJob.Kind.TAG]
+
+
 class ImageGalleryAdmin(admin.ModelAdmin):
-    """Admin interface for ImageGallery model with advanced features."""
+    """
+    Admin interface for ImageGallery model with advanced features.
+
+    GPS extraction and auto-tagging are queued as `ProcessingJob` rows rather
+    than run in the request; the ``processing`` column shows their progress.
+    """
     form = ImageGalleryForm
     fields = [
         ('title', 'slug'),
@@ -37,12 +48,12 @@ class ImageGalleryAdmin(admin.ModelAdmin):
         'title', 'slug', 'gallery', 'image_tag', 'author',
         'width', 'height', 'camera_model', 'lens_model',
         'iso_speed', 'aperture_f_number', 'shutter_speed',
-        'tag_list', 'created_at', 'updated_at',
+        'tag_list', 'processing', 'created_at', 'updated_at',
     )
-    list_filter = ('gallery__title', 'created_at')
+    list_filter = ('gallery__title', 'created_at', GeotaggedListFilter)
     readonly_fields = ['image_tag', 'width',
                        'height', 'created_at', 'updated_at']
-    search_fields = ('title', 'gallery__title', 'tags__name')
+    search_fields = ('title', 'gallery__title', 'tag_names')
     save_on_top = True
     list_display_links = ('title',)
     list_per_page = 12
@@ -66,92 +77,56 @@ class ImageGalleryAdmin(admin.ModelAdmin):
 
     def tag_list(self, obj) -> str:
         """Display up to 3 tags with count of remaining."""
-        tags = list(obj.tags.all()[:4])
+        tags = obj.tag_names
         if len(tags) > 3:
-            remaining = obj.tags.count() - 3
-            return f"{', '.join(t.name for t in tags[:3])} (+{remaining})"
-        return ", ".join(t.name for t in tags)
+            return f"{', '.join(tags[:3])} (+{len(tags) - 3})"
+        return ", ".join(tags)
     tag_list.short_description = 'Tags'
 
-    @admin.action(description='Auto-tag selected images')
-    def auto_tag_images(self, request, queryset):
-        """Automatically tag images using ML classifier."""
-        count = 0
-        updated = 0
+    def get_queryset(self, request):
+        """Count the unfinished and failed jobs of each image."""
+        active = [ProcessingJob.Status.PENDING, ProcessingJob.Status.RUNNING]
+        return super().get_queryset(request).annotate(
+            jobs_active=Count('jobs', filter=Q(jobs__status__in=active)),
+            jobs_failed=Count(
+                'jobs', filter=Q(jobs__status=ProcessingJob.Status.FAILED)),
+        )
 
-        for obj in queryset:
-            if not obj.image:
-                continue
+    def processing(self, obj) -> str:
+        """Link to the jobs of the image that are queued, running or failed."""
+        states = []
+        if obj.jobs_active:
+            states.append(f"{obj.jobs_active} queued")
+        if obj.jobs_failed:
+            states.append(f"{obj.jobs_failed} failed")
+        if not states:
+            return "-"
+        url = reverse('admin:gallery_processingjob_changelist')
+        return format_html(
+            '<a href="{}?image__id__exact={}">{}</a>',
+            url, obj.pk, ", ".join(states))
+    processing.short_description = 'Jobs'
 
-            try:
-                new_tags = classify_image(obj.image.path)
-                if new_tags:
-                    obj.tags.add(*new_tags)
-                    updated += 1
-                count += 1
-            except (OSError, ValueError) as e:
-                self.message_user(
-                    request,
-                    f"Error processing {obj.title}: {e}",
-                    messages.WARNING,
-                )
-
-        if updated > 0:
-            self.message_user(
-                request,
-                f"Successfully analyzed {count} images and tagged {updated}.",
-                messages.SUCCESS,
-            )
-        else:
-            self.message_user(
-                request,
-                "No tags added. Check logs or image paths.",
-                messages.WARNING,
-            )
+    @admin.action(description='Auto-tag selected images')
+    def auto_tag_images(self, request, queryset):
+        """Queue the selected images for the ML tagger."""
+        ids = list(queryset.exclude(image='').values_list('pk', flat=True))
+        queued = enqueue_jobs(ids, [ProcessingJob.Kind.TAG])
+        self.message_user(
+            request,
+            f"Queued {queued} images for auto-tagging.",
+            messages.SUCCESS if queued else messages.WARNING,
+        )
 
     def save_related(self, request, form, formsets, change):
-        """Extract GPS and auto-tag on save."""
+        """Queue GPS extraction, and auto-tagging if the image has no tags."""
         super().save_related(request, form, formsets, change)
         obj = form.instance
 
         if not obj.image:
             return
 
-        self._extract_gps_data(obj)
-        self._auto_tag_if_empty(obj)
-
-    def _extract_gps_data(self, obj) -> None:
-        """Extract GPS data from image EXIF."""
-        try:
-            lat, lon, alt = get_gps_data(obj.image.path)
-            updated = False
-
-            if lat is not None:
-                obj.latitude = lat
-                updated = True
-            if lon is not None:
-                obj.longitude = lon
-                updated = True
-            if alt is not None:
-                obj.altitude = alt
-                updated = True
-
-            if updated:
-                obj.save()
-        except (OSError, ValueError) as e:
-            print(f"GPS extraction error: {e}")
-
-    def _auto_tag_if_empty(self, obj) -> None:
-        """Auto-tag image if no tags exist."""
-        if obj.tags.exists():
-            return
-
-        try:
-            new_tags = classify_image(obj.image.path)
-            if new_tags:
-                obj.tags.add(*new_tags)
-        except (OSError, ValueError) as e:
-            print(f"Auto-tag error: {e}")
+        enqueue_jobs([obj.pk], UPLOAD_JOBS, {'only_if_untagged': True})
 
     def get_form(self, request, obj=None, change=False, **kwargs):
         """Set default gallery and author."""
@@ -211,6 +186,7 @@ class ImageGalleryAdmin(admin.ModelAdmin):
                 'skipped': skipped,
                 'details': "; ".join(details),
                 'message': f'Uploaded {created} images.',
+                'queued': len(UPLOAD_JOBS) * created,
             })
 
         messages.success(
@@ -229,6 +205,7 @@ class ImageGalleryAdmin(admin.ModelAdmin):
         created = 0
         skipped = 0
         details_list = []
+        created_ids = []
 
         for upload in uploads:
             base_name = os.path.basename(upload.name)
@@ -260,56 +237,10 @@ class ImageGalleryAdmin(admin.ModelAdmin):
                 image=upload,
             )
             image.save()
-
-            details = self._process_single_upload(image, title)
-            image.save()
-
-            details_list.append(" | ".join(details))
+            created_ids.append(image.pk)
+            details_list.append("GPS & tags queued")
             created += 1
 
+        # Tagging takes seconds per image: leave it to the job worker.
+        enqueue_jobs(created_ids, UPLOAD_JOBS)
         return created, skipped, details_list
-
-    def _process_single_upload(self, image, title) -> List[str]:
-        """Process single image upload (GPS, tags)."""
-        details = []
-
-        self._extract_upload_gps(image, title, details)
-        self._classify_upload_image(image, title, details)
-
-        return details
-
-    def _extract_upload_gps(
-        self,
-        image,
-        title: str,
-        details: List[str],
-    ) -> None:
-        """Extract GPS from uploaded image."""
-        try:
-            lat, lon, alt = get_gps_data(image.image.path)
-            if lat is not None:
-                image.latitude = lat
-            if lon is not None:
-                image.longitude = lon
-            if alt is not None:
-                image.altitude = alt
-            if any([lat, lon, alt]):
-                details.append("GPS found")
-        except (OSError, ValueError) as e:
-            print(f"GPS extraction error for {title}: {e}")
-
-    def _classify_upload_image(
-        self,
-        image,
-        title: str,
-        details: List[str],
-    ) -> None:
-        """Auto-tag uploaded image."""
-        try:
-            print(f"Auto-tagging image: {title}")
-            new_tags = classify_image(image.image.path)
-            if new_tags:
-                image.tags.add(*new_tags)
-                details.append(f"Tags: {len(new_tags)}")
-        except (OSError, ValueError) as e:
-            print(f"Auto-tag error for {title}: {e}")
@@ -0,0 +1,45 @@
+"""
+ProcessingJob Admin Configuration.
+"""
+from django.contrib import admin, messages
+
+from ..models import ProcessingJob
+
+
+class ProcessingJobAdmin(admin.ModelAdmin):
+    """
+    Read-only view of the background image jobs.
+
+    Jobs are created by the image admin and run by ``run_image_jobs``; failed
+    ones can be queued again from here.
+    """
+    list_display = (
+        'id', 'image', 'kind', 'status', 'attempts', 'worker',
+        'created_at', 'started_at', 'finished_at', 'short_error',
+    )
+    list_filter = ('status', 'kind')
+    list_select_related = ('image',)
+    search_fields = ('image__title', 'error')
+    readonly_fields = [
+        field.name for field in ProcessingJob._meta.fields if field.name != 'id']
+    list_per_page = 50
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        """Jobs are only created by the application."""
+        return False
+
+    def short_error(self, obj) -> str:
+        """First line of the last error, truncated."""
+        line = obj.error.splitlines()[0] if obj.error else ''
+        return line[:80] + ('...' if len(line) > 80 else '')
+    short_error.short_description = 'Error'
+
+    @admin.action(description='Retry selected failed jobs')
+    def retry_jobs(self, request, queryset):
+        """Queue failed jobs again with a fresh attempt budget."""
+        retried = queryset.filter(status=ProcessingJob.Status.FAILED).update(
+            status=ProcessingJob.Status.PENDING, attempts=0,
+            finished_at=None)
+        self.message_user(
+            request, f"Queued {retried} jobs again.", messages.SUCCESS)
@@ -4,7 +4,7 @@ Gallery app configuration.
 import sys
 import threading
 from django.apps import AppConfig
-from gallery.ml import get_model
+from django.conf import settings
 
 
 class GalleryConfig(AppConfig):
@@ -18,6 +18,7 @@ class GalleryConfig(AppConfig):
         """
         Run when the app is ready.
         """
+        from gallery import signals  # pylint: disable=import-outside-toplevel,unused-import
 
         # Heuristic to detect if we are running a server (runserver, daphne, etc.)
         # and avoid loading the model during management commands like migrate.
@@ -28,14 +29,23 @@ class GalleryConfig(AppConfig):
         is_management = 'migrate' in sys.argv or \
                         'makemigrations' in sys.argv or \
                         'collectstatic' in sys.argv or \
-                        'test' in sys.argv
+                        'test' in sys.argv or \
+                        'run_ml_server' in sys.argv
 
-        if is_server_cmd or not is_management:
+        # With a model server the model lives in run_ml_server alone (which
+        # loads it itself), and with ML disabled there is nothing to warm
+        # (nor torch to import).
+        uses_model = getattr(settings, 'ENABLE_ML_MODELS', False) and \
+            not getattr(settings, 'ML_SERVER_SOCKET', '')
+
+        if (is_server_cmd or not is_management) and uses_model:
             self._start_model_warmup()
 
     def _start_model_warmup(self):
         """Start the model warmup in a separate thread."""
         def warmup_model():
+            from gallery.ml import get_model  # pylint: disable=import-outside-toplevel
+
             print("--- Starting Background Model Warmup ---")
             try:
                 get_model()
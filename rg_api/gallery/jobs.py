@@ -0,0 +1,248 @@
+"""
+Persistent queue of background image work.
+
+Auto-tagging, GPS extraction and preview rendering are slow (the tagger alone
+takes seconds per image), so the admin and the model only record them as
+`ProcessingJob` rows and return. A ``run_image_jobs`` worker claims pending
+jobs, runs them and records the outcome, so progress is visible in the admin
+and work survives restarts.
+
+Claiming is a conditional ``UPDATE ... WHERE status = 'pending'``: two workers
+racing for the same rows each only get the ones their own update changed, on
+every database backend. Jobs left running by a worker that died are put back
+after ``GALLERY_JOB_TIMEOUT`` seconds. A failing job is retried until it has
+been attempted ``GALLERY_JOB_MAX_ATTEMPTS`` times.
+
+With ``GALLERY_JOB_QUEUE`` disabled the jobs are run inline instead, in the
+calling process, and no rows are written.
+"""
+import logging
+import os
+import socket
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from gallery.exif_utils import get_gps_data
+from gallery.ml import classify_images
+from gallery.models import ProcessingJob
+from gallery.previews import generate_previews
+
+logger = logging.getLogger(__name__)
+
+Kind = ProcessingJob.Kind
+Status = ProcessingJob.Status
+
+
+def queue_enabled():
+    """Whether jobs are queued for a worker rather than run inline."""
+    return getattr(settings, 'GALLERY_JOB_QUEUE', True)
+
+
+def worker_name():
+    """Identity recorded on the jobs claimed by this process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_jobs(image_ids, kinds, payload=None):
+    """
+    Queue `kinds` of work for every image in `image_ids`.
+
+    An image that already has a pending job of a kind does not get another.
+
+    Args:
+        image_ids (Iterable[int]): Primary keys of the images.
+        kinds (Iterable[str]): `ProcessingJob.Kind` values.
+        payload (dict | None): Options stored on every job.
+
+    Returns:
+        int: Number of jobs queued (or run, when the queue is disabled).
+    """
+    image_ids = list(dict.fromkeys(image_ids))
+    kinds = list(kinds)
+    if not image_ids or not kinds:
+        return 0
+
+    if not queue_enabled():
+        jobs = [ProcessingJob(image_id=pk, kind=kind, payload=payload or {})
+                for pk in image_ids for kind in kinds]
+        run_jobs(jobs, record=False)
+        return len(jobs)
+
+    pending = set(ProcessingJob.objects.filter(
+        image_id__in=image_ids, kind__in=kinds, status=Status.PENDING,
+    ).values_list('image_id', 'kind'))
+    jobs = ProcessingJob.objects.bulk_create([
+        ProcessingJob(image_id=pk, kind=kind, payload=payload or {})
+        for pk in image_ids for kind in kinds
+        if (pk, kind) not in pending
+    ])
+    return len(jobs)
+
+
+def claim_jobs(worker, limit):
+    """
+    Mark up to `limit` of the oldest pending jobs as running for `worker`.
+
+    Returns:
+        list[ProcessingJob]: The jobs claimed, with their image.
+    """
+    candidates = list(ProcessingJob.objects.filter(
+        status=Status.PENDING,
+    ).order_by('created_at', 'id').values_list('id', flat=True)[:limit])
+    if not candidates:
+        return []
+
+    started_at = timezone.now()
+    ProcessingJob.objects.filter(
+        pk__in=candidates, status=Status.PENDING,
+    ).update(status=Status.RUNNING, worker=worker, started_at=started_at,
+             finished_at=None, attempts=F('attempts') + 1)
+    return list(ProcessingJob.objects.filter(
+        pk__in=candidates, status=Status.RUNNING, worker=worker,
+        started_at=started_at,
+    ).select_related('image'))
+
+
+def requeue_stale_jobs(timeout=None):
+    """
+    Put back jobs left running for longer than `timeout` seconds.
+
+    Jobs out of attempts are failed instead.
+
+    Returns:
+        int: Number of jobs requeued or failed.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'GALLERY_JOB_TIMEOUT', 600)
+    stale = ProcessingJob.objects.filter(
+        status=Status.RUNNING,
+        started_at__lt=timezone.now() - timedelta(seconds=timeout))
+    max_attempts = getattr(settings, 'GALLERY_JOB_MAX_ATTEMPTS', 3)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=Status.FAILED, finished_at=timezone.now(),
+        error='Worker timed out.')
+    return failed + stale.update(
+        status=Status.PENDING, error='Worker timed out.')
+
+
+def run_jobs(jobs, record=True):
+    """
+    Run claimed `jobs`, grouped by kind, and record their outcome.
+
+    Args:
+        jobs (list[ProcessingJob]): Jobs to run.
+        record (bool): Save the outcome (False for unsaved inline jobs).
+
+    Returns:
+        dict[str, int]: Number of jobs per final status.
+    """
+    by_kind = defaultdict(list)
+    for job in jobs:
+        by_kind[job.kind].append(job)
+
+    errors = {}
+    for kind, group in by_kind.items():
+        try:
+            errors.update(HANDLERS[kind](group))
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception("%s jobs failed", kind)
+            errors.update({id(job): str(e) or type(e).__name__ for job in group})
+
+    counts = defaultdict(int)
+    max_attempts = getattr(settings, 'GALLERY_JOB_MAX_ATTEMPTS', 3)
+    finished_at = timezone.now()
+    for job in jobs:
+        error = errors.get(id(job))
+        job.error = error or ''
+        if error is None:
+            job.status = Status.DONE
+        elif job.attempts < max_attempts and record:
+            job.status = Status.PENDING
+        else:
+            job.status = Status.FAILED
+        if error is not None and not record:
+            logger.error("%s of image %s failed: %s",
+                         job.kind, job.image_id, error)
+        job.finished_at = None if job.status == Status.PENDING else finished_at
+        counts[job.status] += 1
+
+    if record:
+        ProcessingJob.objects.bulk_update(
+            jobs, ['status', 'error', 'finished_at'])
+    return dict(counts)
+
+
+def _source_path(job):
+    """Path of the image file of `job`, or None if it is missing."""
+    image = job.image
+    if not image.image or not os.path.exists(image.image.path):
+        return None
+    return image.image.path
+
+
+def _tag(jobs):
+    """Caption the images in batches and add the resulting tags."""
+    errors = {}
+    todo = []
+    for job in jobs:
+        if job.payload.get('only_if_untagged') and job.image.tag_names:
+            continue
+        path = _source_path(job)
+        if path is None:
+            errors[id(job)] = 'Image file not found.'
+        else:
+            todo.append((job, path))
+
+    results = classify_images([path for _, path in todo])
+    for (job, _), tags in zip(todo, results):
+        if tags:
+            job.image.tags.add(*tags)
+    return errors
+
+
+def _gps(jobs):
+    """Copy the EXIF GPS position of each image onto it."""
+    errors = {}
+    for job in jobs:
+        path = _source_path(job)
+        if path is None:
+            errors[id(job)] = 'Image file not found.'
+            continue
+        try:
+            lat, lon, alt = get_gps_data(path)
+        except (OSError, ValueError) as e:
+            errors[id(job)] = str(e)
+            continue
+
+        image = job.image
+        position = {'latitude': lat, 'longitude': lon, 'altitude': alt}
+        position = {field: value for field, value in position.items()
+                    if value is not None}
+        if position:
+            for field, value in position.items():
+                setattr(image, field, value)
+            image.save()
+    return errors
+
+
+def _previews(jobs):
+    """Render the preview ladder of each image."""
+    errors = {}
+    for job in jobs:
+        try:
+            generate_previews(job.image_id, force=job.payload.get('force', False))
+        except (OSError, ValueError) as e:
+            errors[id(job)] = str(e)
+    return errors
+
+
+HANDLERS = {
+    Kind.TAG: _tag,
+    Kind.GPS: _gps,
+    Kind.PREVIEWS: _previews,
+}
+
@@ -0,0 +1,318 @@
+"""
+Precomputed payload of the image map endpoint.
+
+The locations of every geotagged image are kept in the default cache as one
+snapshot: the serialized rows keyed by image pk, and the rendered bodies
+(a JSON array for the map client and a GeoJSON FeatureCollection), each
+stored both plain and gzip-compressed with its ETag. A request is therefore a
+single cache read; the snapshot is only built from the database when it is
+missing.
+
+Saving or deleting an image patches its row in the snapshot (see
+``gallery.signals``) instead of rebuilding it. Writers serialize on a cache
+lock; a build holds the same lock while it reads the database, so a change
+committed during a build is applied on top of it rather than lost, and
+requests missing the snapshot meanwhile wait for that build instead of
+repeating it.
+
+For a map viewport (bounding box and zoom level) `clusters` aggregates the
+images in the database by geohash cell instead, with the cell size picked
+from the zoom and capped by ``GALLERY_MAP_MAX_CLUSTERS``, so the payload stays
+bounded however many images there are. The viewport is matched with
+`GeoQuerySet.in_bbox`, which narrows the scan on the geohash index.
+"""
+import gzip
+import hashlib
+import logging
+import math
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Substr
+from django.http import HttpResponse
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers)
+from rest_framework.renderers import JSONRenderer
+
+from gallery.models import ImageGallery
+from gallery.serializers import ImageLocationSerializer
+from utils import geohash
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'gallery:locations:snapshot'
+LOCK_KEY = 'gallery:locations:lock'
+LOCK_TIMEOUT = 30
+
+# How long an update waits for a concurrent writer before dropping the
+# snapshot (the next request then rebuilds it), and a request for the
+# snapshot being built by another process.
+LOCK_WAIT = 5.0
+LOCK_POLL = 0.05
+
+# Bodies smaller than this are not worth compressing.
+GZIP_MIN_LENGTH = 200
+
+_GZIP_RE = re.compile(r'\bgzip\b')
+
+
+def geotagged_images():
+    """Images shown on the map: with coordinates, excluding (0, 0)."""
+    return ImageGallery.objects.geotagged()
+
+
+def is_geotagged(image):
+    """Whether `image` belongs on the map (same rule as `geotagged_images`)."""
+    return image.latitude is not None and image.longitude is not None and \
+        not (image.latitude == 0 and image.longitude == 0)
+
+
+def _row(image):
+    """Serialized map entry of `image`."""
+    return dict(ImageLocationSerializer(image).data)
+
+
+def _feature(row):
+    """GeoJSON Point feature of a serialized row."""
+    return {
+        'type': 'Feature',
+        'id': row['id'],
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [row['longitude'], row['latitude']],
+        },
+        'properties': {key: value for key, value in row.items()
+                       if key not in ('latitude', 'longitude')},
+    }
+
+
+def _encode(data):
+    """Render `data` once, plain and gzipped, with an ETag per encoding."""
+    body = JSONRenderer().render(data)
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    encoded = {'identity': (body, f'"{digest}"')}
+    if len(body) >= GZIP_MIN_LENGTH:
+        # mtime=0 keeps the compressed bytes (and their ETag) reproducible.
+        encoded['gzip'] = (gzip.compress(body, mtime=0), f'"{digest}-gzip"')
+    return encoded
+
+
+def _snapshot(rows):
+    """Build the cached snapshot from the serialized rows."""
+    ordered = [rows[pk] for pk in sorted(rows)]
+    return {
+        'rows': rows,
+        'json': _encode(ordered),
+        'geojson': _encode({
+            'type': 'FeatureCollection',
+            'features': [_feature(row) for row in ordered],
+        }),
+    }
+
+
+def _acquire(wait):
+    """
+    Take the writer lock, polling for at most `wait` seconds.
+
+    Returns:
+        str | None: The token identifying this holder, or None if the lock
+        is still taken.
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while not cache.add(LOCK_KEY, token, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(LOCK_POLL)
+    return token
+
+
+def _release(token):
+    """
+    Release the writer lock if `token` still holds it.
+
+    A holder that outlived ``LOCK_TIMEOUT`` must not delete the lock another
+    writer has taken since.
+    """
+    if cache.get(LOCK_KEY) == token:
+        cache.delete(LOCK_KEY)
+
+
+def build_snapshot(wait=LOCK_WAIT):
+    """
+    Rebuild the snapshot from the database and store it.
+
+    Only the holder of the writer lock builds: concurrent callers poll for
+    up to `wait` seconds for the snapshot it stores instead of running the
+    same query, and build an unstored one only if it does not appear.
+    """
+    deadline = time.monotonic() + wait
+    token = _acquire(0)
+    while token is None:
+        snapshot = cache.get(SNAPSHOT_KEY)
+        if snapshot is not None:
+            return snapshot
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(LOCK_POLL)
+        token = _acquire(0)
+    try:
+        images = geotagged_images().only(
+            'id', 'title', 'latitude', 'longitude', 'slug')
+        snapshot = _snapshot({image.pk: _row(image) for image in images})
+        if token is not None:
+            # Without the lock a concurrent update may be missing from the
+            # rows read above; serve them but let the lock holder store.
+            cache.set(SNAPSHOT_KEY, snapshot, None)
+        return snapshot
+    finally:
+        if token is not None:
+            _release(token)
+
+
+def get_snapshot():
+    """Return the cached snapshot, building it if missing."""
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        snapshot = build_snapshot()
+    return snapshot
+
+
+def _patch(pk, row):
+    """Replace (or with `row` None, drop) the entry of image `pk`."""
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None or snapshot['rows'].get(pk) == row:
+        # Nothing cached yet, or nothing the map shows has changed.
+        return
+
+    token = _acquire(LOCK_WAIT)
+    if token is None:
+        logger.warning("Location snapshot busy; dropping it for a rebuild.")
+        cache.delete(SNAPSHOT_KEY)
+        return
+    try:
+        snapshot = cache.get(SNAPSHOT_KEY)
+        if snapshot is None:
+            return
+        rows = dict(snapshot['rows'])
+        if row is None:
+            rows.pop(pk, None)
+        else:
+            rows[pk] = row
+        cache.set(SNAPSHOT_KEY, _snapshot(rows), None)
+    finally:
+        _release(token)
+
+
+def update_location(image):
+    """Apply a saved image to the snapshot."""
+    _patch(image.pk, _row(image) if is_geotagged(image) else None)
+
+
+def remove_location(pk):
+    """Drop a deleted image from the snapshot."""
+    _patch(pk, None)
+
+
+def locations_response(request, variant='json'):
+    """
+    Serve the `variant` ('json' or 'geojson') body of the snapshot.
+
+    Clients accepting gzip get the precompressed body. ``If-None-Match``
+    matches get a 304.
+    """
+    encoded = get_snapshot()[variant]
+    encoding = 'identity'
+    if 'gzip' in encoded and \
+            _GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        encoding = 'gzip'
+    body, etag = encoded[encoding]
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content_type = 'application/geo+json' if variant == 'geojson' \
+            else 'application/json'
+        response = HttpResponse(body, content_type=content_type)
+        if encoding == 'gzip':
+            response['Content-Encoding'] = 'gzip'
+
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    patch_cache_control(
+        response, public=True,
+        max_age=getattr(settings, 'GALLERY_LOCATIONS_MAX_AGE', 300))
+    return response
+
+
+def cluster_precision(bbox, zoom):
+    """
+    Geohash precision of the clusters shown for a viewport.
+
+    Cells are about a quarter of a 256px map tile wide at `zoom`; coarser
+    cells are used if the viewport would hold more than
+    ``GALLERY_MAP_MAX_CLUSTERS`` of them.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    target_width = 360.0 / 2 ** zoom / 4
+    precision = 1
+    while precision < geohash.MAX_PRECISION and \
+            geohash.cell_size(precision + 1)[1] >= target_width:
+        precision += 1
+
+    lat_span = max_lat - min_lat
+    lon_span = max_lon - min_lon if min_lon <= max_lon \
+        else 360.0 - (min_lon - max_lon)
+    limit = getattr(settings, 'GALLERY_MAP_MAX_CLUSTERS', 500)
+    while precision > 1:
+        height, width = geohash.cell_size(precision)
+        cells = (math.ceil(lat_span / height) + 1) * \
+            (math.ceil(lon_span / width) + 1)
+        if cells <= limit:
+            break
+        precision -= 1
+    return precision
+
+
+def clusters(bbox, zoom):
+    """
+    Aggregate the geotagged images inside `bbox` by geohash cell.
+
+    Args:
+        bbox: (min_lon, min_lat, max_lon, max_lat) in degrees.
+        zoom: Map zoom level.
+
+    Returns:
+        list[dict]: One entry per non-empty cell with its image count,
+        centroid and bounds; single-image cells also carry their image
+        (see `ImageLocationClusterSerializer`).
+    """
+    precision = cluster_precision(bbox, zoom)
+    cells = list(
+        geotagged_images().in_bbox(*bbox)
+        .annotate(cell=Substr('geohash', 1, precision))
+        .values('cell')
+        .annotate(
+            count=Count('id'),
+            center_lat=Avg('latitude'), center_lon=Avg('longitude'),
+            min_lat=Min('latitude'), min_lon=Min('longitude'),
+            max_lat=Max('latitude'), max_lon=Max('longitude'),
+            first_id=Min('id'))
+        .order_by('cell'))
+
+    single = [cell['first_id'] for cell in cells if cell['count'] == 1]
+    pins = {image.pk: image for image in ImageGallery.objects.filter(
+        pk__in=single).only('id', 'title', 'latitude', 'longitude', 'slug')}
+
+    return [{
+        'geohash': cell['cell'],
+        'count': cell['count'],
+        'latitude': cell['center_lat'],
+        'longitude': cell['center_lon'],
+        'bounds': [cell['min_lon'], cell['min_lat'],
+                   cell['max_lon'], cell['max_lat']],
+        'image': pins.get(cell['first_id']) if cell['count'] == 1 else None,
+    } for cell in cells]
@@ -2,14 +2,23 @@
 Management command to auto-tag images using ML.
 """
 import os
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from gallery.models import ImageGallery
-from gallery.ml import classify_image
+from gallery.ml import classify_images
+from gallery.ml_server import MLServerError, MLServerUnavailable
+
+# Batches handed to the tagger per call; tags are saved after each call.
+BATCHES_PER_CHUNK = 8
 
 
 class Command(BaseCommand):
     """
     Management command to auto-tag images using ML.
+
+    Images are captioned in batches (``--batch-size``) by
+    `gallery.ml.classify_images`. A chunk the model server fails on is
+    reported and skipped; its images stay untagged for the next run.
     """
     help = 'Automatically tags images in the gallery using the configured ML model'
 
@@ -25,11 +34,18 @@ class Command(BaseCommand):
             type=int,
             help='Limit the number of images to process',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Images per model call (default: ML_BATCH_SIZE)',
+        )
 
     def handle(self, *args, **options):
         """Execute the command to auto-tag images."""
         force = options['force']
         limit = options['limit']
+        batch_size = max(1, options['batch_size'] or
+                         getattr(settings, 'ML_BATCH_SIZE', 4))
 
         queryset = ImageGallery.objects.all()
 
@@ -41,42 +57,59 @@ class Command(BaseCommand):
         self.stdout.write(self.style.MIGRATE_HEADING(
             f"Found {total} images to process (Force={force})"))
 
+        images = self._collect(queryset, limit)
+        chunk_size = batch_size * BATCHES_PER_CHUNK
         processed_count = 0
+        failed_count = 0
 
-        for image_obj in queryset:
-            if limit and processed_count >= limit:
-                break
-
-            if not image_obj.image:
-                self.stdout.write(self.style.WARNING(
-                    f"Skipping ID {image_obj.id}: No image file"))
-                continue
-
+        for start in range(0, len(images), chunk_size):
+            chunk = images[start:start + chunk_size]
+            self.stdout.write(
+                f"Processing images {start + 1}-{start + len(chunk)} "
+                f"of {len(images)}...")
             try:
-                path = image_obj.image.path
-                if not os.path.exists(path):
-                    self.stdout.write(self.style.ERROR(
-                        f"File not found: {path}"))
-                    continue
-
-                self.stdout.write(
-                    f"Processing ID {image_obj.id}: {image_obj.title}...")
-
-                tags = classify_image(path)
+                results = classify_images(
+                    [image_obj.image.path for image_obj in chunk],
+                    batch_size=batch_size)
+            except (MLServerError, MLServerUnavailable) as e:
+                self.stdout.write(self.style.ERROR(
+                    f"  ! Images {start + 1}-{start + len(chunk)} failed: {e}"))
+                failed_count += len(chunk)
+                continue
 
+            for image_obj, tags in zip(chunk, results):
                 if tags:
                     image_obj.tags.add(*tags)
                     self.stdout.write(self.style.SUCCESS(
-                        f"  + Added tags: {', '.join(tags)}"))
+                        f"  + ID {image_obj.id}: {', '.join(tags)}"))
                 else:
                     self.stdout.write(self.style.WARNING(
-                        "  - No generated tags"))
-
+                        f"  - ID {image_obj.id}: No generated tags"))
                 processed_count += 1
 
-            except (OSError, ValueError, RuntimeError) as e:
-                self.stdout.write(self.style.ERROR(
-                    f"Error processing ID {image_obj.id}: {e}"))
-
         self.stdout.write(self.style.SUCCESS(
             f"Done. Processed {processed_count} images."))
+        if failed_count:
+            self.stdout.write(self.style.ERROR(
+                f"{failed_count} images failed and were left untagged."))
+
+    def _collect(self, queryset, limit):
+        """Return up to `limit` images whose file exists."""
+        images = []
+        for image_obj in queryset:
+            if limit and len(images) >= limit:
+                break
+
+            if not image_obj.image:
+                self.stdout.write(self.style.WARNING(
+                    f"Skipping ID {image_obj.id}: No image file"))
+                continue
+
+            path = image_obj.image.path
+            if not os.path.exists(path):
+                self.stdout.write(self.style.ERROR(
+                    f"File not found: {path}"))
+                continue
+
+            images.append(image_obj)
+        return images
@@ -0,0 +1,132 @@
+"""
+Management command to benchmark draft-mode JPEG decoding for previews.
+"""
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+from django.core.management.base import BaseCommand, CommandError
+from gallery.models import ImageGallery
+from utils.image_optimizer import ImageOptimizer
+
+# Box window for SSIM, and the usual stabilising constants for 8-bit data.
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+def _box_mean(values, size):
+    """Mean of every `size` x `size` window, via an integral image."""
+    integral = np.pad(values, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    window_sum = (integral[size:, size:] - integral[:-size, size:] -
+                  integral[size:, :-size] + integral[:-size, :-size])
+    return window_sum / float(size * size)
+
+
+def ssim(first, second):
+    """Mean structural similarity of two images, computed on luminance."""
+    a = np.asarray(first.convert('L'), dtype=np.float64)
+    b = np.asarray(second.convert('L'), dtype=np.float64)
+    # Sizes may differ by a pixel from rounding the reduced decode.
+    height = min(a.shape[0], b.shape[0])
+    width = min(a.shape[1], b.shape[1])
+    a, b = a[:height, :width], b[:height, :width]
+
+    mu_a = _box_mean(a, SSIM_WINDOW)
+    mu_b = _box_mean(b, SSIM_WINDOW)
+    var_a = _box_mean(a * a, SSIM_WINDOW) - mu_a ** 2
+    var_b = _box_mean(b * b, SSIM_WINDOW) - mu_b ** 2
+    covariance = _box_mean(a * b, SSIM_WINDOW) - mu_a * mu_b
+
+    ssim_map = ((2 * mu_a * mu_b + SSIM_C1) * (2 * covariance + SSIM_C2)) / \
+        ((mu_a ** 2 + mu_b ** 2 + SSIM_C1) * (var_a + var_b + SSIM_C2))
+    return float(ssim_map.mean())
+
+
+class Command(BaseCommand):
+    """
+    Compare full and draft-mode decoding of JPEG originals.
+
+    For each image and width, the preview is produced with and without draft
+    decoding; the command reports the wall time of both and the SSIM of the
+    draft output against the full-decode output.
+    """
+    help = 'Benchmark draft-mode JPEG decoding (wall time and SSIM)'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument('paths', nargs='*',
+                            help='Image files (default: gallery originals)')
+        parser.add_argument('--limit', type=int, default=5,
+                            help='Number of gallery images to use (default: 5)')
+        parser.add_argument('--widths', default='400,800,1200',
+                            help='Comma separated target widths')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Timing repetitions, best is kept (default: 3)')
+
+    def handle(self, *args, **options):
+        """Execute the benchmark."""
+        try:
+            widths = [int(w) for w in options['widths'].split(',') if w]
+        except ValueError as exc:
+            raise CommandError('--widths must be integers') from exc
+
+        paths = options['paths'] or self._gallery_paths(options['limit'])
+        if not paths:
+            raise CommandError('No images to benchmark.')
+
+        self.stdout.write(
+            f"{'image':<30} {'width':>6} {'full ms':>9} {'draft ms':>9} "
+            f"{'speedup':>8} {'ssim':>7}")
+        totals = {'full': 0.0, 'draft': 0.0}
+        scores = []
+        for path in paths:
+            for width in widths:
+                full_time, full_img = self._measure(
+                    path, width, False, options['repeat'])
+                draft_time, draft_img = self._measure(
+                    path, width, True, options['repeat'])
+                score = ssim(full_img, draft_img)
+                totals['full'] += full_time
+                totals['draft'] += draft_time
+                scores.append(score)
+                self.stdout.write(
+                    f"{os.path.basename(path)[:30]:<30} {width:>6} "
+                    f"{full_time * 1000:>9.1f} {draft_time * 1000:>9.1f} "
+                    f"{full_time / max(draft_time, 1e-9):>7.2f}x {score:>7.4f}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: full {totals['full']:.2f}s, draft {totals['draft']:.2f}s "
+            f"({totals['full'] / max(totals['draft'], 1e-9):.2f}x); "
+            f"SSIM mean {sum(scores) / len(scores):.4f}, min {min(scores):.4f}"))
+
+    def _gallery_paths(self, limit):
+        """Paths of the first `limit` JPEG originals in the gallery."""
+        paths = []
+        for image_obj in ImageGallery.objects.only('image').order_by('pk'):
+            if len(paths) >= limit:
+                break
+            if not image_obj.image:
+                continue
+            path = image_obj.image.path
+            if os.path.exists(path) and \
+                    path.lower().endswith(('.jpg', '.jpeg')):
+                paths.append(path)
+        return paths
+
+    @staticmethod
+    def _measure(path, width, draft, repeat):
+        """Best wall time of `repeat` runs, and the decoded output."""
+        best = None
+        output = None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            output = ImageOptimizer.compress_and_resize(
+                path, width=width, draft=draft)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        if output is None:
+            raise CommandError(f'Could not process {path}')
+        return best, Image.open(BytesIO(output.getvalue()))
@@ -0,0 +1,100 @@
+"""
+Management command measuring the startup cost of a Django process.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter: times django.setup() (and URLconf loading, as a
+# web worker's first request would), then optionally the ML stack, and
+# reports peak RSS and whether torch got imported.
+PROBE = r'''
+import json, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+if sys.argv[1] == 'eager':
+    import gallery.ml_backend
+seconds = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'seconds': seconds,
+    'rss_mb': rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10),
+    'modules': len(sys.modules),
+    'torch': 'torch' in sys.modules,
+}))
+'''
+
+SCENARIOS = (
+    ('lazy', 'django.setup()'),
+    ('eager', 'django.setup() + ML stack'),
+)
+
+
+class Command(BaseCommand):
+    """
+    Benchmark process startup: import time and RSS after ``django.setup()``.
+
+    Each run starts a fresh interpreter with the current settings, so the
+    figures are what a web worker pays before serving its first request.
+    The "ML stack" row also imports `gallery.ml_backend` (torch and
+    transformers), which is what every process paid before the tagger was
+    imported lazily.
+    """
+    help = 'Measures import time and RSS of django.setup(), with and without the ML stack'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Fresh processes per scenario (default: 5)',
+        )
+        parser.add_argument(
+            '--json',
+            help='Also write every measurement to this file',
+        )
+
+    def handle(self, *args, **options):
+        """Start the probes and print the median of each scenario."""
+        runs = max(1, options['runs'])
+        env = {**os.environ,
+               'DJANGO_SETTINGS_MODULE': os.environ.get(
+                   'DJANGO_SETTINGS_MODULE', 'rg_api.settings')}
+
+        results = {}
+        for scenario, label in SCENARIOS:
+            samples = [self._probe(scenario, env) for _ in range(runs)]
+            results[scenario] = samples
+            seconds = statistics.median(sample['seconds'] for sample in samples)
+            rss = statistics.median(sample['rss_mb'] for sample in samples)
+            self.stdout.write(
+                f"{label:<28} {seconds:6.2f} s  {rss:7.0f} MB  "
+                f"{samples[0]['modules']:5d} modules  "
+                f"torch {'imported' if samples[0]['torch'] else 'not imported'}")
+
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as file_obj:
+                json.dump(results, file_obj, indent=2)
+            self.stdout.write(f"Results written to {options['json']}")
+
+    @staticmethod
+    def _probe(scenario, env):
+        """Run the probe in a new interpreter and return its measurements."""
+        completed = subprocess.run(
+            [sys.executable, '-c', PROBE, scenario],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            check=False)
+        if completed.returncode != 0:
+            raise CommandError(
+                f"Startup probe failed:\n{completed.stderr.strip()}")
+        # Apps may print while loading; the measurements are the last line.
+        return json.loads(completed.stdout.strip().splitlines()[-1])
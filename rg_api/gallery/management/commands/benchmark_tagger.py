@@ -0,0 +1,171 @@
+"""
+Management command comparing the CPU precisions of the ML tagger.
+"""
+import gc
+import json
+import os
+import resource
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from gallery.models import ImageGallery
+from gallery.ml import CPU_MODES, classify_images, load_model
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff')
+
+
+def tag_agreement(reference, tags):
+    """Jaccard similarity of two tag lists (1.0 when both are empty)."""
+    reference, tags = set(reference), set(tags)
+    if not reference and not tags:
+        return 1.0
+    return len(reference & tags) / len(reference | tags)
+
+
+def state_bytes(model):
+    """Bytes held by the weights of `model`, quantized ones included."""
+    def size(value):
+        if hasattr(value, 'element_size'):
+            return value.numel() * value.element_size()
+        if isinstance(value, (list, tuple)):
+            return sum(size(item) for item in value)
+        return 0
+    return sum(size(value) for value in model.state_dict().values())
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the tagger in each ``BLIP2_CPU_MODE`` on a fixed image set.
+
+    Every mode tags the same images on CPU; its tags are compared with the
+    fp32 ones (mean Jaccard similarity and share of identical tag sets) and
+    its load time, throughput and weight size are reported. Peak RSS only
+    grows within a process, so run one mode per invocation to compare it.
+    """
+    help = 'Compares speed and tag accuracy of the tagger CPU modes against fp32'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            help='Image files or directories (default: gallery images)',
+        )
+        parser.add_argument(
+            '--modes',
+            default=','.join(CPU_MODES),
+            help=f'Comma-separated modes to run (default: {",".join(CPU_MODES)})',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Gallery images to use when no paths are given (default: 20)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Images per model call (default: ML_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--json',
+            help='Also write the results (and every tag set) to this file',
+        )
+
+    def handle(self, *args, **options):
+        """Run every mode on the image set and print the comparison."""
+        modes = [mode.strip() for mode in options['modes'].split(',')
+                 if mode.strip()]
+        unknown = set(modes) - set(CPU_MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+        # The fp32 tags are the reference the other modes are scored against.
+        modes = ['fp32'] + [mode for mode in modes if mode != 'fp32']
+
+        paths = self._collect(options['paths'], options['limit'])
+        if not paths:
+            raise CommandError("No images to benchmark.")
+        batch_size = max(1, options['batch_size'] or
+                         getattr(settings, 'ML_BATCH_SIZE', 4))
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Benchmarking {', '.join(modes)} on {len(paths)} images "
+            f"(batch size {batch_size})"))
+
+        results = []
+        reference = None
+        for mode in modes:
+            result = self._run(mode, paths, batch_size)
+            if reference is None:
+                reference = result['tags']
+            scores = [tag_agreement(ref, tags)
+                      for ref, tags in zip(reference, result['tags'])]
+            result['agreement'] = sum(scores) / len(scores)
+            result['identical'] = sum(score == 1.0 for score in scores) / \
+                len(scores)
+            results.append(result)
+            self._report(result)
+
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as file_obj:
+                json.dump({'paths': paths, 'results': results}, file_obj,
+                          indent=2)
+            self.stdout.write(f"Results written to {options['json']}")
+
+    def _run(self, mode, paths, batch_size):
+        """Load the model in `mode`, tag `paths` and measure it."""
+        self.stdout.write(f"Loading {mode}...")
+        started = time.perf_counter()
+        loaded = load_model(device='cpu', mode=mode)
+        load_seconds = time.perf_counter() - started
+
+        # Warm up allocator and kernels on one image before timing.
+        classify_images(paths[:1], batch_size=1, loaded=loaded)
+        started = time.perf_counter()
+        tags = classify_images(paths, batch_size=batch_size, loaded=loaded)
+        seconds = time.perf_counter() - started
+
+        result = {
+            'mode': mode,
+            'load_seconds': load_seconds,
+            'seconds_per_image': seconds / len(paths),
+            'weights_mb': state_bytes(loaded[1]) / 2 ** 20,
+            # ru_maxrss is in KiB on Linux.
+            'peak_rss_mb': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'tags': tags,
+        }
+        del loaded
+        gc.collect()
+        return result
+
+    def _report(self, result):
+        """Print the summary line of one mode."""
+        self.stdout.write(self.style.SUCCESS(
+            f"  {result['mode']:>5}: "
+            f"{result['seconds_per_image']:.2f} s/image, "
+            f"load {result['load_seconds']:.1f} s, "
+            f"weights {result['weights_mb']:.0f} MB, "
+            f"peak RSS {result['peak_rss_mb']:.0f} MB, "
+            f"agreement {result['agreement']:.1%}, "
+            f"identical {result['identical']:.1%}"))
+
+    def _collect(self, paths, limit):
+        """Sorted image files under `paths`, or the first gallery images."""
+        if not paths:
+            return [image_obj.image.path for image_obj in
+                    ImageGallery.objects.exclude(image='').order_by('pk')[:limit]
+                    if os.path.exists(image_obj.image.path)]
+
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(
+                    os.path.join(root, name)
+                    for root, _, names in os.walk(path) for name in names
+                    if name.lower().endswith(IMAGE_EXTENSIONS))
+            elif os.path.exists(path):
+                files.append(path)
+            else:
+                raise CommandError(f"File not found: {path}")
+        return sorted(files)
@@ -2,17 +2,86 @@
 Management command to regenerate image previews.
 """
 import glob
+import json
 import os
-from PIL import ImageCms
-from django.core.management.base import BaseCommand
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, time as dt_time
+
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from gallery.models import ImageGallery
-from utils.image_optimizer import ImageOptimizer
+from gallery.previews import (
+    PREVIEW_WIDTHS, preview_formats, preview_path, write_previews)
+from utils.previews import source_digest
+
+MANIFEST_NAME = 'manifest.json'
+CHECKPOINT_NAME = '.regenerate_checkpoint.json'
+
+# Save the checkpoint at least this often (images, seconds).
+CHECKPOINT_EVERY = 10
+CHECKPOINT_INTERVAL = 5.0
+
+
+def render_image(pk, source_path, widths, formats):
+    """
+    Render the previews of one image (runs in a worker process).
+
+    Returns:
+        tuple: (pk, manifest entry or None, error message or None)
+    """
+    try:
+        entry = {
+            **source_stamp(source_path),
+            'digest': source_digest(source_path),
+            'widths': widths,
+            'formats': formats,
+        }
+        if not write_previews(source_path, pk, widths, formats):
+            # The source could not be decoded: keep it out of the manifest
+            # and checkpoint so --only-missing and resume retry it.
+            return pk, None, "no previews rendered"
+        return pk, entry, None
+    except (OSError, ValueError, RuntimeError) as e:
+        return pk, None, str(e)
+
+
+def source_stamp(source_path):
+    """Manifest stamp of a source file: mtime (ns) and size."""
+    stat = os.stat(source_path)
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def load_json(path, default):
+    """Read a JSON state file, falling back to `default`."""
+    try:
+        with open(path, encoding='utf-8') as file_obj:
+            return json.load(file_obj)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path, data):
+    """Atomically write a JSON state file."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file_obj:
+        json.dump(data, file_obj)
+    os.replace(temp_path, path)
 
 
 class Command(BaseCommand):
     """
     Management command to regenerate image previews.
+
+    Images are rendered in parallel worker processes (``--workers``). A
+    manifest in the preview directory records the source mtime, size and
+    digest each image's previews were built from, so ``--only-missing`` skips
+    images whose (content-addressed) previews exist without rehashing
+    unchanged sources. Progress is checkpointed, and an interrupted run
+    resumes where it stopped unless ``--no-resume`` is given.
     """
     help = 'Regenerate all image previews using custom ImageOptimizer'
 
@@ -20,6 +89,15 @@ class Command(BaseCommand):
         """Add command line arguments."""
         parser.add_argument('--clean', action='store_true',
                             help='Delete existing previews before regenerating')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes (default: 1)')
+        parser.add_argument('--only-missing', action='store_true',
+                            help='Skip images whose previews are up to date')
+        parser.add_argument('--since',
+                            help='Only images updated or modified on disk '
+                                 'since this date (YYYY-MM-DD or ISO datetime)')
+        parser.add_argument('--no-resume', action='store_true',
+                            help='Ignore the checkpoint of an interrupted run')
 
     def handle(self, *args, **options):
         """Execute the command to regenerate previews."""
@@ -28,62 +106,195 @@ class Command(BaseCommand):
         # Ensure preview directory exists
         os.makedirs(preview_dir, exist_ok=True)
 
-        # Pre-load sRGB profile
-        try:
-            _unused_srgb_profile = ImageCms.createProfile('sRGB')
-        except ImportError:
-            _unused_srgb_profile = None
+        manifest_path = os.path.join(preview_dir, MANIFEST_NAME)
+        checkpoint_path = os.path.join(preview_dir, CHECKPOINT_NAME)
+        since = self._parse_since(options['since'])
+        widths = PREVIEW_WIDTHS
+        formats = preview_formats()
 
         if options['clean']:
-            self.stdout.write('Cleaning existing previews...')
-            # Clean both WebP (old) and JPG (new) to ensure a clean slate if switching formats
-            files = glob.glob(os.path.join(preview_dir, '*.webp')) + \
-                glob.glob(os.path.join(preview_dir, '*.jpg'))
-            for f in files:
-                try:
-                    os.remove(f)
-                except OSError as e:
-                    self.stdout.write(self.style.ERROR(
-                        f'Error deleting {f}: {e}'))
-            self.stdout.write(self.style.SUCCESS('Cleaned previews.'))
-
-        images = ImageGallery.objects.all()
-        # Common widths used in the application
-        widths = [400, 500, 600, 700, 800, 900, 1000, 1200, 2500]
-        total_images = images.count()
-
-        # Configure enhancements
-        # 1. Saturation boost: +10% (Restores perception of depth for sRGB on wide gamut)
+            self._clean(preview_dir, manifest_path, checkpoint_path)
+
+        manifest = load_json(manifest_path, {})
+        completed = set()
+        if not options['no_resume']:
+            checkpoint = load_json(checkpoint_path, {})
+            if checkpoint.get('widths') == widths and \
+                    checkpoint.get('formats') == formats:
+                completed = set(checkpoint.get('completed', []))
+                if completed:
+                    self.stdout.write(
+                        f'Resuming: {len(completed)} images already done.')
+
+        jobs = self._collect_jobs(
+            widths, formats, manifest, completed, since,
+            options['only_missing'])
 
         self.stdout.write(
-            f'Found {total_images} images. Starting regeneration...')
+            f'Found {len(jobs)} images to render. Starting regeneration...')
+
+        state = {
+            'manifest': manifest,
+            'completed': completed,
+            'manifest_path': manifest_path,
+            'checkpoint_path': checkpoint_path,
+            'widths': widths,
+            'formats': formats,
+        }
+        try:
+            errors = self._run(jobs, max(1, options['workers']), state)
+        except KeyboardInterrupt:
+            self._save_state(state)
+            self.stdout.write(self.style.WARNING(
+                'Interrupted; run again to resume.'))
+            raise
+
+        self._save_state(state)
+        if not errors:
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+            self.stdout.write(self.style.SUCCESS('Regeneration complete.'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Regeneration finished with {errors} errors; '
+                'run again to retry them.'))
+
+    def _parse_since(self, value):
+        """Parse --since into an aware datetime."""
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f'Invalid --since value: {value}')
+            parsed = datetime.combine(day, dt_time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def _clean(self, preview_dir, manifest_path, checkpoint_path):
+        """Delete previews and the state files."""
+        self.stdout.write('Cleaning existing previews...')
+        # Clean every preview format to ensure a clean slate if switching formats
+        files = glob.glob(os.path.join(preview_dir, '*.avif')) + \
+            glob.glob(os.path.join(preview_dir, '*.webp')) + \
+            glob.glob(os.path.join(preview_dir, '*.jpg')) + \
+            [manifest_path, checkpoint_path]
+        for f in files:
+            if not os.path.exists(f):
+                continue
+            try:
+                os.remove(f)
+            except OSError as e:
+                self.stdout.write(self.style.ERROR(
+                    f'Error deleting {f}: {e}'))
+        self.stdout.write(self.style.SUCCESS('Cleaned previews.'))
+
+    def _collect_jobs(self, widths, formats, manifest, completed, since,
+                      only_missing):
+        """List (pk, source path) of the images that need rendering."""
+        jobs = []
+        images = ImageGallery.objects.only('pk', 'title', 'image', 'updated_at')
+        for image_obj in images.iterator():
+            if image_obj.pk in completed:
+                continue
 
-        for index, image_obj in enumerate(images):
             # Check if source file exists
             if not image_obj.image or not os.path.exists(image_obj.image.path):
                 self.stdout.write(self.style.WARNING(
                     f'Source image not found for ID {image_obj.pk}: {image_obj.title}'))
                 continue
 
-            try:
-                for width in widths:
-                    filename = os.path.join(
-                        preview_dir, f"{image_obj.pk}_{width}.webp")
-
-                    ImageOptimizer.compress_and_resize(
-                        image_obj.image.path,
-                        output_path=filename,
-                        width=width
-                    )
-                    self.stdout.write(self.style.SUCCESS(
-                        f'Generated {width}px preview for {image_obj.pk}'))
-
-                if (index + 1) % 10 == 0:
-                    self.stdout.write(
-                        f'Processed {index + 1}/{total_images} images...')
+            source_path = image_obj.image.path
+            stamp = source_stamp(source_path)
 
-            except (OSError, ValueError, RuntimeError) as e:
+            if since is not None:
+                modified = datetime.fromtimestamp(
+                    stamp['mtime'] / 1e9, tz=since.tzinfo)
+                if image_obj.updated_at < since and modified < since:
+                    continue
+
+            if only_missing and self._is_up_to_date(
+                    image_obj.pk, source_path, stamp, widths, formats,
+                    manifest):
+                continue
+
+            jobs.append((image_obj.pk, source_path))
+        return jobs
+
+    @staticmethod
+    def _is_up_to_date(pk, source_path, stamp, widths, formats, manifest):
+        """Whether every preview of the current source content exists."""
+        entry = manifest.get(str(pk)) or {}
+        if entry.get('mtime') == stamp['mtime'] and \
+                entry.get('size') == stamp['size'] and entry.get('digest'):
+            digest = entry['digest']
+        else:
+            # Unknown or touched source: previews are keyed by its content.
+            digest = source_digest(source_path)
+        return all(
+            os.path.exists(preview_path(source_path, pk, width, digest, fmt))
+            for width in widths for fmt in formats)
+
+    def _run(self, jobs, workers, state):
+        """Render `jobs`, recording progress; return the number of errors."""
+        total = len(jobs)
+        widths, formats = state['widths'], state['formats']
+        started = time.monotonic()
+        last_save = started
+        done = errors = bytes_read = 0
+
+        def record(pk, entry, error):
+            nonlocal done, errors, bytes_read, last_save
+            done += 1
+            if error:
+                errors += 1
                 self.stdout.write(self.style.ERROR(
-                    f'Error generating preview for {image_obj.pk}: {e}'))
+                    f'Error generating preview for {pk}: {error}'))
+            else:
+                bytes_read += entry['size']
+                state['completed'].add(pk)
+                state['manifest'][str(pk)] = entry
+
+            now = time.monotonic()
+            if done % CHECKPOINT_EVERY == 0 or done == total or \
+                    now - last_save >= CHECKPOINT_INTERVAL:
+                self._save_state(state)
+                last_save = now
+                elapsed = max(now - started, 1e-6)
+                self.stdout.write(
+                    f'Processed {done}/{total} images '
+                    f'({done / elapsed:.2f} images/s, '
+                    f'{bytes_read / elapsed / 1e6:.2f} MB/s)')
+
+        if workers == 1:
+            for pk, source_path in jobs:
+                record(*render_image(pk, source_path, widths, formats))
+            return errors
+
+        # Forked workers must not share the parent's database connections.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(render_image, pk, source_path, widths, formats)
+                for pk, source_path in jobs
+            ]
+            try:
+                for future in as_completed(futures):
+                    record(*future.result())
+            except KeyboardInterrupt:
+                for future in futures:
+                    future.cancel()
+                raise
+        return errors
 
-        self.stdout.write(self.style.SUCCESS('Regeneration complete.'))
+    @staticmethod
+    def _save_state(state):
+        """Persist the manifest and the checkpoint."""
+        save_json(state['manifest_path'], state['manifest'])
+        save_json(state['checkpoint_path'], {
+            'widths': state['widths'],
+            'formats': state['formats'],
+            'completed': sorted(state['completed']),
+        })
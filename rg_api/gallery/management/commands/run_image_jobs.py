@@ -0,0 +1,75 @@
+"""
+Management command running the background image jobs.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gallery.jobs import claim_jobs, requeue_stale_jobs, run_jobs, worker_name
+
+
+class Command(BaseCommand):
+    """
+    Worker of the `gallery.jobs` queue.
+
+    Claims pending jobs in batches (so tagging jobs reach the model together),
+    runs them and records the outcome. Polls for new jobs until interrupted,
+    or with ``--once`` exits when the queue is empty.
+    """
+    help = 'Runs queued image jobs (auto-tagging, GPS extraction, previews)'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no jobs are pending instead of polling',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Jobs claimed at a time (default: GALLERY_JOB_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            help='Seconds between polls of an empty queue '
+                 '(default: GALLERY_JOB_POLL_INTERVAL)',
+        )
+
+    def handle(self, *args, **options):
+        """Claim and run jobs until interrupted (or drained with --once)."""
+        batch_size = max(1, options['batch_size'] or
+                         getattr(settings, 'GALLERY_JOB_BATCH_SIZE', 8))
+        poll_interval = options['poll_interval'] or \
+            getattr(settings, 'GALLERY_JOB_POLL_INTERVAL', 2.0)
+        worker = worker_name()
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Worker {worker} running jobs in batches of {batch_size}"))
+
+        try:
+            while True:
+                close_old_connections()
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(
+                        f"Requeued {requeued} stale jobs"))
+
+                jobs = claim_jobs(worker, batch_size)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                counts = run_jobs(jobs)
+                self.stdout.write(
+                    f"Ran {len(jobs)} jobs: " + ", ".join(
+                        f"{count} {status}"
+                        for status, count in sorted(counts.items())))
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS("Worker stopped."))
@@ -0,0 +1,70 @@
+"""
+Management command running the local model server.
+"""
+import signal
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery.ml import (
+    CPU_MODES, caption_images, cpu_mode, get_model, load_model)
+from gallery.ml_server import ModelServer
+
+
+class Command(BaseCommand):
+    """
+    Load the BLIP-2 tagger once and serve it on a Unix socket.
+
+    Web workers, the job worker and commands then caption images through
+    `gallery.ml_server` instead of loading their own copy of the model. The
+    socket is only created once the model is loaded, so a successful ping
+    means the server is ready.
+    """
+    help = 'Serves BLIP-2 captions to the other processes over a Unix socket'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument(
+            '--socket',
+            help='Socket path (default: ML_SERVER_SOCKET)',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=CPU_MODES,
+            help='Precision on CPU (default: BLIP2_CPU_MODE)',
+        )
+
+    def handle(self, *args, **options):
+        """Load the model and serve requests until interrupted."""
+        path = options['socket'] or getattr(settings, 'ML_SERVER_SOCKET', '')
+        if not path:
+            raise CommandError("Set ML_SERVER_SOCKET or pass --socket.")
+        if not getattr(settings, 'ENABLE_ML_MODELS', False):
+            raise CommandError("ENABLE_ML_MODELS is disabled.")
+        mode = options['mode'] or cpu_mode()
+
+        started = time.perf_counter()
+        # The configured mode goes through the process-wide cache, so nothing
+        # else in this process can load a second copy.
+        loaded = get_model() if mode == cpu_mode() else load_model(mode=mode)
+        self.stdout.write(
+            f"Model loaded in {time.perf_counter() - started:.1f} s "
+            f"on {loaded[1].device}")
+
+        def caption(paths, batch_size):
+            return caption_images(paths, batch_size, loaded=loaded)
+
+        server = ModelServer(path, caption, info={
+            'device': str(loaded[1].device), 'mode': mode})
+        # Exit through the finally clause so the socket file is removed.
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        self.stdout.write(self.style.SUCCESS(f"Listening on {path}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write("Model server stopped.")
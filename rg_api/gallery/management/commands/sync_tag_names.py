@@ -0,0 +1,27 @@
+"""
+Management command to backfill the denormalized image tag names.
+"""
+from django.core.management.base import BaseCommand
+from gallery.models import ImageGallery
+
+
+class Command(BaseCommand):
+    """
+    Management command to rebuild `ImageGallery.tag_names`.
+
+    The tag signals keep the column current; this repairs rows changed
+    behind their back (raw SQL, imports, bulk operations on tagged items).
+    """
+    help = 'Recompute the denormalized tag names of gallery images'
+
+    def add_arguments(self, parser):
+        """Add command line arguments."""
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows per UPDATE batch (default: 500)')
+
+    def handle(self, *args, **options):
+        """Execute the command to backfill tag names."""
+        updated = ImageGallery.sync_tag_names(
+            batch_size=max(1, options['batch_size']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated tag names of {updated} images."))
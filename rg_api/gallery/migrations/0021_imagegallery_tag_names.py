@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:28
+
+from django.db import migrations, models
+
+
+def populate_tag_names(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    ImageGallery = apps.get_model('gallery', 'ImageGallery')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+
+    content_type = ContentType.objects.filter(
+        app_label='gallery', model='imagegallery').first()
+    if content_type is None:
+        return
+
+    names = {}
+    tagged = TaggedItem.objects.filter(content_type=content_type)
+    for object_id, name in tagged.values_list('object_id', 'tag__name'):
+        names.setdefault(object_id, []).append(name)
+
+    images = []
+    for image in ImageGallery.objects.filter(pk__in=names).only('pk'):
+        image.tag_names = sorted(
+            names[image.pk], key=lambda name: (name.casefold(), name))
+        images.append(image)
+    ImageGallery.objects.bulk_update(images, ['tag_names'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('gallery', '0020_alter_imagegallery_slug'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagegallery',
+            name='tag_names',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(populate_tag_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:33
+
+from django.db import migrations, models
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(latitude, longitude, precision=12):
+    """Frozen copy of utils.geohash.encode as of this migration."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even \
+            else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def populate_geohashes(apps, schema_editor):
+    ImageGallery = apps.get_model('gallery', 'ImageGallery')
+    images = []
+    geotagged = ImageGallery.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).only('pk', 'latitude', 'longitude')
+    for image in geotagged.iterator():
+        image.geohash = encode_geohash(image.latitude, image.longitude)
+        images.append(image)
+    ImageGallery.objects.bulk_update(images, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0021_imagegallery_tag_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagegallery',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(populate_geohashes, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,29 @@
-""" Machine learning utilities for image classification using BLIP-2."""
+"""
+Machine learning utilities for image classification using BLIP-2.
+
+This module is a lightweight facade: torch and transformers are only
+imported (through `gallery.ml_backend`) on the first local inference or model
+load, so importing it costs nothing in processes that never tag an image,
+have ``ENABLE_ML_MODELS`` disabled, or caption through the model server.
+"""
 import logging
-from transformers import Blip2Processor, Blip2ForConditionalGeneration
-import torch
+
 from django.conf import settings
-from PIL import Image
+from django.core.exceptions import ImproperlyConfigured
+
+from gallery.ml_server import MLServerUnavailable, caption_remote, server_socket
 
 logger = logging.getLogger(__name__)
 
-# Model caching using function attributes
+# Precisions of the CPU model (BLIP2_CPU_MODE): float32, bfloat16, or float32
+# with the OPT language model dynamically quantized to int8.
+CPU_MODES = ('fp32', 'bf16', 'int8')
+
+
+def _backend():
+    """Import the torch/transformers half of the tagger on first use."""
+    from gallery import ml_backend  # pylint: disable=import-outside-toplevel
+    return ml_backend
 
 
 def get_model():
@@ -23,120 +39,111 @@ def get_model():
         logger.info("BLIP-2 Model loading is disabled.")
         return None, None
 
-    if not hasattr(get_model, "processor"):
-        get_model.processor = None
-    if not hasattr(get_model, "model"):
-        get_model.model = None
-
-    if get_model.model is None:
-        logger.info(
-            "Loading BLIP-2 Model (OPT-2.7b)... this may take a moment.")
-
-        model_id = "Salesforce/blip2-opt-2.7b"
-        # Pin to a specific commit hash to prevent supply-chain attacks (CWE-494).
-        # Update this value after reviewing the new revision's release notes.
-        model_revision = getattr(
-            settings, 'BLIP2_MODEL_REVISION',
-            '3669b04dc5f90a6f8c1af2f72a22a28e30dbf9bc'
-        )
-
-        # Determine device: MPS (Apple Silicon), CUDA, or CPU
-        device = "cpu"
-        if torch.cuda.is_available():
-            device = "cuda"
-        elif torch.backends.mps.is_available():
-            device = "mps"
-
-        logger.info("Using device: %s", device)
-
-        # Explicitly set use_fast=True to suppress warning and future-proof
-        get_model.processor = Blip2Processor.from_pretrained(
-            model_id, use_fast=True, revision=model_revision)
-
-        # device_map="auto" is excellent for CUDA but can cause shape errors on MPS/Mac.
-        # For MPS, it's safer to load manually and move to device.
-        try:
-            if device == "cuda":
-                get_model.model = Blip2ForConditionalGeneration.from_pretrained(
-                    model_id,
-                    device_map="auto",
-                    dtype=torch.float16,
-                    low_cpu_mem_usage=True,
-                    revision=model_revision
-                )
-            elif device == "mps":
-                # MPS supports float16. low_cpu_mem_usage=True uses
-                # accelerate to load faster avoiding RAM spikes
-                get_model.model = Blip2ForConditionalGeneration.from_pretrained(
-                    model_id,
-                    dtype=torch.float16,
-                    low_cpu_mem_usage=True,
-                    revision=model_revision
-                )
-                get_model.model.to("mps")
-            else:
-                get_model.model = Blip2ForConditionalGeneration.from_pretrained(
-                    model_id,
-                    dtype=torch.float32,
-                    low_cpu_mem_usage=True,
-                    revision=model_revision
-                )
-        except (RecursionError, OSError, RuntimeError, ValueError) as e1:
+    return _backend().get_model()
+
+
+def cpu_mode():
+    """The configured ``BLIP2_CPU_MODE``, validated."""
+    mode = getattr(settings, 'BLIP2_CPU_MODE', 'fp32')
+    if mode not in CPU_MODES:
+        raise ImproperlyConfigured(
+            f"BLIP2_CPU_MODE must be one of {', '.join(CPU_MODES)}, "
+            f"not {mode!r}.")
+    return mode
+
+
+def load_model(device=None, mode=None):
+    """
+    Load the BLIP-2 processor and model, bypassing the `get_model` cache.
+
+    See `gallery.ml_backend.load_model`.
+    """
+    return _backend().load_model(device, mode)
+
+
+def quantize_language_model(model):
+    """Quantize the BLIP-2 language model to int8, in place (see the backend)."""
+    return _backend().quantize_language_model(model)
+
+
+# Caption words that say nothing about the subject.
+STOPWORDS = {
+    'a', 'an', 'the', 'in', 'on', 'at', 'with', 'and', 'of',
+    'is', 'are', 'sitting', 'standing', 'looking', 'walking',
+    'flying', 'background',
+    'foreground', 'photo', 'picture', 'image', 'view', 'large',
+    'small', 'close', 'up', 'close-up', 'next', 'to', 'by', 'near',
+    'front', 'shot', 'full', 'frame'
+}
 
+
+def caption_to_tags(caption):
+    """Extract the keywords of a BLIP-2 caption as tags."""
+    words = caption.lower().replace('.', '').replace(',', '').split()
+    # Basic singularization could happen here, but keeping it simple
+    return list({w for w in words if w not in STOPWORDS and len(w) > 2})
+
+
+def caption_images(image_paths, batch_size=None, workers=None, loaded=None):
+    """
+    Caption several images with BLIP-2.
+
+    With ``ML_SERVER_SOCKET`` set (and no `loaded` model) the captions come
+    from the model server (see `gallery.ml_server`). If it cannot be reached,
+    ``ML_SERVER_FALLBACK`` decides: 'local' loads the model in this process,
+    'error' raises `MLServerUnavailable`.
+
+    Args:
+        image_paths: Paths of the images to caption.
+        batch_size: Images per `generate` call (default ``ML_BATCH_SIZE``).
+        workers: Preprocessing threads (default ``ML_PREPROCESS_WORKERS``).
+        loaded: (processor, model) to use instead of `get_model`.
+
+    Returns:
+        list: One caption per path, in order; None for images that could not
+        be read or captioned.
+    """
+    image_paths = list(image_paths)
+    if not image_paths:
+        return []
+
+    if loaded is None and server_socket():
+        try:
+            return caption_remote(image_paths, batch_size)
+        except MLServerUnavailable as e:
+            if getattr(settings, 'ML_SERVER_FALLBACK', 'local') != 'local':
+                raise
             logger.warning(
-                "Primary load failed (%s), retrying on CPU/standard...", e1)
+                "Model server unavailable (%s); captioning in-process.", e)
 
-            # Fallback if acceleration fails
-            get_model.model = Blip2ForConditionalGeneration.from_pretrained(
-                model_id, low_cpu_mem_usage=True, revision=model_revision)
-            get_model.model.to("cpu")
+    loaded = loaded or get_model()
+    if loaded[1] is None:
+        return [None] * len(image_paths)
+    return _caption_local(image_paths, batch_size, workers, loaded)
 
-        get_model.model.eval()
-        logger.info("BLIP-2 model loaded.")
 
-    return get_model.processor, get_model.model
+def _caption_local(image_paths, batch_size, workers, loaded):
+    """Caption images in this process (see `gallery.ml_backend`)."""
+    return _backend().caption_local(image_paths, batch_size, workers, loaded)
+
+
+def classify_images(image_paths, batch_size=None, workers=None, loaded=None):
+    """
+    Caption several images with BLIP-2 and extract the tags of each.
+
+    Takes the arguments of `caption_images`.
+
+    Returns:
+        list: One tag list per path, in order; empty for images that could
+        not be read or captioned.
+    """
+    return [caption_to_tags(caption) if caption else []
+            for caption in caption_images(
+                image_paths, batch_size, workers, loaded)]
 
 
 def classify_image(image_path):
     """
     Generates a sophisticated caption using BLIP-2 and extracts high-level tags.
     """
-    try:
-        processor, model = get_model()
-        device = model.device
-
-        with Image.open(image_path) as raw_image:
-            # BLIP-2 allows asking questions! We can guide it to list objects.
-            # But a general caption is usually best for tagging "wild nature".
-            inputs = processor(images=raw_image.convert('RGB'), return_tensors="pt").to(
-                device, torch.float16 if device.type != 'cpu' else torch.float32)
-
-            with torch.no_grad():
-                generated_ids = model.generate(**inputs, max_new_tokens=50)
-
-            caption = processor.batch_decode(
-                generated_ids, skip_special_tokens=True)[0].strip()
-            logger.info("BLIP-2 Caption: %s", caption)
-
-            # Advanced keyword extraction from the rich caption
-            stopwords = {
-                'a', 'an', 'the', 'in', 'on', 'at', 'with', 'and', 'of',
-                'is', 'are', 'sitting', 'standing', 'looking', 'walking',
-                'flying', 'background',
-                'foreground', 'photo', 'picture', 'image', 'view', 'large',
-                'small', 'close', 'up', 'close-up', 'next', 'to', 'by', 'near',
-                'front', 'shot', 'full', 'frame'
-            }
-
-            words = caption.lower().replace('.', '').replace(',', '').split()
-            tags = []
-            for w in words:
-                if w not in stopwords and len(w) > 2:
-                    # Basic singularization could happen here, but keeping it simple
-                    tags.append(w)
-
-        return list(set(tags))
-
-    except (OSError, RuntimeError, ValueError, torch.cuda.OutOfMemoryError) as e:
-        logger.error("Error classifying image %s: %s", image_path, e)
-        return []
+    return classify_images([image_path], batch_size=1, workers=1)[0]
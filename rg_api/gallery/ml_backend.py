@@ -0,0 +1,220 @@
+"""
+Heavy half of the BLIP-2 tagger: everything that needs torch or transformers.
+
+Importing torch and transformers takes seconds and hundreds of megabytes, so
+only `gallery.ml` imports this module, and only when a model is actually
+loaded or run in this process. Web workers that never tag an image (or that
+go through the model server) never import it.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from django.conf import settings
+from PIL import Image
+from transformers import Blip2ForConditionalGeneration, Blip2Processor
+
+from gallery.ml import cpu_mode
+
+logger = logging.getLogger(__name__)
+
+# Model caching using function attributes; the lock keeps concurrent first
+# calls (e.g. the warmup thread and a request) from loading two copies.
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """
+    Return the cached BLIP-2 processor and model, loading them on first use.
+
+    See `gallery.ml.get_model`, which checks ``ENABLE_ML_MODELS`` first.
+    """
+    if not hasattr(get_model, "processor"):
+        get_model.processor = None
+    if not hasattr(get_model, "model"):
+        get_model.model = None
+
+    if get_model.model is None:
+        with _model_lock:
+            if get_model.model is None:
+                get_model.processor, get_model.model = load_model()
+
+    return get_model.processor, get_model.model
+
+
+def default_device():
+    """Best available device: CUDA, MPS (Apple Silicon) or CPU."""
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def load_model(device=None, mode=None):
+    """
+    Load the BLIP-2 processor and model, bypassing the `get_model` cache.
+
+    Args:
+        device: "cuda", "mps" or "cpu" (default: the best available).
+        mode: Precision on CPU, one of `gallery.ml.CPU_MODES` (default
+            ``BLIP2_CPU_MODE``). Ignored on accelerators, which use float16.
+
+    Returns:
+        tuple: The processor and the model, in eval mode.
+    """
+    model_id = "Salesforce/blip2-opt-2.7b"
+    # Pin to a specific commit hash to prevent supply-chain attacks (CWE-494).
+    # Update this value after reviewing the new revision's release notes.
+    model_revision = getattr(
+        settings, 'BLIP2_MODEL_REVISION',
+        '3669b04dc5f90a6f8c1af2f72a22a28e30dbf9bc'
+    )
+    device = device or default_device()
+    mode = mode or cpu_mode()
+
+    logger.info(
+        "Loading BLIP-2 Model (OPT-2.7b)... this may take a moment.")
+    logger.info("Using device: %s", device if device != "cpu"
+                else f"cpu ({mode})")
+
+    # Explicitly set use_fast=True to suppress warning and future-proof
+    processor = Blip2Processor.from_pretrained(
+        model_id, use_fast=True, revision=model_revision)
+
+    # device_map="auto" is excellent for CUDA but can cause shape errors on MPS/Mac.
+    # For MPS, it's safer to load manually and move to device.
+    try:
+        if device == "cuda":
+            model = Blip2ForConditionalGeneration.from_pretrained(
+                model_id,
+                device_map="auto",
+                dtype=torch.float16,
+                low_cpu_mem_usage=True,
+                revision=model_revision
+            )
+        elif device == "mps":
+            # MPS supports float16. low_cpu_mem_usage=True uses
+            # accelerate to load faster avoiding RAM spikes
+            model = Blip2ForConditionalGeneration.from_pretrained(
+                model_id,
+                dtype=torch.float16,
+                low_cpu_mem_usage=True,
+                revision=model_revision
+            )
+            model.to("mps")
+        else:
+            model = Blip2ForConditionalGeneration.from_pretrained(
+                model_id,
+                dtype=torch.bfloat16 if mode == 'bf16' else torch.float32,
+                low_cpu_mem_usage=True,
+                revision=model_revision
+            )
+            if mode == 'int8':
+                quantize_language_model(model)
+    except (RecursionError, OSError, RuntimeError, ValueError) as e1:
+
+        logger.warning(
+            "Primary load failed (%s), retrying on CPU/standard...", e1)
+
+        # Fallback if acceleration fails
+        model = Blip2ForConditionalGeneration.from_pretrained(
+            model_id, low_cpu_mem_usage=True, revision=model_revision)
+        model.to("cpu")
+
+    model.eval()
+    logger.info("BLIP-2 model loaded.")
+    return processor, model
+
+
+def quantize_language_model(model):
+    """
+    Quantize the linear layers of the BLIP-2 language model to int8, in place.
+
+    The OPT decoder holds most of the weights and runs once per generated
+    token, so dynamic int8 quantization (weights stored as int8, activations
+    quantized on the fly) cuts its memory about fourfold and speeds up CPU
+    decoding. The vision encoder and Q-Former run once per image and stay in
+    float32.
+    """
+    torch.ao.quantization.quantize_dynamic(
+        model.language_model, {torch.nn.Linear}, dtype=torch.qint8,
+        inplace=True)
+    return model
+
+
+def preprocess(processor, image_path):
+    """Load one image and turn it into BLIP-2 pixel values (runs in a thread)."""
+    with Image.open(image_path) as raw_image:
+        return processor.image_processor(
+            raw_image.convert('RGB'), return_tensors="pt")['pixel_values']
+
+
+def generate(processor, model, pixel_values):
+    """Caption a batch of preprocessed images."""
+    # int8 models keep a float32 vision encoder, so model.dtype still fits.
+    pixel_values = torch.cat(pixel_values).to(model.device, model.dtype)
+    with torch.no_grad():
+        generated_ids = model.generate(
+            pixel_values=pixel_values, max_new_tokens=50)
+    return [caption.strip() for caption in processor.batch_decode(
+        generated_ids, skip_special_tokens=True)]
+
+
+def caption_local(image_paths, batch_size, workers, loaded):
+    """
+    Caption images with `loaded`, a (processor, model) pair.
+
+    Images are decoded and preprocessed in a thread pool ahead of the model,
+    so loading the next batch overlaps with `generate` on the current one;
+    `generate` runs on batches of `batch_size` images.
+    """
+    results = [None] * len(image_paths)
+    processor, model = loaded
+    if model is None:
+        return results
+
+    batch_size = max(1, batch_size or getattr(settings, 'ML_BATCH_SIZE', 4))
+    workers = max(1, workers or getattr(settings, 'ML_PREPROCESS_WORKERS', 2))
+
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix='ml-preprocess') as executor:
+        # Keep up to two batches in flight ahead of the model.
+        pending = deque()
+        paths = iter(enumerate(image_paths))
+
+        def fill():
+            while len(pending) < 2 * batch_size:
+                item = next(paths, None)
+                if item is None:
+                    return
+                index, path = item
+                pending.append(
+                    (index, path, executor.submit(preprocess, processor, path)))
+
+        fill()
+        while pending:
+            indices, pixel_values = [], []
+            while pending and len(indices) < batch_size:
+                index, path, future = pending.popleft()
+                try:
+                    pixel_values.append(future.result())
+                    indices.append(index)
+                except (OSError, ValueError) as e:
+                    logger.error("Error classifying image %s: %s", path, e)
+            fill()
+            if not indices:
+                continue
+
+            try:
+                captions = generate(processor, model, pixel_values)
+            except (RuntimeError, ValueError, torch.cuda.OutOfMemoryError) as e:
+                logger.error("Error classifying %d images: %s",
+                             len(indices), e)
+                continue
+            for index, caption in zip(indices, captions):
+                logger.info("BLIP-2 Caption: %s", caption)
+                results[index] = caption
+    return results
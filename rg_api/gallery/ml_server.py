@@ -0,0 +1,177 @@
+"""
+Local inference server of the BLIP-2 tagger.
+
+The model takes gigabytes of memory and minutes to load, so instead of every
+web worker, job worker and command holding a copy, one ``run_ml_server``
+process owns it and serves captions over a Unix socket
+(``ML_SERVER_SOCKET``). `gallery.ml.classify_images` goes through it whenever
+the socket is configured.
+
+The protocol is one JSON object per line: a client connects, writes a request
+and reads one response before the connection is closed::
+
+    {"op": "ping"}                                 -> {"ok": true, ...}
+    {"op": "caption", "paths": [...], "batch_size": 4}
+                                                   -> {"ok": true, "captions": [...]}
+
+Failures come back as ``{"ok": false, "error": "..."}``. Images are passed as
+paths on the shared filesystem rather than as bytes, so the socket must only be
+reachable by the application user (the server creates it with mode 0660).
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Largest request line accepted by the server.
+MAX_REQUEST_BYTES = 1024 * 1024
+
+# Timeout of health checks, much shorter than a captioning request.
+PING_TIMEOUT = 2.0
+
+
+class MLServerUnavailable(Exception):
+    """The model server could not be reached or did not answer in time."""
+
+
+class MLServerError(Exception):
+    """The model server answered with an error."""
+
+
+def server_socket():
+    """Path of the model server socket, or '' when no server is used."""
+    return getattr(settings, 'ML_SERVER_SOCKET', '')
+
+
+def request(message, timeout=None, path=None):
+    """
+    Send one request to the model server and return its response.
+
+    Args:
+        message (dict): The request (see the module docstring).
+        timeout (float | None): Seconds to wait for the whole exchange
+            (default ``ML_SERVER_TIMEOUT``).
+        path (str | None): Socket path (default ``ML_SERVER_SOCKET``).
+
+    Raises:
+        MLServerUnavailable: The server is not running, or timed out.
+        MLServerError: The server rejected or failed the request.
+    """
+    path = path or server_socket()
+    if timeout is None:
+        timeout = getattr(settings, 'ML_SERVER_TIMEOUT', 300.0)
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(message).encode() + b'\n')
+            with sock.makefile('rb') as stream:
+                line = stream.readline()
+    except OSError as e:  # includes timeouts
+        raise MLServerUnavailable(f"{path}: {e}") from e
+
+    if not line:
+        raise MLServerUnavailable(f"{path}: connection closed")
+    try:
+        response = json.loads(line)
+    except ValueError as e:
+        raise MLServerError(f"Malformed response: {e}") from e
+    if not response.get('ok'):
+        raise MLServerError(response.get('error', 'unknown error'))
+    return response
+
+
+def caption_remote(image_paths, batch_size=None, timeout=None):
+    """Caption `image_paths` on the model server (None where it failed)."""
+    message = {'op': 'caption', 'paths': [str(path) for path in image_paths]}
+    if batch_size:
+        message['batch_size'] = batch_size
+    return request(message, timeout)['captions']
+
+
+def ping(timeout=PING_TIMEOUT, path=None):
+    """Status of the model server, or None if it is not reachable."""
+    try:
+        return request({'op': 'ping'}, timeout, path)
+    except (MLServerUnavailable, MLServerError):
+        return None
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answer the single request of a connection."""
+
+    def handle(self):
+        line = self.rfile.readline(MAX_REQUEST_BYTES + 1)
+        try:
+            if len(line) > MAX_REQUEST_BYTES:
+                raise ValueError("Request too large.")
+            response = self.server.dispatch(json.loads(line))
+        except (ValueError, TypeError, KeyError) as e:
+            response = {'ok': False, 'error': str(e)}
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception("Model server request failed")
+            response = {'ok': False, 'error': str(e) or type(e).__name__}
+        try:
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+        except OSError:
+            # The client gave up (timed out) before the answer was ready.
+            logger.warning("Model server client disconnected early.")
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server answering caption requests with one loaded model.
+
+    Connections are handled in threads, but `caption` calls are serialized:
+    the model runs one batch at a time anyway, and requests queue on the lock
+    instead of competing for the same cores.
+
+    Args:
+        path (str): Socket path; a stale socket file is replaced.
+        caption (callable): ``caption(paths, batch_size)`` returning one
+            caption (or None) per path.
+        info (dict | None): Extra fields of the ping response.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, caption, info=None):
+        if os.path.exists(path):
+            if ping(path=path) is not None:
+                raise OSError(f"A model server is already listening on {path}")
+            os.unlink(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.caption = caption
+        self.info = info or {}
+        self.lock = threading.Lock()
+        super().__init__(path, _RequestHandler)
+        os.chmod(path, 0o660)
+
+    def dispatch(self, message):
+        """Answer one decoded request."""
+        op = message.get('op')
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid(), **self.info}
+        if op == 'caption':
+            paths = message['paths']
+            if not isinstance(paths, list) or \
+                    not all(isinstance(path, str) for path in paths):
+                raise ValueError("paths must be a list of strings.")
+            batch_size = message.get('batch_size')
+            with self.lock:
+                captions = self.caption(paths, batch_size)
+            return {'ok': True, 'captions': captions}
+        raise ValueError(f"Unknown op {op!r}.")
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
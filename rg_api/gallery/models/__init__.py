@@ -1,3 +1,4 @@
 """ Initialize gallery models package. """
 from .gallery import Gallery
 from .image_gallery import ImageGallery
+from .processing_job import ProcessingJob
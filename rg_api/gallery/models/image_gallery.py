@@ -4,17 +4,20 @@ from datetime import datetime
 from PIL import Image, ExifTags
 from taggit.managers import TaggableManager
 from django.conf import settings
-from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
 from django.utils.html import mark_safe
 from django.utils.text import slugify
 
 from gallery.models import Gallery
 from gallery.exif_utils import get_gps_data
+from gallery.previews import enqueue_previews
+from utils.mixins import GeoIndexMixin
 
 logger = logging.getLogger(__name__)
 
 
-class ImageGallery(models.Model):
+class ImageGallery(GeoIndexMixin, models.Model):
     """
     Model representing an image within a gallery.
 
@@ -28,6 +31,8 @@ class ImageGallery(models.Model):
         image (ImageField): The image file.
         gallery (ForeignKey): Reference to the parent Gallery.
         tags (TaggableManager): Tags associated with the image.
+        tag_names (JSONField): Sorted names of `tags`, kept in sync by the
+            tag signals so listings need no join through the tag tables.
         width (IntegerField): Image width in pixels.
         height (IntegerField): Image height in pixels.
         author (ForeignKey): The user who uploaded the image.
@@ -44,6 +49,8 @@ class ImageGallery(models.Model):
         latitude (FloatField): GPS latitude coordinate.
         longitude (FloatField): GPS longitude coordinate.
         altitude (FloatField): GPS altitude in meters.
+        geohash (CharField): Indexed geohash of the coordinates (from
+            `GeoIndexMixin`); its prefixes are the cells of the map clusters.
         location (CharField): Human-readable location name.
         date (DateTimeField): Original photo capture date extracted from EXIF data.
     """
@@ -56,6 +63,7 @@ class ImageGallery(models.Model):
         Gallery, related_name='images', on_delete=models.CASCADE)
 
     tags = TaggableManager(blank=True)
+    tag_names = models.JSONField(default=list, blank=True, editable=False)
 
     width = models.IntegerField()
     height = models.IntegerField()
@@ -108,6 +116,55 @@ class ImageGallery(models.Model):
 
     image_tag.short_description = 'Image Preview'
 
+    @staticmethod
+    def sort_tag_names(names):
+        """Order tag names the way `tag_names` stores them."""
+        return sorted(names, key=lambda name: (name.casefold(), name))
+
+    @classmethod
+    def sync_tag_names(cls, pks=None, batch_size=500):
+        """
+        Recompute `tag_names` from the tag relations.
+
+        Only rows whose stored names differ are written, with `bulk_update`
+        (no save signals, `updated_at` untouched).
+
+        Args:
+            pks: Primary keys of the images to refresh; all images if None.
+            batch_size: Rows per UPDATE batch.
+
+        Returns:
+            int: Number of images whose tag names changed.
+        """
+        tagged = cls.tags.through.objects.filter(
+            content_type=ContentType.objects.get_for_model(cls))
+        images = cls.objects.only('pk', 'tag_names')
+        if pks is not None:
+            pks = list(pks)
+            tagged = tagged.filter(object_id__in=pks)
+            images = images.filter(pk__in=pks)
+
+        names = {}
+        for object_id, name in tagged.values_list('object_id', 'tag__name'):
+            names.setdefault(object_id, []).append(name)
+
+        changed = []
+        for image in images.iterator():
+            current = cls.sort_tag_names(names.get(image.pk, []))
+            if image.tag_names != current:
+                image.tag_names = current
+                changed.append(image)
+        cls.objects.bulk_update(changed, ['tag_names'], batch_size=batch_size)
+        return len(changed)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored image name to detect file changes on save."""
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance._stored_image = instance.image.name
+        return instance
+
     def save(self, *args, **kwargs):
         """Save method with image metadata extraction."""
         if not self.slug:
@@ -141,8 +198,19 @@ class ImageGallery(models.Model):
             except (OSError, ValueError, TypeError, AttributeError) as e:
                 logger.error("Error processing image %s: %s", self.title, e)
 
+        stored_image = getattr(self, '_stored_image', None)
+        image_changed = bool(self.image) and self.image.name != stored_image
+
         super().save(*args, **kwargs)
 
+        if image_changed:
+            self._stored_image = self.image.name
+            # Render the width ladder in the background once the row is
+            # visible; a replaced file invalidates the existing previews.
+            pk, replaced = self.pk, bool(stored_image)
+            transaction.on_commit(
+                lambda: enqueue_previews(pk, force=replaced))
+
     def extract_exif_data(self, exif_data):
         """
         Extract EXIF metadata from image data and populate instance attributes.
@@ -0,0 +1,67 @@
+""" ProcessingJob model: persistent queue of background image work. """
+from django.db import models
+
+from gallery.models.image_gallery import ImageGallery
+
+
+class ProcessingJob(models.Model):
+    """
+    A unit of background work on an image (see `gallery.jobs`).
+
+    Jobs are created pending and claimed by a ``run_image_jobs`` worker,
+    which marks them running and then done, or pending again until
+    ``GALLERY_JOB_MAX_ATTEMPTS`` is reached and they are failed.
+
+    Attributes:
+        image (ForeignKey): The image to process.
+        kind (CharField): What to do: tag, extract GPS data or render previews.
+        status (CharField): Pending, running, done or failed.
+        payload (JSONField): Options of the job (e.g. ``force`` for previews).
+        attempts (PositiveSmallIntegerField): Number of times it was claimed.
+        error (TextField): Error of the last failed attempt.
+        worker (CharField): Worker that claimed it last.
+        created_at (DateTimeField): When the job was queued.
+        started_at (DateTimeField): When the last attempt started.
+        finished_at (DateTimeField): When the job was done or failed.
+    """
+    class Kind(models.TextChoices):
+        """Kinds of job."""
+        TAG = 'tag', 'Auto-tag'
+        GPS = 'gps', 'GPS extraction'
+        PREVIEWS = 'previews', 'Previews'
+
+    class Status(models.TextChoices):
+        """Lifecycle of a job."""
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    image = models.ForeignKey(
+        ImageGallery, related_name='jobs', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING)
+    payload = models.JSONField(default=dict, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} of {self.image_id} ({self.status})"
+
+    class Meta:
+        """
+        Metadata for the ProcessingJob model.
+
+        Workers claim pending jobs oldest first, hence the (status, created_at)
+        index.
+        """
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
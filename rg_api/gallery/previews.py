@@ -0,0 +1,226 @@
+"""
+Upload-time generation of responsive image previews.
+
+When an image is uploaded (or its file replaced) the standard width ladder is
+rendered in the background, by the job worker or an in-process pool, so the
+`jpeg` endpoint of `ImageGalleryViewSet` normally only streams a file that
+already exists. Widths outside the ladder are still rendered on demand by the
+view.
+
+Preview files are content-addressed (see `utils.previews`): their name embeds
+a hash of the source file and of the encoder settings. Each width is rendered
+in every format of ``GALLERY_PREVIEW_FORMATS`` the encoder supports.
+"""
+import glob
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from utils.image_optimizer import ImageOptimizer
+from utils.previews import (
+    PREVIEW_FORMATS, preview_filename, preview_key, purge_stale_previews,
+    render_preview_file, source_digest, supported_formats)
+
+logger = logging.getLogger(__name__)
+
+# Widths requested by the frontend (srcset) and rebuilt by regenerate_previews.
+PREVIEW_WIDTHS = [400, 500, 600, 700, 800, 900, 1000, 1200, 2500]
+
+_executor_lock = threading.Lock()
+_pending_lock = threading.Lock()
+_pending = set()
+
+
+def preview_dir():
+    """Directory holding generated previews."""
+    return os.path.join(settings.MEDIA_ROOT, 'preview')
+
+
+def preview_formats():
+    """Formats rendered ahead of time, in order of preference."""
+    wanted = getattr(settings, 'GALLERY_PREVIEW_FORMATS', list(PREVIEW_FORMATS))
+    return [fmt for fmt in supported_formats() if fmt in wanted]
+
+
+def preview_path(source_path, pk, width, digest=None, fmt='WEBP'):
+    """Path of the `fmt` preview of image `pk` at `width` pixels."""
+    if digest is None:
+        digest = source_digest(source_path)
+    return preview_filename(
+        preview_dir(), pk, width, preview_key(digest, width, fmt), fmt)
+
+
+def delete_previews(pk):
+    """Remove every generated preview of image `pk`."""
+    patterns = [
+        os.path.join(preview_dir(), f"{pk}_*.{extension}")
+        for extension, _ in PREVIEW_FORMATS.values()
+    ]
+    for pattern in patterns:
+        for filepath in glob.glob(pattern):
+            try:
+                os.remove(filepath)
+            except OSError as e:
+                logger.error("Error deleting preview %s: %s", filepath, e)
+
+
+def render_preview(source_path, pk, width, fmt='WEBP'):
+    """
+    Return the `fmt` preview of image `pk` at `width`, rendering it if missing.
+
+    Concurrent calls for the same preview (from the upload workers or from
+    requests) render it only once; see `utils.single_flight`.
+
+    Returns:
+        str | None: The preview path, or None if the source could not be read.
+    """
+    return render_preview_file(source_path, preview_dir(), pk, width, fmt)
+
+
+def generate_previews(pk, widths=None, force=False):
+    """
+    Render the width ladder of image `pk` in every preview format.
+
+    Args:
+        pk (int): Primary key of the `ImageGallery` to render.
+        widths (list[int] | None): Widths to render, `PREVIEW_WIDTHS` by default.
+        force (bool): Drop existing previews first (the source changed).
+
+    Returns:
+        int: Number of previews written.
+    """
+    from gallery.models import ImageGallery  # avoid a circular import
+
+    image_obj = ImageGallery.objects.filter(pk=pk).only('image').first()
+    if image_obj is None or not image_obj.image:
+        return 0
+    source_path = image_obj.image.path
+    if not os.path.exists(source_path):
+        logger.warning("Source image not found for ID %s", pk)
+        return 0
+
+    os.makedirs(preview_dir(), exist_ok=True)
+    if force:
+        delete_previews(pk)
+
+    digest = source_digest(source_path)
+    missing = [
+        (width, fmt)
+        for width in widths or PREVIEW_WIDTHS
+        for fmt in preview_formats()
+        if not os.path.exists(preview_path(source_path, pk, width, digest, fmt))
+    ]
+    return _write_variants(source_path, pk, missing)
+
+
+def write_previews(source_path, pk, widths, formats=None):
+    """
+    Render `widths` of image `pk` from `source_path`, replacing existing files.
+
+    Every width is rendered in each of `formats` (`preview_formats()` by
+    default). The original is decoded once for all of them; each file is
+    written to a temporary path and renamed into place. Safe to call from
+    worker processes since it does not touch the database.
+
+    Returns:
+        int: Number of previews written.
+    """
+    formats = preview_formats() if formats is None else formats
+    return _write_variants(
+        source_path, pk, [(width, fmt) for width in widths for fmt in formats])
+
+
+def _write_variants(source_path, pk, variants):
+    """Render the (width, format) `variants` of image `pk`."""
+    if not variants:
+        return 0
+    os.makedirs(preview_dir(), exist_ok=True)
+    digest = source_digest(source_path)
+    paths = {(width, fmt): preview_path(source_path, pk, width, digest, fmt)
+             for width, fmt in variants}
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    temp_paths = {variant: path + suffix for variant, path in paths.items()}
+    written = 0
+    try:
+        results = ImageOptimizer.compress_and_resize_variants(
+            source_path, variants, output_paths=temp_paths) or {}
+        for width, fmt in results:
+            path = paths[(width, fmt)]
+            os.replace(temp_paths[(width, fmt)], path)
+            purge_stale_previews(preview_dir(), pk, width, path, fmt)
+            written += 1
+    finally:
+        for temp_path in temp_paths.values():
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return written
+
+
+def _get_executor():
+    """Return the process-wide preview worker pool."""
+    executor = getattr(_get_executor, 'executor', None)
+    if executor is not None:
+        return executor
+    with _executor_lock:
+        executor = getattr(_get_executor, 'executor', None)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'GALLERY_PREVIEW_WORKERS', 2),
+                thread_name_prefix='gallery-previews')
+            _get_executor.executor = executor
+    return executor
+
+
+def _run(pk, force):
+    """Worker entry point: render the ladder and release the pending slot."""
+    try:
+        generate_previews(pk, force=force)
+    except Exception as e:
+        logger.error("Error generating previews for %s: %s", pk, e)
+    finally:
+        with _pending_lock:
+            _pending.discard(pk)
+        close_old_connections()
+
+
+def enqueue_previews(pk, force=False):
+    """
+    Schedule generation of the width ladder of image `pk`.
+
+    With ``GALLERY_JOB_QUEUE`` enabled the work is recorded as a job for the
+    ``run_image_jobs`` worker (see `gallery.jobs`); otherwise it runs in the
+    in-process worker pool. Requests for an image that is already queued are
+    ignored. Does nothing when ``GALLERY_PRECOMPUTE_PREVIEWS`` is disabled.
+
+    Returns:
+        bool: True if a job was queued.
+    """
+    if not getattr(settings, 'GALLERY_PRECOMPUTE_PREVIEWS', True):
+        return False
+    if getattr(settings, 'GALLERY_JOB_QUEUE', True):
+        from gallery.jobs import enqueue_jobs  # avoid a circular import
+        from gallery.models import ProcessingJob
+        if force:
+            # A pending job must also drop the previews of the old file.
+            ProcessingJob.objects.filter(
+                image_id=pk, kind=ProcessingJob.Kind.PREVIEWS,
+                status=ProcessingJob.Status.PENDING,
+            ).update(payload={'force': True})
+        return bool(enqueue_jobs(
+            [pk], [ProcessingJob.Kind.PREVIEWS], {'force': force}))
+    with _pending_lock:
+        if pk in _pending:
+            return False
+        _pending.add(pk)
+    try:
+        _get_executor().submit(_run, pk, force)
+    except RuntimeError:
+        # Interpreter shutting down; previews will be rendered on demand.
+        with _pending_lock:
+            _pending.discard(pk)
+        return False
+    return True
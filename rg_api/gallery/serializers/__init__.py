@@ -1,4 +1,7 @@
 """ Serializers for Gallery API endpoints. """
 from .gallery_serializer import GallerySerializer
 from .image_gallery_serializer import ImageGallerySerializer
-from .image_location_serializer import ImageLocationSerializer
+from .image_location_serializer import (
+    ImageLocationClusterSerializer,
+    ImageLocationSerializer,
+)
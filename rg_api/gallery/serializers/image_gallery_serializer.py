@@ -13,12 +13,18 @@ class ImageGallerySerializer(serializers.HyperlinkedModelSerializer):
 
     Attributes:
         url (HyperlinkedIdentityField): URL to the detail view of the image.
+        original (HyperlinkedIdentityField): Download URL of the original,
+            with HTTP Range support.
+        tags (ListField): Tag names, read from the denormalized `tag_names`.
         author (StringRelatedField): String representation of the author.
     """
     url = serializers.HyperlinkedIdentityField(
         read_only=True, view_name='image-detail', lookup_field='slug')
+    original = serializers.HyperlinkedIdentityField(
+        read_only=True, view_name='image-original', lookup_field='slug')
 
-    tags = serializers.StringRelatedField(many=True, read_only=True)
+    tags = serializers.ListField(
+        source='tag_names', child=serializers.CharField(), read_only=True)
     author = serializers.StringRelatedField(read_only=True)
 
     class Meta:
@@ -36,6 +42,7 @@ class ImageGallerySerializer(serializers.HyperlinkedModelSerializer):
             'title',
             'slug',
             'image',
+            'original',
             'gallery',
             'tags',
             'author',
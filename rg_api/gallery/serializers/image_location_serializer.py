@@ -32,3 +32,18 @@ class ImageLocationSerializer(serializers.ModelSerializer):
         # Assuming we can use the same generic view pattern
         base_url = getattr(settings, 'IMAGE_GENERATOR_BASE_URL', '')
         return f"{base_url}/{obj.slug}/width/300"
+
+
+class ImageLocationClusterSerializer(serializers.Serializer):
+    """
+    Serializer for a cluster of image locations (one geohash cell).
+    """
+    geohash = serializers.CharField()
+    count = serializers.IntegerField()
+    latitude = serializers.FloatField()
+    longitude = serializers.FloatField()
+    bounds = serializers.ListField(
+        child=serializers.FloatField(), min_length=4, max_length=4,
+        help_text='[min_lon, min_lat, max_lon, max_lat] of the images.')
+    image = ImageLocationSerializer(
+        allow_null=True, help_text='The image of a single-image cluster.')
@@ -1,16 +1,26 @@
 """
 Gallery signals.
 """
-import os
-import glob
 import logging
-from django.conf import settings
-from django.db.models.signals import post_delete
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save)
 from django.dispatch import receiver
-from gallery.models import ImageGallery
+from taggit.models import Tag
+from gallery.locations import remove_location, update_location
+from gallery.models import Gallery, ImageGallery
+from gallery.previews import delete_previews
+from utils.response_cache import (
+    instance_tags, invalidate_on_commit, model_tag, remember_lookups)
 
 logger = logging.getLogger(__name__)
 
+# Lookup fields of the cached detail endpoints, per model.
+CACHE_LOOKUPS = {
+    Gallery: ('pk',),
+    ImageGallery: ('slug',),
+}
+
 
 @receiver(post_delete, sender=ImageGallery)
 def delete_image_on_delete(instance, **_kwargs):
@@ -30,21 +40,95 @@ def delete_image_on_delete(instance, **_kwargs):
         except (OSError, ValueError) as e:
             logger.error("Error deleting file for %s: %s", instance.title, e)
 
-    # 2. Delete generated previews
+    # 2. Delete generated previews ({pk}_*.avif, .webp and .jpg)
     try:
-        preview_dir = os.path.join(settings.MEDIA_ROOT, 'preview')
-        # Pattern matches {pk}_*.jpg and {pk}_*.webp
-        patterns = [
-            os.path.join(preview_dir, f"{instance.pk}_*.jpg"),
-            os.path.join(preview_dir, f"{instance.pk}_*.webp"),
-        ]
-
-        for pattern in patterns:
-            for filepath in glob.glob(pattern):
-                try:
-                    os.remove(filepath)
-                except OSError as e:
-                    logger.error("Error deleting preview %s: %s", filepath, e)
+        delete_previews(instance.pk)
     except (OSError, ValueError) as e:
         logger.error("Error cleaning up previews for %s: %s",
                      instance.title, e)
+
+
+@receiver(post_save, sender=ImageGallery)
+def update_cached_location(instance, **_kwargs):
+    """Patch the map snapshot once the saved image is committed."""
+    transaction.on_commit(lambda: update_location(instance))
+
+
+@receiver(post_delete, sender=ImageGallery)
+def remove_cached_location(instance, **_kwargs):
+    """Drop a deleted image from the map snapshot once committed."""
+    pk = instance.pk
+    transaction.on_commit(lambda: remove_location(pk))
+
+
+@receiver(pre_save, sender=Gallery)
+@receiver(pre_save, sender=ImageGallery)
+def remember_cache_lookups(sender, instance, **_kwargs):
+    """Record lookup values a save may change, to purge their cached details."""
+    remember_lookups(instance, CACHE_LOOKUPS[sender])
+
+
+@receiver(post_save, sender=Gallery)
+@receiver(post_delete, sender=Gallery)
+@receiver(post_save, sender=ImageGallery)
+@receiver(post_delete, sender=ImageGallery)
+def invalidate_cached_responses(sender, instance, **_kwargs):
+    """Purge the cached list and detail responses of a changed instance."""
+    # Tags are taken now: a deleted instance loses its pk before the commit.
+    invalidate_on_commit(*instance_tags(instance, CACHE_LOOKUPS[sender]))
+
+
+@receiver(m2m_changed, sender=ImageGallery.tags.through)
+def sync_tag_names(instance, action, pk_set, **_kwargs):
+    """Refresh the denormalized `tag_names` when the tags of an image change."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, ImageGallery):
+        names = ImageGallery.sort_tag_names(instance.tags.names())
+        ImageGallery.objects.filter(pk=instance.pk).update(tag_names=names)
+        # Keep the in-memory instance current for a later save().
+        instance.tag_names = names
+    elif pk_set:
+        ImageGallery.sync_tag_names(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def sync_renamed_tag_names(instance, created, **_kwargs):
+    """Rewrite `tag_names` of the images carrying a renamed tag."""
+    if not created:
+        ImageGallery.sync_tag_names(
+            ImageGallery.objects.filter(tags=instance).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_images(instance, **_kwargs):
+    """Record the images of a tag about to be deleted."""
+    instance._tagged_image_pks = list(
+        ImageGallery.objects.filter(tags=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def sync_deleted_tag_names(instance, **_kwargs):
+    """Drop a deleted tag from the `tag_names` of its former images."""
+    pks = getattr(instance, '_tagged_image_pks', None)
+    if pks:
+        ImageGallery.sync_tag_names(pks)
+
+
+@receiver(m2m_changed, sender=ImageGallery.tags.through)
+def invalidate_cached_tags(instance, action, **_kwargs):
+    """Purge cached responses when the tags of an image change."""
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, ImageGallery):
+        invalidate_on_commit(
+            *instance_tags(instance, CACHE_LOOKUPS[ImageGallery]))
+    else:
+        invalidate_on_commit(model_tag(ImageGallery))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_cached_tag_names(**_kwargs):
+    """Purge responses showing tag names when a tag is renamed or removed."""
+    invalidate_on_commit(model_tag(Tag))
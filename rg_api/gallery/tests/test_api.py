@@ -3,10 +3,15 @@ Tests for the Gallery API.
 """
 import io
 import tempfile
+from datetime import datetime, timezone
 from unittest.mock import patch
+from urllib.parse import urlsplit
 
 from PIL import Image
+from django.db import connection
+from django.db.models import F
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APITestCase
@@ -18,7 +23,8 @@ User = get_user_model()
 
 
 @override_settings(
-    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYTICS_ASYNC_WRITES=False,
 )
 class GalleryAPITest(APITestCase):
     """Test suite for the Gallery API endpoints."""
@@ -52,7 +58,8 @@ class GalleryAPITest(APITestCase):
 
 
 @override_settings(
-    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYTICS_ASYNC_WRITES=False,
 )
 class ImageGalleryAPITest(APITestCase):
     """Test suite for image preview endpoint behavior."""
@@ -95,18 +102,20 @@ class ImageGalleryAPITest(APITestCase):
         )
 
     @override_settings(IMAGE_GENERATOR_MAX_WIDTH=4000)
-    @patch('gallery.views.image_gallery_view.ImageOptimizer.compress_and_resize')
+    @patch('gallery.previews.ImageOptimizer.compress_and_resize')
     def test_width_3840_returns_image(self, mock_resize):
         """Requesting width 3840 should be allowed and return a webp response."""
 
-        def fake_resize(_image_path, output_path, width):
+        def fake_resize(_image_path, output_path, width, **_options):
             with open(output_path, 'wb') as out_file:
                 out_file.write(b'RIFFxxxxWEBP')
             return True
 
         mock_resize.side_effect = fake_resize
 
-        response = self.client.get(f'/portfolio/images/{self.image.slug}/width/3840')
+        response = self.client.get(
+            f'/portfolio/images/{self.image.slug}/width/3840',
+            HTTP_ACCEPT='image/webp,image/*,*/*;q=0.8')
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response['Content-Type'], 'image/webp')
@@ -116,3 +125,130 @@ class ImageGalleryAPITest(APITestCase):
         """Requesting a width above the configured max should return 404."""
         response = self.client.get(f'/portfolio/images/{self.image.slug}/width/5000')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_preview_supports_conditional_get(self):
+        """A matching If-None-Match is answered with 304 and no body."""
+        url = f'/portfolio/images/{self.image.slug}/width/400'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertIn('max-age', response['Cache-Control'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(b''.join(response), b'')
+
+    def test_preview_format_follows_accept(self):
+        """AVIF and WebP are served when named in Accept, JPEG otherwise."""
+        url = f'/portfolio/images/{self.image.slug}/width/300'
+        cases = [
+            ('image/avif,image/webp,image/*,*/*;q=0.8', 'image/avif'),
+            ('image/avif;q=0,image/webp', 'image/webp'),
+            ('image/*,*/*;q=0.8', 'image/jpeg'),
+            (None, 'image/jpeg'),
+        ]
+        etags = set()
+        for accept, content_type in cases:
+            extra = {'HTTP_ACCEPT': accept} if accept else {}
+            response = self.client.get(url, **extra)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, accept)
+            self.assertEqual(response['Content-Type'], content_type)
+            self.assertIn('Accept', response['Vary'])
+            etags.add(response['ETag'])
+        # One artifact, hence one ETag, per format.
+        self.assertEqual(len(etags), 3)
+
+    def test_preview_offloaded_to_nginx(self):
+        """With the nginx backend the body is left to X-Accel-Redirect."""
+        url = f'/portfolio/images/{self.image.slug}/width/300'
+        with self.settings(MEDIA_SERVE_BACKEND='nginx',
+                           MEDIA_SERVE_INTERNAL_URL='/internal-media/'):
+            response = self.client.get(url, HTTP_ACCEPT='image/webp')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertTrue(response['X-Accel-Redirect'].startswith(
+            f'/internal-media/preview/{self.image.pk}_300_'))
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+    def test_original_supports_range_requests(self):
+        """The original is served whole, or in 206 parts for Range requests."""
+        url = f'/portfolio/images/{self.image.slug}/original'
+        with open(self.image.image.path, 'rb') as source:
+            data = source.read()
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), data)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(data)}')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), data[10:20])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), data[-5:])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(data)}-')
+        self.assertEqual(response.status_code,
+                         status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_stale_if_range_gets_full_response(self):
+        """A Range whose If-Range validator no longer matches gets the full file."""
+        url = f'/portfolio/images/{self.image.slug}/original'
+        response = self.client.get(url, HTTP_RANGE='bytes=0-9',
+                                   HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_RANGE='bytes=0-9',
+                                   HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+
+    def test_keyset_pagination_walks_feed(self):
+        """Cursor pages follow (date, id) desc, NULL dates last, without COUNT."""
+        dates = [datetime(2024, 5, 1, 10, 0, 0, 123456, tzinfo=timezone.utc),
+                 datetime(2024, 5, 1, 10, 0, 0, 123456, tzinfo=timezone.utc),
+                 datetime(2023, 1, 1, tzinfo=timezone.utc), None, None]
+        ImageGallery.objects.filter(pk=self.image.pk).update(
+            date=datetime(2025, 1, 1, tzinfo=timezone.utc))
+        for index, date in enumerate(dates):
+            image = ImageGallery.objects.create(
+                title=f'Keyset {index}', gallery=self.gallery,
+                author=self.user, width=10, height=10)
+            ImageGallery.objects.filter(pk=image.pk).update(date=date)
+        expected = list(ImageGallery.objects.order_by(
+            F('date').desc(nulls_last=True), '-id').values_list('id', flat=True))
+
+        seen = []
+        url = '/portfolio/images?cursor=&page_size=2'
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                response = self.client.get(url, HTTP_ACCEPT='application/json')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertNotIn('count', response.data)
+                seen.extend(item['id'] for item in response.data['results'])
+                next_link = response.data['next']
+                # Links carry FORCE_SCRIPT_NAME; keep the routed path.
+                url = next_link and \
+                    f"/portfolio/images?{urlsplit(next_link).query}"
+
+        self.assertEqual(seen, expected)
+        self.assertFalse(any('COUNT(' in query['sql'].upper()
+                             for query in queries.captured_queries))
+
+    def test_invalid_cursor_returns_404(self):
+        """Tampered cursors are rejected."""
+        response = self.client.get('/portfolio/images?cursor=not-a-cursor',
+                                   HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_mode_is_default(self):
+        """Without a cursor the feed keeps page-number pagination."""
+        response = self.client.get('/portfolio/images',
+                                   HTTP_ACCEPT='application/json')
+        self.assertEqual(response.data['count'], 1)
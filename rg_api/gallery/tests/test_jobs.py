@@ -0,0 +1,146 @@
+"""
+Tests for the background image job queue.
+"""
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from gallery.jobs import claim_jobs, enqueue_jobs, requeue_stale_jobs, run_jobs
+from gallery.models import Gallery, ImageGallery, ProcessingJob
+from gallery.tests.test_previews import make_upload
+
+User = get_user_model()
+
+Kind = ProcessingJob.Kind
+Status = ProcessingJob.Status
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYTICS_ASYNC_WRITES=False,
+    GALLERY_JOB_QUEUE=True,
+    GALLERY_JOB_MAX_ATTEMPTS=2,
+)
+class ProcessingJobTest(TestCase):
+    """Test suite for gallery.jobs."""
+
+    def setUp(self):
+        """Set up an isolated media root and two uploaded images."""
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_dir.cleanup)
+        self.media_override = override_settings(MEDIA_ROOT=self.media_dir.name)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+
+        self.user = User.objects.create_user(
+            username='jobs', password='password')
+        self.gallery = Gallery.objects.create(
+            title='Jobs', tag='jobs', author=self.user)
+        with patch('gallery.models.image_gallery.enqueue_previews'):
+            self.images = [
+                ImageGallery.objects.create(
+                    title=f'Job {index}', image=make_upload(f'job{index}.jpg'),
+                    gallery=self.gallery, author=self.user)
+                for index in range(2)]
+        self.ids = [image.pk for image in self.images]
+
+    def test_enqueue_skips_pending_duplicates(self):
+        """An image gets one pending job per kind."""
+        self.assertEqual(enqueue_jobs(self.ids, [Kind.TAG, Kind.GPS]), 4)
+        self.assertEqual(enqueue_jobs(self.ids, [Kind.TAG]), 0)
+        self.assertEqual(
+            ProcessingJob.objects.filter(status=Status.PENDING).count(), 4)
+
+    def test_claim_is_exclusive(self):
+        """Claimed jobs are running and not handed to another worker."""
+        enqueue_jobs(self.ids, [Kind.TAG])
+        first = claim_jobs('worker-a', 10)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(claim_jobs('worker-b', 10), [])
+
+        job = ProcessingJob.objects.get(pk=first[0].pk)
+        self.assertEqual(
+            (job.status, job.worker, job.attempts),
+            (Status.RUNNING, 'worker-a', 1))
+
+    @patch('gallery.jobs.classify_images')
+    def test_tag_jobs_are_batched(self, classify):
+        """Tag jobs reach the tagger in one call and are marked done."""
+        classify.return_value = [['fox'], ['forest', 'snow']]
+        enqueue_jobs(self.ids, [Kind.TAG])
+
+        counts = run_jobs(claim_jobs('worker', 10))
+
+        self.assertEqual(counts, {Status.DONE: 2})
+        self.assertEqual(classify.call_count, 1)
+        self.assertEqual(len(classify.call_args.args[0]), 2)
+        self.images[1].refresh_from_db()
+        self.assertEqual(self.images[1].tag_names, ['forest', 'snow'])
+
+    @patch('gallery.jobs.classify_images')
+    def test_only_if_untagged(self, classify):
+        """Tagged images are skipped when the job asks for it."""
+        self.images[0].tags.add('kept')
+        classify.return_value = [['new']]
+        enqueue_jobs(self.ids, [Kind.TAG], {'only_if_untagged': True})
+
+        run_jobs(claim_jobs('worker', 10))
+
+        self.assertEqual(len(classify.call_args.args[0]), 1)
+        self.images[0].refresh_from_db()
+        self.assertEqual(self.images[0].tag_names, ['kept'])
+
+    @patch('gallery.jobs.get_gps_data', side_effect=OSError('unreadable'))
+    def test_failures_are_retried_then_failed(self, _get_gps_data):
+        """A failing job is requeued until it runs out of attempts."""
+        enqueue_jobs(self.ids[:1], [Kind.GPS])
+
+        self.assertEqual(run_jobs(claim_jobs('worker', 10)),
+                         {Status.PENDING: 1})
+        self.assertEqual(run_jobs(claim_jobs('worker', 10)),
+                         {Status.FAILED: 1})
+        job = ProcessingJob.objects.get()
+        self.assertEqual((job.attempts, job.error), (2, 'unreadable'))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_stale_jobs_are_requeued(self):
+        """Jobs of a dead worker go back to pending after the timeout."""
+        enqueue_jobs(self.ids[:1], [Kind.PREVIEWS])
+        claim_jobs('dead', 10)
+        self.assertEqual(requeue_stale_jobs(timeout=60), 0)
+
+        ProcessingJob.objects.update(
+            started_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(requeue_stale_jobs(timeout=60), 1)
+        self.assertEqual(ProcessingJob.objects.get().status, Status.PENDING)
+
+    @patch('gallery.jobs.generate_previews', return_value=3)
+    def test_saving_queues_previews_for_the_worker(self, generate):
+        """Uploads queue a previews job that run_image_jobs --once drains."""
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ImageGallery.objects.create(
+                title='Queued', image=make_upload('queued.jpg'),
+                gallery=self.gallery, author=self.user)
+        job = ProcessingJob.objects.get(image=image)
+        self.assertEqual((job.kind, job.payload), (Kind.PREVIEWS, {'force': False}))
+        generate.assert_not_called()
+
+        call_command('run_image_jobs', '--once', stdout=StringIO())
+
+        generate.assert_called_once_with(image.pk, force=False)
+        self.assertEqual(ProcessingJob.objects.get().status, Status.DONE)
+
+    @override_settings(GALLERY_JOB_QUEUE=False)
+    @patch('gallery.jobs.classify_images', return_value=[['inline']])
+    def test_disabled_queue_runs_inline(self, _classify):
+        """Without the queue the work runs immediately and leaves no rows."""
+        self.assertEqual(enqueue_jobs(self.ids[:1], [Kind.TAG]), 1)
+        self.assertFalse(ProcessingJob.objects.exists())
+        self.images[0].refresh_from_db()
+        self.assertEqual(self.images[0].tag_names, ['inline'])
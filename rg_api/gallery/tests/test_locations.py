@@ -0,0 +1,171 @@
+"""
+Tests for the precomputed map locations.
+"""
+import gzip
+import json
+import tempfile
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from gallery import locations
+from gallery.models import Gallery, ImageGallery
+from utils import geohash
+
+User = get_user_model()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYTICS_ASYNC_WRITES=False,
+)
+class ImageLocationTest(APITestCase):
+    """Test suite for gallery.locations through the map endpoint."""
+
+    url = '/portfolio/images/locations'
+
+    def setUp(self):
+        """Set up an empty cache, a gallery and one geotagged image."""
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_dir.cleanup)
+        self.media_override = override_settings(MEDIA_ROOT=self.media_dir.name)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='mapuser', password='password')
+        self.gallery = Gallery.objects.create(
+            title='Map', tag='map', author=self.user)
+        self.image = self.create_image('Rome', 41.9, 12.5)
+        self.create_image('Nowhere', None, None)
+
+    def create_image(self, title, latitude, longitude):
+        """Create an image at the given coordinates."""
+        with self.captureOnCommitCallbacks(execute=True):
+            return ImageGallery.objects.create(
+                title=title, gallery=self.gallery, author=self.user,
+                width=10, height=10, latitude=latitude, longitude=longitude)
+
+    def get_pins(self, **headers):
+        """GET the map pins and decode the JSON body."""
+        response = self.client.get(self.url, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)
+
+    def test_lists_geotagged_images(self):
+        """Only images with coordinates are returned, with a validator."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.has_header('ETag'))
+        pins = json.loads(response.content)
+        self.assertEqual([pin['title'] for pin in pins], ['Rome'])
+        self.assertEqual(pins[0]['latitude'], 41.9)
+
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_gzip_body(self):
+        """Clients accepting gzip get the precompressed body."""
+        for index in range(5):
+            self.create_image(f'Pin {index}', 45.0 + index, 9.0)
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        pins = json.loads(gzip.decompress(response.content))
+        self.assertEqual(pins, self.get_pins())
+
+    def test_snapshot_is_patched_on_save_and_delete(self):
+        """Saves and deletes update the snapshot without a rebuild."""
+        self.get_pins()
+        # Bypasses the signals: proves later reads come from the snapshot.
+        ImageGallery.objects.filter(pk=self.image.pk).update(title='Direct')
+        self.assertEqual(self.get_pins()[0]['title'], 'Rome')
+
+        milan = self.create_image('Milan', 45.46, 9.19)
+        self.assertEqual(
+            [pin['title'] for pin in self.get_pins()], ['Rome', 'Milan'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            milan.latitude = milan.longitude = None
+            milan.save()
+        self.assertEqual([pin['title'] for pin in self.get_pins()], ['Rome'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.image.delete()
+        self.assertEqual(self.get_pins(), [])
+
+    def test_concurrent_build_waits_for_the_holder(self):
+        """A miss during another build waits for its snapshot, no query."""
+        cache.set(locations.LOCK_KEY, 'builder')
+        snapshot = locations._snapshot({})
+        timer = threading.Timer(
+            0.2, cache.set, (locations.SNAPSHOT_KEY, snapshot, None))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(locations.build_snapshot(), snapshot)
+
+    def test_lock_is_only_released_by_its_holder(self):
+        """A writer whose lock expired does not drop the next holder's."""
+        token = locations._acquire(0)
+        self.assertIsNone(locations._acquire(0))
+        cache.set(locations.LOCK_KEY, 'next-holder')
+        locations._release(token)
+        self.assertEqual(cache.get(locations.LOCK_KEY), 'next-holder')
+
+    def test_geojson(self):
+        """The GeoJSON variant holds one Point feature per image."""
+        response = self.client.get(f'{self.url}/geojson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        collection = json.loads(response.content)
+        self.assertEqual(collection['type'], 'FeatureCollection')
+        feature = collection['features'][0]
+        self.assertEqual(feature['id'], self.image.pk)
+        self.assertEqual(feature['geometry']['coordinates'], [12.5, 41.9])
+        self.assertEqual(feature['properties']['slug'], self.image.slug)
+
+    def test_geohash_maintained_on_save(self):
+        """Saving encodes the coordinates; removing them clears the geohash."""
+        self.assertEqual(
+            geohash.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(self.image.geohash, geohash.encode(41.9, 12.5))
+
+        self.image.latitude = self.image.longitude = None
+        self.image.save()
+        self.assertEqual(self.image.geohash, '')
+
+    def test_viewport_clusters(self):
+        """A bbox and zoom return per-cell counts inside the viewport."""
+        self.create_image('Rome 2', 41.9005, 12.5005)
+        self.create_image('Milan', 45.46, 9.19)
+        self.create_image('Paris', 48.85, 2.35)
+
+        response = self.client.get(
+            self.url, {'bbox': '6,36,19,47.5', 'zoom': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        cells = {cell['count']: cell for cell in response.json()}
+        self.assertEqual(sorted(cells), [1, 2])
+        self.assertEqual(cells[2]['image'], None)
+        self.assertEqual(cells[1]['image']['title'], 'Milan')
+
+        response = self.client.get(
+            self.url, {'bbox': '12.499,41.899,12.501,41.901', 'zoom': 20})
+        self.assertEqual(
+            sorted(cell['image']['title'] for cell in response.json()),
+            ['Rome', 'Rome 2'])
+
+    def test_viewport_validation(self):
+        """Malformed or partial viewports are rejected."""
+        for params in ({'bbox': '1,2,3'}, {'bbox': '1,2,3,4', 'zoom': 'x'},
+                       {'bbox': '0,50,10,40', 'zoom': 3}, {'zoom': 3}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST, params)
@@ -0,0 +1,328 @@
+"""
+Tests for the batched BLIP-2 tagger.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch
+
+import torch
+from PIL import Image
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from transformers import Blip2Config, Blip2ForConditionalGeneration
+
+from gallery import ml
+from gallery.ml_server import (
+    MLServerError, MLServerUnavailable, ModelServer, ping, request)
+from gallery.models import Gallery, ImageGallery
+from gallery.tests.test_previews import make_upload
+
+
+class FakeProcessor:
+    """Processor whose 'pixels' encode the image width."""
+
+    def __init__(self):
+        self.image_processor = self.process
+
+    @staticmethod
+    def process(image, return_tensors):
+        """Return a 1-element batch holding the image width."""
+        assert return_tensors == 'pt'
+        return {'pixel_values': torch.tensor([[float(image.width)]])}
+
+    @staticmethod
+    def batch_decode(generated_ids, skip_special_tokens):
+        """Turn the fake ids back into captions."""
+        return [f"a photo of a {int(value)} mushroom "
+                for value in generated_ids[:, 0]]
+
+
+class FakeModel:
+    """Model echoing its pixel values and recording the batch sizes."""
+
+    device = torch.device('cpu')
+    dtype = torch.float32
+
+    def __init__(self):
+        self.batches = []
+
+    @staticmethod
+    def state_dict():
+        """No weights to measure."""
+        return {}
+
+    def generate(self, pixel_values, max_new_tokens):
+        """Return the pixel values as generated ids."""
+        self.batches.append(len(pixel_values))
+        return pixel_values
+
+
+class ClassifyImagesTest(SimpleTestCase):
+    """Test suite for gallery.ml.classify_images."""
+
+    def setUp(self):
+        """Write images 101..105 pixels wide and install the fakes."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.paths = []
+        for width in range(101, 106):
+            path = os.path.join(self.tmp_dir.name, f'{width}.png')
+            Image.new('RGB', (width, 10)).save(path)
+            self.paths.append(path)
+
+        self.model = FakeModel()
+        patcher = patch('gallery.ml.get_model',
+                        return_value=(FakeProcessor(), self.model))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_batches_keep_order(self):
+        """Images are captioned in batches; tags come back in input order."""
+        results = ml.classify_images(self.paths, batch_size=2, workers=3)
+
+        self.assertEqual(self.model.batches, [2, 2, 1])
+        self.assertEqual(
+            [sorted(tags) for tags in results],
+            [sorted([str(width), 'mushroom']) for width in range(101, 106)])
+
+    def test_unreadable_image_gets_no_tags(self):
+        """A broken file yields empty tags without failing its batch."""
+        broken = os.path.join(self.tmp_dir.name, 'broken.jpg')
+        with open(broken, 'wb') as file_obj:
+            file_obj.write(b'not an image')
+
+        results = ml.classify_images(
+            [self.paths[0], broken, self.paths[1]], batch_size=3)
+
+        self.assertEqual(self.model.batches, [2])
+        self.assertEqual(results[1], [])
+        self.assertIn('102', results[2])
+
+    def test_disabled_model(self):
+        """Without a model every image gets empty tags."""
+        with patch('gallery.ml.get_model', return_value=(None, None)):
+            self.assertEqual(ml.classify_images(self.paths[:2]), [[], []])
+
+    def test_caption_to_tags(self):
+        """Stopwords and short words are dropped."""
+        self.assertEqual(
+            sorted(ml.caption_to_tags('A fox, sitting in the snowy forest.')),
+            ['forest', 'fox', 'snowy'])
+
+
+def tiny_blip2():
+    """A randomly initialized BLIP-2 small enough to run in a test."""
+    layer = {'num_hidden_layers': 1, 'num_attention_heads': 4,
+             'hidden_size': 32}
+    config = Blip2Config(
+        vision_config={**layer, 'intermediate_size': 37, 'image_size': 30,
+                       'patch_size': 6},
+        qformer_config={**layer, 'intermediate_size': 37,
+                        'encoder_hidden_size': 32},
+        text_config={**layer, 'model_type': 'opt', 'ffn_dim': 37,
+                     'vocab_size': 99, 'word_embed_proj_dim': 32,
+                     'max_position_embeddings': 64, 'bos_token_id': 2,
+                     'eos_token_id': 2, 'pad_token_id': 1},
+        num_query_tokens=4, image_token_index=98)
+    return Blip2ForConditionalGeneration(config).eval()
+
+
+class CpuModeTest(SimpleTestCase):
+    """Test suite for the CPU precisions of the tagger."""
+
+    def test_int8_quantizes_only_the_language_model(self):
+        """Decoder layers become int8; the vision encoder stays float32."""
+        model = ml.quantize_language_model(tiny_blip2())
+
+        self.assertFalse(any(
+            type(module) is torch.nn.Linear
+            for module in model.language_model.modules()))
+        self.assertEqual(model.dtype, torch.float32)
+        generated = model.generate(
+            pixel_values=torch.randn(2, 3, 30, 30), max_new_tokens=3)
+        self.assertEqual(len(generated), 2)
+
+    @override_settings(BLIP2_CPU_MODE='int4')
+    def test_unknown_mode(self):
+        """An unsupported BLIP2_CPU_MODE is a configuration error."""
+        with self.assertRaises(ImproperlyConfigured):
+            ml.cpu_mode()
+
+    def test_benchmark_command(self):
+        """Every mode is scored against the fp32 tags."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for width in (101, 102, 103):
+                Image.new('RGB', (width, 10)).save(
+                    os.path.join(tmp_dir, f'{width}.png'))
+            out = StringIO()
+            with patch('gallery.management.commands.benchmark_tagger.load_model',
+                       side_effect=lambda **_: (FakeProcessor(), FakeModel())):
+                call_command('benchmark_tagger', tmp_dir, '--modes', 'int8',
+                             stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('fp32, int8 on 3 images', output)
+        self.assertEqual(output.count('agreement 100.0%'), 2)
+
+
+class ModelServerTest(SimpleTestCase):
+    """Test suite for gallery.ml_server and the client in classify_images."""
+
+    def setUp(self):
+        """Serve fake captions on a socket in a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'ml.sock')
+        self.delay = 0
+
+        server = ModelServer(self.path, self.caption, info={'mode': 'int8'})
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        settings_override = override_settings(
+            ML_SERVER_SOCKET=self.path, ML_SERVER_FALLBACK='error')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        patcher = patch('gallery.ml.get_model',
+                        side_effect=AssertionError('model loaded locally'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def caption(self, paths, batch_size):
+        """Caption each path with its file name."""
+        time.sleep(self.delay)
+        return [None if 'broken' in path else
+                f'a {os.path.basename(path)} by the lake' for path in paths]
+
+    def test_tags_come_from_the_server(self):
+        """Workers get tags without loading the model themselves."""
+        self.assertEqual(ping()['mode'], 'int8')
+        results = ml.classify_images(['/img/fox', '/img/broken'])
+        self.assertEqual(sorted(results[0]), ['fox', 'lake'])
+        self.assertEqual(results[1], [])
+
+    def test_timeout(self):
+        """A server slower than ML_SERVER_TIMEOUT counts as unavailable."""
+        self.delay = 0.5
+        with override_settings(ML_SERVER_TIMEOUT=0.05), \
+                self.assertRaises(MLServerUnavailable):
+            ml.classify_images(['/img/fox'])
+
+    def test_bad_request(self):
+        """Requests the server cannot answer raise MLServerError."""
+        with self.assertRaises(MLServerError):
+            request({'op': 'unknown'})
+        with self.assertRaises(MLServerError):
+            request({'op': 'caption', 'paths': 'not-a-list'})
+
+    def test_fallback_to_local_model(self):
+        """With the server down, 'local' captions in-process."""
+        with override_settings(ML_SERVER_SOCKET=self.path + '.missing',
+                               ML_SERVER_FALLBACK='local'), \
+                patch('gallery.ml.get_model',
+                      return_value=(FakeProcessor(), FakeModel())), \
+                patch('gallery.ml._caption_local',
+                      return_value=['a local heron']) as local:
+            [tags] = ml.classify_images(['/img/heron'])
+        self.assertEqual(sorted(tags), ['heron', 'local'])
+        local.assert_called_once()
+        self.assertIsNone(ping(path=self.path + '.missing'))
+
+
+@override_settings(ENABLE_ML_MODELS=True, ML_SERVER_SOCKET='',
+                   BLIP2_CPU_MODE='fp32')
+class RunModelServerTest(SimpleTestCase):
+    """The model server process holds a single copy of the model."""
+
+    def test_no_warmup_for_the_server(self):
+        """run_ml_server --socket does not start the web worker warmup."""
+        config = apps.get_app_config('gallery')
+        with patch.object(sys, 'argv',
+                          ['manage.py', 'run_ml_server', '--socket', '/ml.sock']), \
+                patch.object(config, '_start_model_warmup') as warmup:
+            config.ready()
+        warmup.assert_not_called()
+
+    @patch('gallery.management.commands.run_ml_server.signal.signal')
+    @patch('gallery.management.commands.run_ml_server.ModelServer')
+    @patch('gallery.management.commands.run_ml_server.load_model')
+    @patch('gallery.management.commands.run_ml_server.get_model')
+    def test_server_loads_through_the_cache(self, get_model, load_model,
+                                            server, _signal):
+        """The configured mode uses get_model; other modes load their own."""
+        get_model.return_value = (FakeProcessor(), FakeModel())
+        load_model.return_value = (FakeProcessor(), FakeModel())
+        server.return_value.serve_forever.side_effect = KeyboardInterrupt
+
+        call_command('run_ml_server', '--socket', '/ml.sock', stdout=StringIO())
+        get_model.assert_called_once_with()
+        load_model.assert_not_called()
+
+        call_command('run_ml_server', '--socket', '/ml.sock', '--mode', 'int8',
+                     stdout=StringIO())
+        load_model.assert_called_once_with(mode='int8')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class AutotagCommandTest(TestCase):
+    """Test suite for the autotag_images command."""
+
+    def setUp(self):
+        """Set up an isolated media root and two untagged images."""
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_dir.cleanup)
+        self.media_override = override_settings(MEDIA_ROOT=self.media_dir.name)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+
+        user = get_user_model().objects.create_user(
+            username='autotag', password='password')
+        gallery = Gallery.objects.create(
+            title='Autotag', tag='autotag', author=user)
+        with patch('gallery.models.image_gallery.enqueue_previews'):
+            self.images = [
+                ImageGallery.objects.create(
+                    title=f'Autotag {index}',
+                    image=make_upload(f'autotag{index}.jpg'),
+                    gallery=gallery, author=user)
+                for index in range(2)]
+
+    @patch('gallery.management.commands.autotag_images.BATCHES_PER_CHUNK', 1)
+    @patch('gallery.management.commands.autotag_images.classify_images')
+    def test_server_failure_skips_the_chunk(self, classify):
+        """A chunk the model server fails on is reported; the rest is tagged."""
+        classify.side_effect = [MLServerUnavailable('timed out'), [['fox']]]
+        out = StringIO()
+
+        call_command('autotag_images', '--batch-size', '1', stdout=out)
+
+        self.assertEqual(classify.call_count, 2)
+        self.assertIn('failed: timed out', out.getvalue())
+        self.assertIn('1 images failed', out.getvalue())
+        tagged = [image.tag_names for image in ImageGallery.objects.filter(
+            pk__in=[image.pk for image in self.images]).order_by('pk')]
+        self.assertEqual(sorted(tagged), [[], ['fox']])
+
+
+class LazyImportTest(SimpleTestCase):
+    """The ML stack stays out of processes that do not run the model."""
+
+    def test_setup_does_not_import_torch(self):
+        """A fresh django.setup() leaves torch and transformers unimported."""
+        out = StringIO()
+        call_command('benchmark_startup', '--runs', '1', stdout=out)
+        lazy, eager = out.getvalue().splitlines()[:2]
+        self.assertIn('torch not imported', lazy)
+        self.assertIn('torch imported', eager)
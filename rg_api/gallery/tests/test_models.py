@@ -3,12 +3,15 @@ Tests for Gallery models.
 """
 import os
 import tempfile
+from io import StringIO
 from unittest.mock import patch
 from PIL import Image
 
 from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from taggit.models import Tag
 
 from gallery.models import Gallery, ImageGallery
 
@@ -124,3 +127,59 @@ class ImageGalleryModelTest(TestCase):
         self.assertEqual(image_gallery.latitude, 41.9028)
         self.assertEqual(image_gallery.longitude, 12.4964)
         self.assertEqual(image_gallery.shutter_speed, 0.01)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.gettempdir(),
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+)
+class ImageGalleryTagNamesTest(TestCase):
+    """Test suite for the denormalized ImageGallery.tag_names."""
+
+    def setUp(self):
+        """Set up one untagged image."""
+        self.user = User.objects.create_user(
+            username='testuser', password='password')
+        self.gallery = Gallery.objects.create(
+            title='Test Gallery', tag='test-gallery', author=self.user)
+        self.image = ImageGallery.objects.create(
+            title='Tagged', gallery=self.gallery, author=self.user,
+            width=10, height=10)
+
+    def stored_names(self):
+        """Tag names as stored in the database."""
+        return ImageGallery.objects.values_list(
+            'tag_names', flat=True).get(pk=self.image.pk)
+
+    def test_tag_changes_update_names(self):
+        """Adding, removing and clearing tags keep the names sorted and current."""
+        self.image.tags.add('mushroom', 'Autumn', 'forest')
+        self.assertEqual(self.image.tag_names, ['Autumn', 'forest', 'mushroom'])
+        self.assertEqual(self.stored_names(), ['Autumn', 'forest', 'mushroom'])
+
+        self.image.tags.remove('forest')
+        self.assertEqual(self.stored_names(), ['Autumn', 'mushroom'])
+
+        self.image.tags.clear()
+        self.assertEqual(self.stored_names(), [])
+
+    def test_tag_rename_and_delete(self):
+        """Renaming or deleting a tag rewrites the names of its images."""
+        self.image.tags.add('mushroom', 'forest')
+
+        tag = Tag.objects.get(name='mushroom')
+        tag.name = 'fungus'
+        tag.save()
+        self.assertEqual(self.stored_names(), ['forest', 'fungus'])
+
+        Tag.objects.get(name='forest').delete()
+        self.assertEqual(self.stored_names(), ['fungus'])
+
+    def test_sync_command_backfills(self):
+        """The backfill command repairs names written behind the signals."""
+        self.image.tags.add('mushroom')
+        ImageGallery.objects.filter(pk=self.image.pk).update(tag_names=[])
+
+        call_command('sync_tag_names', stdout=StringIO())
+
+        self.assertEqual(self.stored_names(), ['mushroom'])
@@ -0,0 +1,311 @@
+"""
+Tests for the upload-time preview pipeline.
+"""
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from PIL import Image
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from gallery.models import Gallery, ImageGallery
+from gallery.previews import (
+    PREVIEW_WIDTHS, generate_previews, preview_formats, preview_path,
+    render_preview, write_previews)
+from utils.image_optimizer import ImageOptimizer
+
+User = get_user_model()
+
+
+def make_upload(name='test.jpg', size=(600, 400)):
+    """Build an in-memory JPEG upload."""
+    image_bytes = io.BytesIO()
+    Image.new('RGB', size, color=(0, 128, 255)).save(image_bytes, format='JPEG')
+    return SimpleUploadedFile(name, image_bytes.getvalue(),
+                              content_type='image/jpeg')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class PreviewPipelineTest(TestCase):
+    """Test suite for gallery.previews."""
+
+    def setUp(self):
+        """Set up an isolated media root and an uploaded image."""
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_dir.cleanup)
+
+        self.media_override = override_settings(MEDIA_ROOT=self.media_dir.name)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+
+        self.user = User.objects.create_user(
+            username='previews', password='password')
+        self.gallery = Gallery.objects.create(
+            title='Preview Gallery', tag='preview-gallery', author=self.user)
+
+    def create_image(self):
+        """Create an image, returning it and the queued preview jobs."""
+        with patch('gallery.models.image_gallery.enqueue_previews') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                image = ImageGallery.objects.create(
+                    title='Preview', image=make_upload(), gallery=self.gallery,
+                    author=self.user, width=600, height=400)
+        return image, enqueue
+
+    def test_upload_enqueues_previews(self):
+        """Saving a new image schedules its width ladder after commit."""
+        image, enqueue = self.create_image()
+        enqueue.assert_called_once_with(image.pk, force=False)
+
+    def test_unchanged_image_is_not_requeued(self):
+        """Saving other fields of a stored image does not queue new work."""
+        image, _ = self.create_image()
+        image = ImageGallery.objects.get(pk=image.pk)
+        with patch('gallery.models.image_gallery.enqueue_previews') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                image.title = 'Renamed'
+                image.save()
+        enqueue.assert_not_called()
+
+    def test_generate_previews_writes_ladder(self):
+        """Every standard width and format is written, existing files are kept."""
+        image, _ = self.create_image()
+        formats = preview_formats()
+        expected = len(PREVIEW_WIDTHS) * len(formats)
+
+        self.assertEqual(generate_previews(image.pk), expected)
+        for width in PREVIEW_WIDTHS:
+            for fmt in formats:
+                self.assertTrue(os.path.exists(
+                    preview_path(image.image.path, image.pk, width, fmt=fmt)))
+        self.assertEqual(generate_previews(image.pk), 0)
+        self.assertEqual(generate_previews(image.pk, force=True), expected)
+
+    def test_replaced_source_gets_new_preview(self):
+        """Previews are keyed by source content; stale ones are purged."""
+        image, _ = self.create_image()
+        source_path = image.image.path
+        old_path = render_preview(source_path, image.pk, 400)
+        self.assertTrue(os.path.exists(old_path))
+
+        Image.new('RGB', (600, 400), color='red').save(source_path, 'JPEG')
+        stat = os.stat(source_path)
+        os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        new_path = render_preview(source_path, image.pk, 400)
+
+        self.assertNotEqual(new_path, old_path)
+        self.assertTrue(os.path.exists(new_path))
+        self.assertFalse(os.path.exists(old_path))
+
+    def test_concurrent_requests_render_once(self):
+        """Concurrent renders of one preview do the work once and never tear."""
+        image, _ = self.create_image()
+        calls = []
+
+        def slow_resize(_source, output_path, width, **_options):
+            calls.append(width)
+            time.sleep(0.2)
+            with open(output_path, 'wb') as out_file:
+                out_file.write(b'RIFFxxxxWEBP')
+            return True
+
+        results = []
+        with patch('gallery.previews.ImageOptimizer.compress_and_resize',
+                   side_effect=slow_resize):
+            threads = [
+                threading.Thread(target=lambda: results.append(
+                    render_preview(image.image.path, image.pk, 640)))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(calls, [640])
+        self.assertEqual(
+            results, [preview_path(image.image.path, image.pk, 640)] * 5)
+        leftovers = [name for name in os.listdir(os.path.dirname(results[0]))
+                     if name.endswith('.tmp')]
+        self.assertEqual(leftovers, [])
+        lock_dir = os.path.join(os.path.dirname(results[0]), '.locks')
+        self.assertEqual(os.listdir(lock_dir), [])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class RegeneratePreviewsCommandTest(TestCase):
+    """Test suite for the regenerate_previews management command."""
+
+    def setUp(self):
+        """Set up an isolated media root with one image."""
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_dir.cleanup)
+
+        self.media_override = override_settings(MEDIA_ROOT=self.media_dir.name)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+
+        user = User.objects.create_user(username='regen', password='password')
+        gallery = Gallery.objects.create(
+            title='Regen Gallery', tag='regen-gallery', author=user)
+        with patch('gallery.models.image_gallery.enqueue_previews'):
+            self.image = ImageGallery.objects.create(
+                title='Regen', image=make_upload(), gallery=gallery,
+                author=user, width=600, height=400)
+
+    def run_command(self, *args):
+        """Run the command, returning the number of images it rendered."""
+        with patch('gallery.management.commands.regenerate_previews.write_previews',
+                   wraps=write_previews) as writer:
+            call_command('regenerate_previews', *args, stdout=io.StringIO())
+        return writer.call_count
+
+    def test_only_missing_skips_up_to_date_images(self):
+        """A second --only-missing run renders nothing until the content changes."""
+        self.assertEqual(self.run_command('--only-missing'), 1)
+        for width in PREVIEW_WIDTHS:
+            self.assertTrue(os.path.exists(
+                preview_path(self.image.image.path, self.image.pk, width)))
+        self.assertEqual(self.run_command('--only-missing'), 0)
+
+        # Touching the source keeps its content, hence its previews.
+        source_path = self.image.image.path
+        stat = os.stat(source_path)
+        os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.run_command('--only-missing'), 0)
+
+        Image.new('RGB', (600, 400), color='red').save(source_path, 'JPEG')
+        os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+        self.assertEqual(self.run_command('--only-missing'), 1)
+
+    def test_failed_render_is_retried(self):
+        """An image with no preview written is neither recorded nor skipped."""
+        out = io.StringIO()
+        with patch('gallery.management.commands.regenerate_previews.write_previews',
+                   return_value=0):
+            call_command('regenerate_previews', '--only-missing', stdout=out)
+        self.assertIn('no previews rendered', out.getvalue())
+
+        preview_dir = os.path.dirname(
+            preview_path(self.image.image.path, self.image.pk, 400))
+        with open(os.path.join(preview_dir, '.regenerate_checkpoint.json'),
+                  encoding='utf-8') as checkpoint:
+            self.assertEqual(json.load(checkpoint)['completed'], [])
+        # Resumes from the checkpoint and still renders the image.
+        self.assertEqual(self.run_command(), 1)
+
+    def test_resume_skips_checkpointed_images(self):
+        """Images recorded in the checkpoint of an interrupted run are skipped."""
+        preview_dir = os.path.dirname(
+            preview_path(self.image.image.path, self.image.pk, 400))
+        os.makedirs(preview_dir, exist_ok=True)
+        with open(os.path.join(preview_dir, '.regenerate_checkpoint.json'),
+                  'w', encoding='utf-8') as checkpoint:
+            json.dump({'widths': PREVIEW_WIDTHS, 'formats': preview_formats(),
+                       'completed': [self.image.pk]}, checkpoint)
+
+        self.assertEqual(self.run_command(), 0)
+        self.assertEqual(self.run_command('--no-resume'), 1)
+
+
+class CompressAndResizeManyTest(SimpleTestCase):
+    """Test suite for ImageOptimizer.compress_and_resize_many."""
+
+    def test_single_decode_for_all_widths(self):
+        """All widths come from one open of the source, largest to smallest."""
+        source = io.BytesIO()
+        Image.new('RGB', (1000, 500), color='green').save(source, format='JPEG')
+        source.seek(0)
+
+        with patch('utils.image_optimizer.Image.open',
+                   wraps=Image.open) as image_open:
+            results = ImageOptimizer.compress_and_resize_many(
+                source, [400, 800, 1200, 400])
+        self.assertEqual(image_open.call_count, 1)
+
+        self.assertEqual(sorted(results), [400, 800, 1200])
+        sizes = {width: Image.open(output).size
+                 for width, output in results.items()}
+        self.assertEqual(sizes[400], (400, 200))
+        self.assertEqual(sizes[800], (800, 400))
+        # Never upscaled
+        self.assertEqual(sizes[1200], (1000, 500))
+
+    def test_variants_share_one_resample_per_width(self):
+        """Each width is encoded in every requested format."""
+        source = io.BytesIO()
+        Image.new('RGB', (800, 400), color='blue').save(source, format='JPEG')
+        source.seek(0)
+
+        results = ImageOptimizer.compress_and_resize_variants(
+            source, [(400, 'WEBP'), (400, 'JPEG'), (200, 'webp')])
+        self.assertEqual(sorted(results),
+                         [(200, 'WEBP'), (400, 'JPEG'), (400, 'WEBP')])
+        with Image.open(results[(400, 'JPEG')]) as preview:
+            self.assertEqual((preview.format, preview.size), ('JPEG', (400, 200)))
+        with Image.open(results[(200, 'WEBP')]) as preview:
+            self.assertEqual((preview.format, preview.size), ('WEBP', (200, 100)))
+
+    def test_writes_requested_paths(self):
+        """Widths with an output path are written to disk."""
+        source = io.BytesIO()
+        Image.new('RGB', (600, 300)).save(source, format='PNG')
+        source.seek(0)
+        with tempfile.TemporaryDirectory() as out_dir:
+            path = os.path.join(out_dir, '300.webp')
+            results = ImageOptimizer.compress_and_resize_many(
+                source, [300], output_paths={300: path})
+            self.assertEqual(results, {300: path})
+            with Image.open(path) as preview:
+                self.assertEqual(preview.size, (300, 150))
+
+
+class DraftDecodeTest(SimpleTestCase):
+    """Test suite for draft-mode JPEG decoding in ImageOptimizer."""
+
+    def make_jpeg(self, size, orientation=None):
+        """Build an in-memory JPEG, optionally with an EXIF orientation."""
+        source = io.BytesIO()
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        Image.new('RGB', size, color='orange').save(
+            source, format='JPEG', exif=exif)
+        source.seek(0)
+        return source
+
+    def test_draft_keeps_oversample_guard(self):
+        """The reduced decode stays at least twice the target width."""
+        with Image.open(self.make_jpeg((2000, 1000))) as img:
+            ImageOptimizer._apply_draft(img, 200)
+            self.assertEqual(img.size, (500, 250))
+
+    def test_small_reduction_is_not_drafted(self):
+        """Without room for a 1/2 scale plus the guard, decoding is full size."""
+        with Image.open(self.make_jpeg((2000, 1000))) as img:
+            ImageOptimizer._apply_draft(img, 600)
+            self.assertEqual(img.size, (2000, 1000))
+
+    def test_rotated_source_uses_displayed_width(self):
+        """For rotated images the target applies to the raw height."""
+        with Image.open(self.make_jpeg((2000, 1000), orientation=6)) as img:
+            ImageOptimizer._apply_draft(img, 200)
+            self.assertEqual(img.size, (1000, 500))
+
+    def test_output_width_is_exact(self):
+        """Draft decoding still yields the requested output width."""
+        output = ImageOptimizer.compress_and_resize(
+            self.make_jpeg((2000, 1000)), width=300)
+        with Image.open(output) as preview:
+            self.assertEqual(preview.size, (300, 150))
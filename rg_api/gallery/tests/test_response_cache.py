@@ -0,0 +1,201 @@
+"""
+Tests for the tagged API response cache.
+"""
+import json
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from taggit.models import Tag
+
+from gallery.models import Gallery, ImageGallery
+from utils import response_cache
+
+User = get_user_model()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYTICS_ASYNC_WRITES=False,
+    RESPONSE_CACHE_REFRESH_INLINE=True,
+)
+class ResponseCacheTest(APITestCase):
+    """Test suite for utils.response_cache through the gallery endpoints."""
+
+    def setUp(self):
+        """Set up an empty cache and one gallery."""
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_dir.cleanup)
+        self.media_override = override_settings(MEDIA_ROOT=self.media_dir.name)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='cacheuser', password='password')
+        self.gallery = Gallery.objects.create(
+            title='Cached', tag='cached', author=self.user)
+
+    def get_json(self, url):
+        """GET `url` and decode the JSON body."""
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)
+
+    def test_repeated_request_is_served_from_cache(self):
+        """Changes that bypass signals are not seen until the entry is purged."""
+        url = f'/portfolio/galleries/{self.gallery.pk}'
+        self.get_json(url)
+        Gallery.objects.filter(pk=self.gallery.pk).update(title='Direct')
+        self.assertEqual(self.get_json(url)['title'], 'Cached')
+
+    def test_save_purges_list_and_detail(self):
+        """Saving an instance invalidates its list and detail responses."""
+        list_url = '/portfolio/galleries'
+        detail_url = f'/portfolio/galleries/{self.gallery.pk}'
+        self.get_json(list_url)
+        self.get_json(detail_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gallery.title = 'Renamed'
+            self.gallery.save()
+
+        self.assertEqual(self.get_json(detail_url)['title'], 'Renamed')
+        self.assertEqual(
+            self.get_json(list_url)['results'][0]['title'], 'Renamed')
+
+    def test_unrelated_detail_is_kept(self):
+        """Changing one gallery keeps the cached detail of another."""
+        other = Gallery.objects.create(
+            title='Other', tag='other', author=self.user)
+        other_url = f'/portfolio/galleries/{other.pk}'
+        self.get_json(other_url)
+        Gallery.objects.filter(pk=other.pk).update(title='Direct')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gallery.title = 'Renamed'
+            self.gallery.save()
+
+        self.assertEqual(self.get_json(other_url)['title'], 'Other')
+
+    def test_slug_change_purges_old_detail(self):
+        """A detail cached under a previous slug is dropped on rename."""
+        image = ImageGallery.objects.create(
+            title='Slugged', gallery=self.gallery, author=self.user,
+            width=10, height=10)
+        old_url = f'/portfolio/images/{image.slug}'
+        self.get_json(old_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.slug = 'moved'
+            image.save()
+
+        response = self.client.get(old_url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_dependency_change_purges_list(self):
+        """Image responses are refreshed when a tag is added or renamed."""
+        image = ImageGallery.objects.create(
+            title='Tagged', gallery=self.gallery, author=self.user,
+            width=10, height=10)
+        list_url = '/portfolio/images'
+        self.assertEqual(self.get_json(list_url)['results'][0]['tags'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.tags.add('mushroom')
+        self.assertEqual(
+            self.get_json(list_url)['results'][0]['tags'], ['mushroom'])
+
+        tag = Tag.objects.get(name='mushroom')
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.name = 'fungus'
+            tag.save()
+        self.assertEqual(
+            self.get_json(list_url)['results'][0]['tags'], ['fungus'])
+
+    def test_purge_waits_for_commit(self):
+        """A read before the commit cannot re-cache the old row for good."""
+        url = f'/portfolio/galleries/{self.gallery.pk}'
+        self.get_json(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gallery.title = 'Renamed'
+            self.gallery.save()
+            # Still inside the transaction: nothing has been purged yet.
+            self.assertEqual(self.get_json(url)['title'], 'Cached')
+
+        self.assertEqual(self.get_json(url)['title'], 'Renamed')
+
+    def test_authenticated_requests_bypass_cache(self):
+        """Logged-in users always get a freshly computed response."""
+        url = f'/portfolio/galleries/{self.gallery.pk}'
+        self.get_json(url)
+        Gallery.objects.filter(pk=self.gallery.pk).update(title='Direct')
+
+        self.assertEqual(self.get_json(url)['title'], 'Cached')
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.get_json(url)['title'], 'Direct')
+
+    def later(self, seconds):
+        """Move the clock `seconds` into the future (cache backend included)."""
+        now = time.time() + seconds
+        return patch('utils.response_cache.time.time', return_value=now)
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        """An expired entry is answered as-is and replaced for the next request."""
+        url = f'/portfolio/galleries/{self.gallery.pk}'
+        self.get_json(url)
+        Gallery.objects.filter(pk=self.gallery.pk).update(title='Direct')
+
+        with self.later(60 * 60 * 24 * 7 + 60):
+            self.assertEqual(self.get_json(url)['title'], 'Cached')
+        self.assertEqual(self.get_json(url)['title'], 'Direct')
+
+    def test_single_refresh_per_entry(self):
+        """While a refresh is in flight, other stale hits do not start one."""
+        url = f'/portfolio/galleries/{self.gallery.pk}'
+        self.get_json(url)
+
+        with self.later(60 * 60 * 24 * 7 + 60), \
+                patch('utils.response_cache._refresh') as refresh:
+            self.get_json(url)
+            self.get_json(url)
+        self.assertEqual(refresh.call_count, 1)
+
+    def test_refresh_is_detached_and_not_throttled(self):
+        """The refresh neither shares the client request nor uses its quota."""
+        url = f'/portfolio/galleries/{self.gallery.pk}'
+        self.get_json(url)
+        Gallery.objects.filter(pk=self.gallery.pk).update(title='Direct')
+
+        refresh = response_cache._refresh
+        requests = []
+
+        def record(request, lock_key):
+            requests.append(request)
+            refresh(request, lock_key)
+
+        with self.later(60 * 60 * 24 * 7 + 60), \
+                patch('utils.response_cache._refresh', side_effect=record), \
+                patch('rest_framework.throttling.AnonRateThrottle.allow_request',
+                      return_value=True) as allow_request:
+            response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(allow_request.call_count, 1)
+        self.assertIsNot(requests[0], response.wsgi_request)
+        self.assertFalse(requests[0].user.is_authenticated)
+        self.assertEqual(self.get_json(url)['title'], 'Direct')
+
+    def test_early_refresh_probability(self):
+        """XFetch refreshes early only close to expiry, scaled by compute time."""
+        entry = {'fresh_until': time.time() + 10, 'delta': 1.0}
+        with patch('utils.response_cache.random.random', return_value=0.5):
+            # -log(0.5) * 1s is well short of the 10s left.
+            self.assertFalse(response_cache._should_refresh(entry))
+        with patch('utils.response_cache.random.random', return_value=0.99999999):
+            # A rare large draw triggers the refresh ahead of time.
+            self.assertTrue(response_cache._should_refresh(entry))
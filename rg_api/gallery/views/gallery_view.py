@@ -5,11 +5,11 @@ from django_filters.rest_framework import DjangoFilterBackend
 
 from utils.pagination import StandardPagination
 from utils.viewset_decorators import cached_viewset
-from gallery.models import Gallery
+from gallery.models import Gallery, ImageGallery
 from gallery.serializers import GallerySerializer
 
 
-@cached_viewset()
+@cached_viewset(depends_on=[ImageGallery])
 class GalleryViewSet(viewsets.ModelViewSet):
     """
     A ViewSet for viewing Gallery instances.
@@ -1,21 +1,22 @@
 """ ViewSet for Image Gallery API endpoints. """
-import os
 import logging
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import FileResponse, Http404
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from django.http import Http404
 from rest_framework import viewsets, permissions, renderers
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
+from taggit.models import Tag
 
 from gallery.models import ImageGallery
+from gallery.previews import preview_dir
 from gallery.serializers import ImageGallerySerializer
-from utils.pagination import StandardPagination
+from utils.pagination import KeysetPagination, StandardPagination
+from utils.file_serving import media_response
+from utils.previews import preview_response
+from utils.renderers import ImagePreviewRenderer
 from utils.viewset_decorators import cached_viewset
-from utils.image_optimizer import ImageOptimizer
 
 logger = logging.getLogger(__name__)
 
@@ -31,18 +32,33 @@ class ImageGalleryPagination(StandardPagination):
     max_page_size = 100
 
 
-@cached_viewset(list_timeout=60 * 60 * 24, retrieve_timeout=60 * 60 * 24)
+class ImageGalleryKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination for the image feed, newest capture date first.
+
+    Requests with a ``cursor`` parameter seek on ``(date, id)`` using the
+    ``date`` index; others fall back to `ImageGalleryPagination`.
+    """
+    ordering = ('-date', '-id')
+    page_size = 4
+    max_page_size = 100
+    page_number_class = ImageGalleryPagination
+
+
+@cached_viewset(depends_on=[Tag])
 class ImageGalleryViewSet(viewsets.ModelViewSet):
     """
     A viewset for viewing image galleries.
 
     This viewset provides `list` and `retrieve` actions for ImageGallery objects.
-    It supports filtering by gallery, searching by title, and ordering by various fields.
+    It supports filtering by gallery, searching by title and tag names, and ordering by
+    various fields.
     It also includes a custom action to retrieve images in specific widths.
 
     Attributes:
         queryset (QuerySet): The base queryset for the viewset, optimizing database access
-            by using `select_related` for author and gallery, and `prefetch_related` for tags.
+            by using `select_related` for author and gallery. Tags are serialized from the
+            denormalized `tag_names` column, so they need no prefetch.
         serializer_class (Serializer): The serializer class used for validating and
             deserializing input, and for serializing output.
         permission_classes (list): The list of permission classes that determine access rights.
@@ -56,14 +72,13 @@ class ImageGalleryViewSet(viewsets.ModelViewSet):
         filterset_fields (list): The fields that can be used for precise filtering.
         search_fields (list): The fields that can be searched using the search filter.
     """
-    queryset = ImageGallery.objects.select_related(
-        'author', 'gallery').prefetch_related('tags').all()
+    queryset = ImageGallery.objects.select_related('author', 'gallery').all()
     lookup_field = 'slug'
     serializer_class = ImageGallerySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     http_method_names = ['get']
-    pagination_class = ImageGalleryPagination
+    pagination_class = ImageGalleryKeysetPagination
     renderer_classes = [renderers.BrowsableAPIRenderer, renderers.JSONRenderer]
 
     ordering_fields = ['title', 'created_at', 'gallery', 'date', 'id']
@@ -71,19 +86,24 @@ class ImageGalleryViewSet(viewsets.ModelViewSet):
     filterset_fields = ['gallery']
 
     search_fields = [
-        '$title'
+        '$title',
+        'tag_names',
     ]
 
-    @method_decorator(cache_page(60 * 60 * 24 * 365))
     @action(
         methods=['get'],
         detail=True,
         url_path='width/(?P<width>[0-9]+)',
         url_name='size',
+        renderer_classes=[ImagePreviewRenderer, renderers.JSONRenderer],
     )
     def jpeg(self, request, *args, **kwargs):
         """
-        Retrieve and return image gallery data in WebP format.
+        Retrieve and return a resized preview of the image.
+
+        The format (AVIF, WebP or JPEG) is negotiated on ``Accept``. Previews
+        are content-addressed and served with a strong ETag, so conditional
+        requests are answered with 304.
         """
         try:
             image_gallery = self.get_object()
@@ -95,30 +115,36 @@ class ImageGalleryViewSet(viewsets.ModelViewSet):
         if not (1 <= width <= max_width):
             raise Http404
 
-        # Ensure directory exists
-        preview_dir = os.path.join(settings.MEDIA_ROOT, "preview")
-        os.makedirs(preview_dir, exist_ok=True)
-
-        filename = os.path.join(
-            preview_dir, f"{image_gallery.pk}_{width}.webp")
-
-        if not os.path.exists(filename):
-            try:
-                ImageOptimizer.compress_and_resize(
-                    image_gallery.image.path,
-                    output_path=filename,
-                    width=width
-                )
-            except Exception as e:
-                logger.error("Error creating preview: %s", e)
-                raise Http404 from e
-
-        if os.path.exists(filename):
-            file_handle = open(filename, "rb")  # noqa: WPS515
-            try:
-                return FileResponse(file_handle, content_type="image/webp")
-            except Exception:
-                file_handle.close()
-                raise
-
-        raise Http404
+        if not image_gallery.image:
+            raise Http404
+
+        # Standard widths are rendered on upload (see gallery.previews); other
+        # widths, or images still in the queue, are rendered on demand.
+        return preview_response(
+            request, image_gallery.image.path, preview_dir(),
+            image_gallery.pk, width)
+
+    @action(
+        methods=['get'],
+        detail=True,
+        url_path='original',
+        url_name='original',
+        renderer_classes=[ImagePreviewRenderer, renderers.JSONRenderer],
+    )
+    def original(self, request, *args, **kwargs):
+        """
+        Download the full-resolution original.
+
+        Supports conditional requests and single byte ``Range`` requests, so
+        interrupted or segmented downloads resume instead of starting over.
+        """
+        try:
+            image_gallery = self.get_object()
+        except ObjectDoesNotExist as exc:
+            raise Http404 from exc
+        if not image_gallery.image:
+            raise Http404
+
+        return media_response(
+            request, image_gallery.image.path,
+            max_age=getattr(settings, 'PREVIEW_CACHE_MAX_AGE', 60 * 60 * 24))
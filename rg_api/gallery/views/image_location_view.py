@@ -1,23 +1,98 @@
 """ ViewSet for ImageGallery location data. """
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import viewsets
 from rest_framework import permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from gallery.locations import clusters, geotagged_images, locations_response
 from gallery.models import ImageGallery
+from gallery.serializers import (
+    ImageLocationClusterSerializer, ImageLocationSerializer)
+from utils.response_cache import cache_response, model_tag
+
+MAX_ZOOM = 22
+
+# Cached clusters are purged whenever an image changes.
+CLUSTER_CACHE_TIMEOUT = 60 * 60 * 24
 
-from gallery.serializers import ImageLocationSerializer
 
-_MAX_LOCATIONS = 500
+def _cluster_tags(_view, _kwargs):
+    """Response cache tags of the cluster lists."""
+    return [model_tag(ImageGallery)]
 
 
 class ImageLocationViewSet(viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for retrieving image locations.
+
+    The list (and its GeoJSON variant) is served from the precomputed
+    snapshot in `gallery.locations`, so every geotagged image is returned
+    without querying the database. Given a viewport (``bbox`` and ``zoom``)
+    the list returns geohash clusters of the images inside it instead.
     """
-    queryset = ImageGallery.objects.filter(
-        latitude__isnull=False,
-        longitude__isnull=False
-    ).exclude(latitude=0, longitude=0).only(
+    queryset = geotagged_images().only(
         'id', 'title', 'latitude', 'longitude', 'slug'
-    )[:_MAX_LOCATIONS]
+    )
     serializer_class = ImageLocationSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    pagination_class = None  # Map needs all pins; queryset hard-capped at _MAX_LOCATIONS
+    pagination_class = None  # Map needs all pins
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'bbox', str,
+                description='Viewport as min_lon,min_lat,max_lon,max_lat. '
+                            'With zoom, returns geohash clusters (geohash, '
+                            'count, latitude, longitude, bounds, image) '
+                            'instead of pins.'),
+            OpenApiParameter('zoom', int, description='Map zoom level.'),
+        ],
+    )
+    def list(self, request, *args, **kwargs):
+        """Return every map pin, or the clusters inside a viewport."""
+        viewport = self._viewport(request)
+        if viewport is None:
+            return locations_response(request._request)
+        return self._clusters(request, *viewport)
+
+    @cache_response(CLUSTER_CACHE_TIMEOUT, _cluster_tags)
+    def _clusters(self, request, bbox, zoom):
+        """Clusters of the images in `bbox` at `zoom`."""
+        return Response(ImageLocationClusterSerializer(
+            clusters(bbox, zoom), many=True).data)
+
+    @staticmethod
+    def _viewport(request):
+        """Parse the ``bbox`` and ``zoom`` query parameters, if given."""
+        bbox = request.query_params.get('bbox')
+        zoom = request.query_params.get('zoom')
+        if bbox is None and zoom is None:
+            return None
+        if bbox is None or zoom is None:
+            raise ValidationError('bbox and zoom must be given together.')
+
+        try:
+            min_lon, min_lat, max_lon, max_lat = (
+                float(value) for value in bbox.split(','))
+            zoom = int(zoom)
+        except ValueError as exc:
+            raise ValidationError(
+                'bbox must be min_lon,min_lat,max_lon,max_lat and zoom an '
+                'integer.') from exc
+
+        if not (-90 <= min_lat <= max_lat <= 90 and
+                -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+            raise ValidationError('bbox is out of range.')
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValidationError(f'zoom must be between 0 and {MAX_ZOOM}.')
+        return (min_lon, min_lat, max_lon, max_lat), zoom
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT})
+    @action(methods=['get'], detail=False, url_path='geojson',
+            url_name='geojson')
+    def geojson(self, request):
+        """Return every map pin as a GeoJSON FeatureCollection."""
+        return locations_response(request._request, 'geojson')
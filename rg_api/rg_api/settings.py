@@ -259,6 +259,12 @@ MEDIA_ROOT = os.environ.get('MEDIA_ROOT', 'files')
 MEDIA_URL = '/files/'
 
 GEOIP_PATH = str(BASE_DIR / 'geoip' / 'GeoLite2-City.mmdb')
+# In-process memo of IP lookups (entries, seconds; misses are kept shorter).
+GEOIP_CACHE_SIZE = int(os.environ.get("GEOIP_CACHE_SIZE", "10000"))
+GEOIP_CACHE_TTL = int(os.environ.get("GEOIP_CACHE_TTL", "3600"))
+GEOIP_NEGATIVE_CACHE_TTL = int(os.environ.get("GEOIP_NEGATIVE_CACHE_TTL", "300"))
+# Seconds between checks for a replaced database file (0 disables hot reload).
+GEOIP_RELOAD_INTERVAL = int(os.environ.get("GEOIP_RELOAD_INTERVAL", "60"))
 
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
@@ -279,6 +285,18 @@ if not DEBUG:
 
 ACCESS_LIST = ['127.0.0.1']
 
+# Analytics write pipeline: tracked requests are queued and written in batches
+# by a background thread. Policy is 'drop' (never slow requests) or 'block'.
+ANALYTICS_ASYNC_WRITES = bool(int(os.environ.get("ANALYTICS_ASYNC_WRITES", "1")))
+ANALYTICS_WRITE_BATCH_SIZE = int(os.environ.get("ANALYTICS_WRITE_BATCH_SIZE", "200"))
+ANALYTICS_WRITE_FLUSH_INTERVAL = float(os.environ.get("ANALYTICS_WRITE_FLUSH_INTERVAL", "2.0"))
+ANALYTICS_WRITE_QUEUE_SIZE = int(os.environ.get("ANALYTICS_WRITE_QUEUE_SIZE", "10000"))
+ANALYTICS_WRITE_QUEUE_POLICY = os.environ.get("ANALYTICS_WRITE_QUEUE_POLICY", "drop")
+# Active sessions live in this cache; counters are written back every N seconds.
+ANALYTICS_SESSION_CACHE_ALIAS = 'default'
+ANALYTICS_SESSION_WRITEBACK_INTERVAL = float(
+    os.environ.get("ANALYTICS_SESSION_WRITEBACK_INTERVAL", "30"))
+
 MARTOR_THEME = 'bootstrap'
 
 MARTOR_ENABLE_CONFIGS = {
@@ -328,6 +346,40 @@ if not DEBUG:
 
 IMAGE_GENERATOR_BASE_URL = f"{FORCE_SCRIPT_NAME.rstrip('/')}/portfolio/images"
 IMAGE_GENERATOR_MAX_WIDTH = int(os.environ.get("IMAGE_GENERATOR_MAX_WIDTH", "4000"))
+# Render the standard preview widths in background workers on upload.
+GALLERY_PRECOMPUTE_PREVIEWS = bool(int(os.environ.get("GALLERY_PRECOMPUTE_PREVIEWS", "1")))
+GALLERY_PREVIEW_WORKERS = int(os.environ.get("GALLERY_PREVIEW_WORKERS", "2"))
+# Formats rendered ahead of time (AVIF is skipped if Pillow cannot encode it).
+GALLERY_PREVIEW_FORMATS = [
+    fmt.strip().upper()
+    for fmt in os.environ.get("GALLERY_PREVIEW_FORMATS", "AVIF,WEBP,JPEG").split(",")
+    if fmt.strip()
+]
+# Previews are content-addressed and revalidated with ETag/Last-Modified.
+PREVIEW_CACHE_MAX_AGE = int(os.environ.get("PREVIEW_CACHE_MAX_AGE", "86400"))
+# Browser cache lifetime of the map pins (revalidated with their ETag).
+GALLERY_LOCATIONS_MAX_AGE = int(os.environ.get("GALLERY_LOCATIONS_MAX_AGE", "300"))
+# Upper bound on the clusters returned for one map viewport.
+GALLERY_MAP_MAX_CLUSTERS = int(os.environ.get("GALLERY_MAP_MAX_CLUSTERS", "500"))
+# Tagging, GPS extraction and previews run in the run_image_jobs worker
+# (0 runs them inline, in the request).
+GALLERY_JOB_QUEUE = bool(int(os.environ.get("GALLERY_JOB_QUEUE", "1")))
+GALLERY_JOB_BATCH_SIZE = int(os.environ.get("GALLERY_JOB_BATCH_SIZE", "8"))
+GALLERY_JOB_POLL_INTERVAL = float(os.environ.get("GALLERY_JOB_POLL_INTERVAL", "2"))
+GALLERY_JOB_MAX_ATTEMPTS = int(os.environ.get("GALLERY_JOB_MAX_ATTEMPTS", "3"))
+# Running jobs older than this (seconds) are assumed lost and requeued.
+GALLERY_JOB_TIMEOUT = int(os.environ.get("GALLERY_JOB_TIMEOUT", "600"))
+# How media files are sent: 'django' (stream from the worker), 'nginx'
+# (X-Accel-Redirect to MEDIA_SERVE_INTERNAL_URL) or 'sendfile' (X-Sendfile).
+MEDIA_SERVE_BACKEND = os.environ.get("MEDIA_SERVE_BACKEND", "django")
+MEDIA_SERVE_INTERNAL_URL = os.environ.get("MEDIA_SERVE_INTERNAL_URL", "/internal-media/")
+# Cache alias of the tagged API response cache (see utils.response_cache).
+RESPONSE_CACHE_ALIAS = os.environ.get("RESPONSE_CACHE_ALIAS", "default")
+# Expired responses are served for this long while one worker refreshes them.
+RESPONSE_CACHE_STALE_TTL = int(os.environ.get("RESPONSE_CACHE_STALE_TTL", "86400"))
+RESPONSE_CACHE_XFETCH_BETA = float(os.environ.get("RESPONSE_CACHE_XFETCH_BETA", "1.0"))
+RESPONSE_CACHE_REFRESH_WORKERS = int(os.environ.get("RESPONSE_CACHE_REFRESH_WORKERS", "2"))
+RESPONSE_CACHE_REFRESH_INLINE = bool(int(os.environ.get("RESPONSE_CACHE_REFRESH_INLINE", "0")))
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Riccardo Giannetto  API',
@@ -343,3 +395,15 @@ SPECTACULAR_SETTINGS = {
 
 # AI/ML Configuration
 ENABLE_ML_MODELS = bool(int(os.environ.get("ENABLE_ML_MODELS", "0")))
+# Images per BLIP-2 generate() call, and threads decoding the next batch.
+ML_BATCH_SIZE = int(os.environ.get("ML_BATCH_SIZE", "4"))
+ML_PREPROCESS_WORKERS = int(os.environ.get("ML_PREPROCESS_WORKERS", "2"))
+# Precision of the tagger on CPU: fp32, bf16, or int8 (dynamically quantized
+# language model); compare them with the benchmark_tagger command.
+BLIP2_CPU_MODE = os.environ.get("BLIP2_CPU_MODE", "fp32")
+# Unix socket of the run_ml_server process. When set, other processes caption
+# through it instead of loading the model; if it is down they load it locally
+# (ML_SERVER_FALLBACK=local) or fail the request (error).
+ML_SERVER_SOCKET = os.environ.get("ML_SERVER_SOCKET", "")
+ML_SERVER_TIMEOUT = float(os.environ.get("ML_SERVER_TIMEOUT", "300"))
+ML_SERVER_FALLBACK = os.environ.get("ML_SERVER_FALLBACK", "local")
@@ -0,0 +1,28 @@
+"""
+Common admin list filters.
+"""
+from django.contrib import admin
+from django.db.models import Q
+
+
+class GeotaggedListFilter(admin.SimpleListFilter):
+    """
+    Filter `GeoIndexMixin` rows on whether they have a location.
+
+    Backed by the indexed geohash column instead of the raw coordinates.
+    """
+    title = 'location'
+    parameter_name = 'geotagged'
+
+    def lookups(self, request, model_admin):
+        """Return the filter choices."""
+        return (('yes', 'With location'), ('no', 'Without location'))
+
+    def queryset(self, request, queryset):
+        """Restrict the changelist to the selected choice."""
+        if self.value() == 'yes':
+            return queryset.geotagged()
+        if self.value() == 'no':
+            return queryset.filter(
+                Q(geohash='') | Q(latitude=0, longitude=0))
+        return queryset
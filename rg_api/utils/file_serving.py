@@ -0,0 +1,257 @@
+"""
+Serving of media files, optionally offloaded to the front-end web server.
+
+``MEDIA_SERVE_BACKEND`` selects how a file under ``MEDIA_ROOT`` reaches the
+client:
+
+``django``
+    Stream it from the Python worker with `FileResponse` (development).
+``nginx``
+    Return an empty response with ``X-Accel-Redirect`` pointing at
+    ``MEDIA_SERVE_INTERNAL_URL`` + the path relative to ``MEDIA_ROOT``. nginx
+    needs a matching ``internal`` location aliased to ``MEDIA_ROOT``, e.g.::
+
+        location /internal-media/ {
+            internal;
+            alias /srv/rg_api/files/;
+        }
+
+``sendfile``
+    Return an empty response with ``X-Sendfile`` set to the absolute path
+    (Apache mod_xsendfile, lighttpd).
+
+Headers set by the view (ETag, Cache-Control, Vary, ...) are kept on the
+offloaded response.
+
+Responses advertise ``Accept-Ranges: bytes``. When Django streams the file
+itself, a single-range ``Range`` request (guarded by ``If-Range``) gets a
+``206 Partial Content`` with only the requested bytes; the file is positioned
+at the start of the range, so WSGI servers with ``wsgi.file_wrapper`` still
+use ``sendfile``. Offloading web servers handle ranges themselves.
+"""
+import io
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+BACKENDS = ('django', 'nginx', 'sendfile')
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range lies outside the file."""
+
+
+class FileRange:
+    """
+    Read-only view of the bytes ``[start, start + length)`` of an open file.
+
+    Positions are relative to the start of the range, so `FileResponse`
+    computes the range length as Content-Length; `fileno` lets WSGI servers
+    ``sendfile`` from the current offset.
+    """
+
+    def __init__(self, file_obj, start, length):
+        self._file = file_obj
+        self._start = start
+        self._length = length
+        self.name = getattr(file_obj, 'name', '')
+        file_obj.seek(start)
+
+    def tell(self):
+        """Position within the range."""
+        return self._file.tell() - self._start
+
+    def seekable(self):
+        """Ranges are always seekable."""
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Move within the range, clamped to its bounds."""
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.tell(),
+                io.SEEK_END: self._length}[whence]
+        position = min(max(base + offset, 0), self._length)
+        self._file.seek(self._start + position)
+        return position
+
+    def read(self, size=-1):
+        """Read up to `size` bytes without crossing the end of the range."""
+        remaining = self._length - self.tell()
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self._file.read(size) if size > 0 else b''
+
+    def fileno(self):
+        """File descriptor of the underlying file."""
+        return self._file.fileno()
+
+    def close(self):
+        """Close the underlying file."""
+        self._file.close()
+
+
+def parse_range(header, size):
+    """
+    Parse a ``Range`` header against a file of `size` bytes.
+
+    Only single ``bytes`` ranges are honoured; anything else returns None and
+    the whole file is served, as RFC 9110 allows.
+
+    Returns:
+        tuple | None: Inclusive (first, last) byte positions.
+
+    Raises:
+        RangeNotSatisfiable: If the range does not overlap the file.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+
+    first = int(first)
+    if last and int(last) < first:
+        # Invalid range: ignore the header.
+        return None
+    last = int(last) if last else size - 1
+    if first >= size:
+        raise RangeNotSatisfiable
+    return first, min(last, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    """Whether the ``If-Range`` precondition (if any) allows a partial reply."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Only strong validators match.
+        return etag is not None and if_range == etag
+    return last_modified is not None and if_range == http_date(last_modified)
+
+
+def _backend():
+    """Return the configured serving backend."""
+    backend = getattr(settings, 'MEDIA_SERVE_BACKEND', 'django')
+    if backend not in BACKENDS:
+        raise ImproperlyConfigured(
+            f"MEDIA_SERVE_BACKEND must be one of {', '.join(BACKENDS)}, "
+            f"not {backend!r}")
+    return backend
+
+
+def _media_relative_path(path):
+    """Path of `path` relative to MEDIA_ROOT, or None if it lies outside."""
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([media_root, real_path]) != media_root:
+        return None
+    return os.path.relpath(real_path, media_root).replace(os.sep, '/')
+
+
+def file_response(request, path, content_type, etag=None, last_modified=None):
+    """
+    Build the response serving the file at `path`.
+
+    Files outside ``MEDIA_ROOT`` are always streamed by Django, since the web
+    server has no internal location for them. `etag` and `last_modified`
+    (a timestamp) are the validators ``If-Range`` is checked against.
+
+    Raises:
+        OSError: With the ``django`` backend, if the file cannot be opened.
+    """
+    backend = _backend()
+    relative_path = _media_relative_path(path)
+
+    if backend == 'django' or relative_path is None:
+        response = _stream_file(request, path, content_type, etag,
+                                last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    response = HttpResponse(content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    if backend == 'nginx':
+        prefix = getattr(settings, 'MEDIA_SERVE_INTERNAL_URL', '/internal-media/')
+        response['X-Accel-Redirect'] = \
+            prefix.rstrip('/') + '/' + quote(relative_path)
+    else:
+        response['X-Sendfile'] = os.path.realpath(path)
+    return response
+
+
+def _stream_file(request, path, content_type, etag, last_modified):
+    """Stream `path` from Django, honouring a single byte range."""
+    size = os.stat(path).st_size
+    byte_range = None
+    if request.method == 'GET' and \
+            _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416, content_type=content_type)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file_obj = open(path, 'rb')  # closed by the response
+
+    if byte_range is None:
+        return FileResponse(file_obj, content_type=content_type)
+
+    first, last = byte_range
+    response = FileResponse(
+        FileRange(file_obj, first, last - first + 1),
+        content_type=content_type, status=206)
+    response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    return response
+
+
+def media_response(request, path, content_type=None, max_age=None):
+    """
+    Serve a stored media file with validators, caching and range support.
+
+    The ETag is derived from the file's mtime and size; conditional requests
+    are answered with 304 before the file is opened.
+
+    Raises:
+        Http404: If the file does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as exc:
+        raise Http404 from exc
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    content_type = content_type or \
+        mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        try:
+            response = file_response(
+                request, path, content_type, etag, last_modified)
+        except OSError as exc:
+            raise Http404 from exc
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if max_age is not None:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return response
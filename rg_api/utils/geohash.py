@@ -0,0 +1,73 @@
+"""
+Geohash encoding.
+
+A geohash interleaves the bits of longitude and latitude bisections and
+writes them in base 32, five bits per character. Every character narrows the
+cell, so points sharing a prefix lie in the same cell and a prefix match
+(``LIKE 'u0n%'``) on an indexed column selects a rectangular area.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_PRECISION = 12
+
+
+def encode(latitude, longitude, precision=MAX_PRECISION):
+    """Return the geohash of a point, `precision` characters long."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        # Even bits bisect longitude, odd bits latitude.
+        interval, coordinate = (lon_range, longitude) if even \
+            else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def decode_bounds(geohash):
+    """Return the cell of `geohash` as (min_lat, min_lon, max_lat, max_lon)."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def cell_size(precision):
+    """Return the (height, width) in degrees of a `precision` cell."""
+    bits = 5 * precision
+    lon_bits = math.ceil(bits / 2)
+    return 180.0 / 2 ** (bits - lon_bits), 360.0 / 2 ** lon_bits
+
+
+def common_prefix(*geohashes):
+    """Longest prefix shared by `geohashes` (their smallest common cell)."""
+    prefix = []
+    for chars in zip(*geohashes):
+        if any(char != chars[0] for char in chars):
+            break
+        prefix.append(chars[0])
+    return ''.join(prefix)
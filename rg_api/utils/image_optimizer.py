@@ -1,5 +1,6 @@
 """ Image optimization utilities using Pillow. """
 import logging
+import math
 from io import BytesIO
 import os
 from PIL import Image, ImageOps, UnidentifiedImageError
@@ -14,16 +15,148 @@ class ImageOptimizer:
     This class provides methods to handle image compression, resizing, and format conversion
     while attempting to preserve quality and metadata like ICC profiles where appropriate.
     It is designed to work with both file paths and file-like objects.
+
+    JPEG sources are decoded in draft mode (DCT scaling by 1/2, 1/4 or 1/8)
+    when the target is much smaller than the original. The reduced decode is
+    kept at least `DRAFT_OVERSAMPLE` times the target size, and the final
+    downscale is still done with LANCZOS.
     """
+    # Minimum ratio between the draft decode and the target size.
+    DRAFT_OVERSAMPLE = 2
+
+    # Bump when the encoding pipeline changes, to invalidate cached previews.
+    ENCODER_VERSION = 1
+
+    # Quality ladders per output format: (max width, quality), the last step
+    # applies to any larger width. AVIF holds up at lower settings than WebP;
+    # JPEG is the fallback for clients accepting neither.
+    QUALITY_LADDERS = {
+        'WEBP': ((800, 55), (1200, 65), (None, 70)),
+        'AVIF': ((800, 45), (1200, 50), (None, 55)),
+        'JPEG': ((800, 72), (1200, 78), (None, 82)),
+    }
+
+    @classmethod
+    def _determine_quality(cls, width, output_format='WEBP'):
+        """Determines compression quality based on image width and format."""
+        ladder = cls.QUALITY_LADDERS.get(
+            output_format.upper(), cls.QUALITY_LADDERS['WEBP'])
+        for max_width, quality in ladder:
+            if max_width is None or width <= max_width:
+                return quality
+        return ladder[-1][1]
+
+    @classmethod
+    def encoder_signature(cls, width, output_format='WEBP'):
+        """
+        Describe the encoder settings used for a `width` preview.
+
+        Any change to the output of `compress_and_resize` for the same source
+        should change this string; it is part of the preview cache key.
+        """
+        fmt = output_format.upper()
+        return (f"v{cls.ENCODER_VERSION}:{fmt}:"
+                f"q{cls._determine_quality(width, fmt)}:"
+                f"draft{cls.DRAFT_OVERSAMPLE}")
+
+    @classmethod
+    def _apply_draft(cls, img, width):
+        """
+        Configure a reduced JPEG decode for an output `width` pixels wide.
+
+        Must be called before the image data is loaded. The width refers to
+        the displayed (EXIF-oriented) image, so axes are swapped for rotated
+        orientations. Non-JPEG images are left untouched.
+        """
+        if not width or img.format != 'JPEG':
+            return
+        orientation = img.getexif().get(0x0112, 1)
+        raw_width, raw_height = img.size
+        displayed_width = raw_height if orientation in (5, 6, 7, 8) else raw_width
+
+        ratio = width * cls.DRAFT_OVERSAMPLE / float(displayed_width)
+        if ratio >= 0.5:
+            # Not even a 1/2 reduction would keep the oversample guard.
+            return
+        img.draft(None, (math.ceil(raw_width * ratio),
+                         math.ceil(raw_height * ratio)))
 
     @staticmethod
-    def _determine_quality(width):
-        """Determines compression quality based on image width."""
-        if width <= 800:
-            return 55
-        if width <= 1200:
-            return 65
-        return 70
+    def _resize_to_width(img, width):
+        """Downscale `img` to `width` keeping the aspect ratio (never upscales)."""
+        if not width or width >= img.width:
+            return img
+        wpercent = width / float(img.width)
+        hsize = int((float(img.height) * float(wpercent)))
+
+        # Use LANCZOS for high quality downsampling (similar/better to Inter-Area)
+        return img.resize((width, hsize), Image.Resampling.LANCZOS)
+
+    @staticmethod
+    def _convert_for_format(img, fmt):
+        """Convert the image mode to one the output format supports."""
+        # Check if we need to convert to RGB (e.g. for JPEG which doesn't support Alpha)
+        if fmt == 'JPEG':
+            if img.mode in ('RGBA', 'LA') or \
+                (img.mode == 'P' and
+                 'transparency' in img.info):
+                # Create white background for transparent images
+                background = Image.new(
+                    "RGB", img.size, (255, 255, 255))
+                if img.mode == 'P':
+                    img = img.convert('RGBA')
+                if img.mode in ('RGBA', 'LA'):
+                    background.paste(img, mask=img.split()[-1])
+                return background
+            if img.mode != 'RGB':
+                return img.convert('RGB')
+            return img
+
+        # For WEBP/PNG, keeping RGBA is fine, but convert 'P' to RGBA/RGB to be safe
+        if img.mode == 'P':
+            return img.convert('RGBA')
+        return img
+
+    @classmethod
+    def _save(cls, img, output_path, fmt, quality, icc_profile):
+        """
+        Encode `img` to `output_path`, or to a buffer if no path is given.
+
+        Returns:
+            True if saved to a file, else a BytesIO positioned at the start.
+        """
+        img = cls._convert_for_format(img, fmt)
+
+        # Determine Quality settings
+        if quality is None:
+            quality = cls._determine_quality(img.width, fmt)
+
+        save_kwargs = {
+            'quality': quality,
+            'optimize': True,
+        }
+
+        if fmt == 'WEBP':
+            save_kwargs['method'] = 6
+        elif fmt == 'JPEG':
+            save_kwargs['progressive'] = True
+        elif fmt == 'PNG':
+            save_kwargs['compress_level'] = 9
+
+        if icc_profile:
+            save_kwargs['icc_profile'] = icc_profile
+
+        # Save
+        if output_path:
+            # Ensure directory exists
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            img.save(output_path, fmt, **save_kwargs)
+            return True
+
+        output = BytesIO()
+        img.save(output, fmt, **save_kwargs)
+        output.seek(0)
+        return output
 
     @classmethod
     def compress_and_resize(cls,
@@ -31,7 +164,8 @@ class ImageOptimizer:
                             output_path=None,
                             width=None,
                             output_format='WEBP',
-                            quality=None):
+                            quality=None,
+                            draft=True):
         """
         Compresses and resizes an image using Pillow.
 
@@ -41,6 +175,7 @@ class ImageOptimizer:
             width: Target width. If None, uses original width.
             output_format: Output format (default 'WEBP').
             quality: Compression quality (1-100). If None, calculated based on width.
+            draft: Allow reduced JPEG decoding for large downscales.
 
         Returns:
             bytes if output_path is None, else saves to file.
@@ -51,71 +186,115 @@ class ImageOptimizer:
                 # Capture ICC profile before any operations
                 original_icc_profile = img.info.get('icc_profile')
 
+                if draft:
+                    cls._apply_draft(img, width)
+
                 # Auto-rotate based on EXIF tag
                 img = ImageOps.exif_transpose(img)
 
                 # Resize if needed
-                if width and width < img.width:
-                    wpercent = width / float(img.width)
-                    hsize = int((float(img.height) * float(wpercent)))
-
-                    # Use LANCZOS for high quality downsampling (similar/better to Inter-Area)
-                    img = img.resize((width, hsize), Image.Resampling.LANCZOS)
-
-                # Handle Format Specific Conversions
-                fmt = output_format.upper()
-
-                # Check if we need to convert to RGB (e.g. for JPEG which doesn't support Alpha)
-                if fmt == 'JPEG':
-                    if img.mode in ('RGBA', 'LA') or \
-                        (img.mode == 'P' and
-                         'transparency' in img.info):
-                        # Create white background for transparent images
-                        background = Image.new(
-                            "RGB", img.size, (255, 255, 255))
-                        if img.mode == 'P':
-                            img = img.convert('RGBA')
-                        if img.mode in ('RGBA', 'LA'):
-                            background.paste(img, mask=img.split()[-1])
-                        img = background
-                    elif img.mode != 'RGB':
-                        img = img.convert('RGB')
-
-                # For WEBP/PNG, keeping RGBA is fine, but convert 'P' to RGBA/RGB to be safe
-                elif img.mode == 'P':
-                    img = img.convert('RGBA')
+                img = cls._resize_to_width(img, width)
+
+                return cls._save(img, output_path, output_format.upper(),
+                                 quality, original_icc_profile)
+
+        except (IOError, OSError, UnidentifiedImageError) as e:
+            logger.error("Error optimizing image: %s", e)
+            return None
+
+    @classmethod
+    def compress_and_resize_many(cls,
+                                 image_path_or_file,
+                                 widths,
+                                 output_paths=None,
+                                 output_format='WEBP',
+                                 quality=None,
+                                 draft=True):
+        """
+        Produces several widths of an image from a single decode.
+
+        The source is opened, decoded and EXIF-oriented once, then downscaled
+        progressively from the largest to the smallest width (each output is
+        resampled from the previous, larger one) and encoded.
+
+        Args:
+            image_path_or_file: Path to the image or a file-like object.
+            widths: Iterable of target widths. Widths at or above the source
+                width produce an unscaled copy.
+            output_paths: Optional mapping of width to output path. Widths
+                without a path are returned as bytes.
+            output_format: Output format (default 'WEBP').
+            quality: Compression quality (1-100). If None, calculated per width.
+            draft: Allow reduced JPEG decoding, sized for the largest width.
+
+        Returns:
+            dict mapping each width to its output path (or a BytesIO), or None
+            if the source could not be read.
+        """
+        fmt = output_format.upper()
+        results = cls.compress_and_resize_variants(
+            image_path_or_file,
+            [(width, fmt) for width in widths],
+            output_paths={(width, fmt): path
+                          for width, path in (output_paths or {}).items()},
+            quality=quality,
+            draft=draft)
+        if results is None:
+            return None
+        return {width: output for (width, _), output in results.items()}
+
+    @classmethod
+    def compress_and_resize_variants(cls,
+                                     image_path_or_file,
+                                     variants,
+                                     output_paths=None,
+                                     quality=None,
+                                     draft=True):
+        """
+        Produces several (width, format) variants of an image from one decode.
+
+        Like `compress_and_resize_many`, but each width may be encoded to
+        several output formats; every width is resampled only once.
+
+        Args:
+            image_path_or_file: Path to the image or a file-like object.
+            variants: Iterable of (width, output format) pairs.
+            output_paths: Optional mapping of (width, format) to output path.
+                Variants without a path are returned as bytes.
+            quality: Compression quality (1-100). If None, calculated per
+                width and format.
+            draft: Allow reduced JPEG decoding, sized for the largest width.
+
+        Returns:
+            dict mapping each (width, format) to its output path (or a
+            BytesIO), or None if the source could not be read.
+        """
+        output_paths = {(width, fmt.upper()): path
+                        for (width, fmt), path in (output_paths or {}).items()}
+        formats_by_width = {}
+        for width, fmt in variants:
+            formats = formats_by_width.setdefault(width, [])
+            if fmt.upper() not in formats:
+                formats.append(fmt.upper())
+
+        results = {}
+        try:
+            with Image.open(image_path_or_file) as img:
+                original_icc_profile = img.info.get('icc_profile')
+                if draft and formats_by_width:
+                    cls._apply_draft(img, max(formats_by_width))
+                current = ImageOps.exif_transpose(img)
 
-                # Determine Quality settings
-                if quality is None:
-                    quality = cls._determine_quality(img.width)
-
-                save_kwargs = {
-                    'quality': quality,
-                    'optimize': True,
-                }
-
-                if fmt == 'WEBP':
-                    save_kwargs['method'] = 6
-                elif fmt == 'JPEG':
-                    save_kwargs['progressive'] = True
-                elif fmt == 'PNG':
-                    save_kwargs['compress_level'] = 9
-
-                if original_icc_profile:
-                    save_kwargs['icc_profile'] = original_icc_profile
-
-                # Save
-                if output_path:
-                    # Ensure directory exists
-                    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                    img.save(output_path, fmt, **save_kwargs)
-                    return True
-                else:
-                    output = BytesIO()
-                    img.save(output, fmt, **save_kwargs)
-                    output.seek(0)
-                    return output
+                for width in sorted(formats_by_width, reverse=True):
+                    current = cls._resize_to_width(current, width)
+                    for fmt in formats_by_width[width]:
+                        output_path = output_paths.get((width, fmt))
+                        saved = cls._save(current, output_path, fmt, quality,
+                                          original_icc_profile)
+                        results[(width, fmt)] = \
+                            output_path if output_path else saved
 
         except (IOError, OSError, UnidentifiedImageError) as e:
             logger.error("Error optimizing image: %s", e)
             return None
+        return results
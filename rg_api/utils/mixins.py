@@ -1,13 +1,20 @@
 """
 Common model mixins.
 """
+import math
 import sys
 from django.conf import settings
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
 from django.utils.html import mark_safe
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from . import geohash
 from .image_optimizer import ImageOptimizer
 
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
 
 class ImageOptimizationMixin(models.Model):
     """
@@ -44,3 +51,170 @@ class ImageOptimizationMixin(models.Model):
             )
         return ''
     image_tag.short_description = 'Image Preview'
+
+
+def geohash_of(latitude, longitude):
+    """Geohash stored for a point, or '' when a coordinate is missing."""
+    if latitude is None or longitude is None:
+        return ''
+    return geohash.encode(latitude, longitude)
+
+
+def backfill_geohashes(model, batch_size=1000):
+    """
+    Fill the geohash of every `model` row with coordinates.
+
+    Walks the table in primary key order and writes each batch with
+    ``bulk_update`` (plain UPDATEs), so it runs on any backend, and also
+    on the historical models of a migration.
+
+    Returns:
+        int: Number of rows updated.
+    """
+    manager = model._base_manager
+    last_pk = None
+    updated = 0
+    while True:
+        rows = manager.filter(
+            latitude__isnull=False, longitude__isnull=False
+        ).only('pk', 'latitude', 'longitude', 'geohash').order_by('pk')
+        if last_pk is not None:
+            rows = rows.filter(pk__gt=last_pk)
+        rows = list(rows[:batch_size])
+        if not rows:
+            return updated
+        last_pk = rows[-1].pk
+
+        changed = []
+        for row in rows:
+            value = geohash_of(row.latitude, row.longitude)
+            if row.geohash != value:
+                row.geohash = value
+                changed.append(row)
+        manager.bulk_update(changed, ['geohash'])
+        updated += len(changed)
+
+
+class GeoQuerySet(models.QuerySet):
+    """
+    QuerySet of a `GeoIndexMixin` model: spatial lookups on the geohash index.
+
+    Bulk writes keep the geohash in sync with the coordinates they write.
+    """
+
+    def geotagged(self):
+        """Rows with coordinates, excluding the (0, 0) placeholder."""
+        return self.exclude(geohash='').exclude(latitude=0, longitude=0)
+
+    def in_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        """
+        Rows inside a bounding box, in degrees.
+
+        A box with ``min_lon > max_lon`` crosses the antimeridian. Otherwise
+        the smallest geohash cell holding the box turns the scan into an
+        index range (``geohash LIKE 'prefix%'``).
+        """
+        rows = self.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+        if min_lon > max_lon:
+            return rows.filter(
+                Q(longitude__gte=min_lon) | Q(longitude__lte=max_lon))
+
+        rows = rows.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+        prefix = geohash.common_prefix(
+            geohash.encode(min_lat, min_lon), geohash.encode(max_lat, max_lon))
+        if prefix:
+            rows = rows.filter(geohash__startswith=prefix)
+        return rows
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """
+        Rows within `radius_km` of a point, annotated with ``distance`` (km).
+
+        The bounding box of the circle is matched first (see `in_bbox`), then
+        the great-circle (haversine) distance.
+        """
+        lat_delta = radius_km / KM_PER_DEGREE
+        min_lat = max(latitude - lat_delta, -90.0)
+        max_lat = min(latitude + lat_delta, 90.0)
+        cos_lat = math.cos(math.radians(latitude))
+        if max_lat >= 90 or min_lat <= -90 or \
+                radius_km / KM_PER_DEGREE >= 180 * cos_lat:
+            # The circle covers a pole or every longitude.
+            rows = self.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+        else:
+            lon_delta = lat_delta / cos_lat
+            min_lon = (longitude - lon_delta + 180) % 360 - 180
+            max_lon = (longitude + lon_delta + 180) % 360 - 180
+            rows = self.in_bbox(min_lon, min_lat, max_lon, max_lat)
+
+        lat, lon = math.radians(latitude), math.radians(longitude)
+        haversine = \
+            Power(Sin((Radians(F('latitude')) - lat) / 2), 2) + \
+            math.cos(lat) * Cos(Radians(F('latitude'))) * \
+            Power(Sin((Radians(F('longitude')) - lon) / 2), 2)
+        return rows.annotate(
+            distance=2 * EARTH_RADIUS_KM * ASin(Sqrt(haversine))
+        ).filter(distance__lte=radius_km)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Create rows, filling their geohash from the coordinates."""
+        objs = list(objs)
+        for obj in objs:
+            obj.update_geohash()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        """Update rows, rewriting the geohash when coordinates are written."""
+        fields = list(fields)
+        if 'latitude' in fields or 'longitude' in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.update_geohash()
+            if 'geohash' not in fields:
+                fields.append('geohash')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        """Update rows, rewriting the geohash when both coordinates are set."""
+        if 'latitude' in kwargs and 'longitude' in kwargs:
+            latitude, longitude = kwargs['latitude'], kwargs['longitude']
+            if not any(hasattr(value, 'resolve_expression')
+                       for value in (latitude, longitude)):
+                kwargs.setdefault('geohash', geohash_of(latitude, longitude))
+        return super().update(**kwargs)
+
+    update.alters_data = True
+
+
+class GeoIndexMixin(models.Model):
+    """
+    Mixin indexing the location of models with 'latitude' and 'longitude'.
+
+    Stores the geohash of the coordinates in an indexed column, filled on
+    save and by the bulk writes of `GeoQuerySet`, whose `in_bbox` and
+    `within_radius` lookups use it. Rows changed otherwise (raw SQL,
+    ``update()`` of a single coordinate) are repaired by the
+    ``backfill_geohashes`` management command.
+    """
+    geohash = models.CharField(
+        max_length=geohash.MAX_PRECISION, blank=True, editable=False,
+        db_index=True)
+
+    objects = GeoQuerySet.as_manager()
+
+    class Meta:
+        """Meta options for GeoIndexMixin."""
+        abstract = True
+
+    def update_geohash(self):
+        """Recompute the geohash from the current coordinates."""
+        self.geohash = geohash_of(self.latitude, self.longitude)
+
+    def save(self, *args, **kwargs):
+        """Save, keeping the geohash in sync with the coordinates."""
+        self.update_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and \
+                {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
@@ -1,7 +1,15 @@
 """
 Base pagination classes for common use cases.
 """
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardPagination(PageNumberPagination):
@@ -17,3 +25,147 @@ class StandardPagination(PageNumberPagination):
     page_size = 5
     page_size_query_param = 'page_size'
     max_page_size = 12
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination on ``ordering``, e.g. ``('-date', '-id')``.
+
+    Each page is fetched with ``WHERE (key, id) < (last key, last id)`` in the
+    index order instead of an ``OFFSET``, and no ``COUNT(*)`` is run, so a deep
+    page costs the same as the first one. Cursors are opaque tokens holding
+    the key of the last row returned. NULL keys sort last.
+
+    The mode is opt-in: it applies when the request carries the ``cursor``
+    parameter (empty for the first page). Other requests are handled by
+    ``page_number_class``, so existing page-number clients are unaffected.
+    In keyset mode the ``ordering`` query parameter is ignored.
+
+    Attributes:
+        ordering (tuple): Key field and tie-breaker, both ascending or both
+            descending (prefix '-').
+        page_number_class (type): Pagination used without a cursor.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 12
+    cursor_query_param = 'cursor'
+    page_number_class = StandardPagination
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.fallback = None
+        self.request = None
+        self.next_position = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return one page of `queryset`, or None if pagination is disabled."""
+        if self.cursor_query_param not in request.query_params:
+            self.fallback = self.page_number_class()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        key, tie_breaker = self.ordering
+        descending = key.startswith('-')
+        key_field, id_field = key.lstrip('-'), tie_breaker.lstrip('-')
+        nullable = queryset.model._meta.get_field(key_field).null
+
+        key_order = F(key_field).desc(nulls_last=True) if descending \
+            else F(key_field).asc(nulls_last=True)
+        queryset = queryset.order_by(key_order, tie_breaker)
+
+        position = self.decode_cursor(request, queryset.model, key_field)
+        if position is not None:
+            queryset = queryset.filter(self._after(
+                key_field, id_field, position, descending, nullable))
+
+        rows = list(queryset[:page_size + 1])
+        page = rows[:page_size]
+        self.next_position = None
+        if len(rows) > page_size:
+            last = page[-1]
+            self.next_position = (getattr(last, key_field),
+                                  getattr(last, id_field))
+        return page
+
+    @staticmethod
+    def _after(key_field, id_field, position, descending, nullable):
+        """Filter selecting the rows that follow `position` in the ordering."""
+        value, last_id = position
+        past = 'lt' if descending else 'gt'
+        same_key_after = Q(**{f'{id_field}__{past}': last_id})
+        if value is None:
+            # NULL keys come last; only ties on NULL remain.
+            return Q(**{f'{key_field}__isnull': True}) & same_key_after
+        after = Q(**{f'{key_field}__{past}': value}) | \
+            (Q(**{key_field: value}) & same_key_after)
+        if nullable:
+            after |= Q(**{f'{key_field}__isnull': True})
+        return after
+
+    def get_page_size(self, request):
+        """Page size from the query string, capped at `max_page_size`."""
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request, model, key_field):
+        """Decode the cursor of `request` into (key, id), or None for page one."""
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            value, last_id = json.loads(
+                base64.urlsafe_b64decode(padded.encode('ascii')))
+            if value is not None:
+                value = model._meta.get_field(key_field).to_python(value)
+            return value, int(last_id)
+        except (TypeError, ValueError, ValidationError, UnicodeError) as exc:
+            raise NotFound(self.invalid_cursor_message) from exc
+
+    def encode_cursor(self, position):
+        """Opaque URL of the page following `position`."""
+        value, last_id = position
+        if hasattr(value, 'isoformat'):
+            # Full precision: DjangoJSONEncoder would drop microseconds.
+            value = value.isoformat()
+        payload = json.dumps([value, last_id])
+        token = base64.urlsafe_b64encode(
+            payload.encode('utf-8')).decode('ascii').rstrip('=')
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def get_next_link(self):
+        """URL of the next page, or None on the last page."""
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        """Wrap a page of results with the link to the next page."""
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        """Schema of page-number responses (keyset pages omit ``count``)."""
+        return self.page_number_class().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        """Page-number parameters plus the keyset ``cursor``."""
+        return self.page_number_class().get_schema_operation_parameters(view) + [{
+            'name': self.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Keyset cursor (empty for the first page); '
+                           'disables page-number pagination.',
+            'schema': {'type': 'string'},
+        }]
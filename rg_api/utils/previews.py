@@ -0,0 +1,223 @@
+"""
+Content-addressed image previews and their HTTP responses.
+
+A preview is stored as ``{prefix}_{width}_{key}.{ext}`` where `key` hashes the
+source file content together with the encoder parameters. Replacing the source
+(or changing how previews are encoded) therefore yields a new file name
+instead of serving a stale one. The same key is the strong ETag of the
+response, so conditional requests are answered with 304 from the source
+``stat`` alone, without opening the preview.
+
+The output format is negotiated on ``Accept``: AVIF or WebP when the client
+names them explicitly, progressive JPEG otherwise. Each format is a separate
+file with its own key, and responses carry ``Vary: Accept``.
+"""
+import glob
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date
+from PIL import features
+
+from .file_serving import file_response
+from .image_optimizer import ImageOptimizer
+from .single_flight import get_or_render
+
+logger = logging.getLogger(__name__)
+
+# Output format -> (file extension, content type), in order of preference.
+PREVIEW_FORMATS = {
+    'AVIF': ('avif', 'image/avif'),
+    'WEBP': ('webp', 'image/webp'),
+    'JPEG': ('jpg', 'image/jpeg'),
+}
+
+# Served to clients that accept none of the other formats.
+FALLBACK_FORMAT = 'JPEG'
+
+# Source digests memoized in-process, keyed by (path, mtime, size).
+DIGEST_MEMO_SIZE = 4096
+DIGEST_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+_digest_lock = threading.Lock()
+_digests = OrderedDict()
+
+
+def source_digest(source_path, stat=None):
+    """
+    Return the SHA-256 of a source file.
+
+    Digests are memoized by path, mtime and size, in-process and in the
+    default cache, so a file is only read again after it changes.
+    """
+    stat = stat or os.stat(source_path)
+    memo_key = (source_path, stat.st_mtime_ns, stat.st_size)
+    with _digest_lock:
+        digest = _digests.get(memo_key)
+        if digest is not None:
+            _digests.move_to_end(memo_key)
+            return digest
+
+    cache_key = "preview:digest:" + hashlib.sha1(
+        f"{source_path}:{stat.st_mtime_ns}:{stat.st_size}".encode('utf-8')
+    ).hexdigest()
+    digest = cache.get(cache_key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(source_path, 'rb') as source:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        cache.set(cache_key, digest, DIGEST_CACHE_TIMEOUT)
+
+    with _digest_lock:
+        _digests[memo_key] = digest
+        while len(_digests) > DIGEST_MEMO_SIZE:
+            _digests.popitem(last=False)
+    return digest
+
+
+@lru_cache(maxsize=None)
+def supported_formats():
+    """Preview formats the installed Pillow can encode, in order of preference."""
+    return tuple(fmt for fmt in PREVIEW_FORMATS
+                 if fmt == FALLBACK_FORMAT or features.check(fmt.lower()))
+
+
+def _accepted_types(accept_header):
+    """Map each media type of an ``Accept`` header to its quality value."""
+    accepted = {}
+    for item in accept_header.split(','):
+        media_type, *params = item.strip().split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type:
+            accepted[media_type.strip().lower()] = quality
+    return accepted
+
+
+def negotiate_format(request):
+    """
+    Pick the preview format for `request` from its ``Accept`` header.
+
+    Only formats the client names explicitly (with a non-zero quality) are
+    chosen, preferring AVIF over WebP; wildcards fall back to JPEG, which
+    every client can decode.
+    """
+    accepted = _accepted_types(request.META.get('HTTP_ACCEPT', ''))
+    for fmt in supported_formats():
+        if fmt != FALLBACK_FORMAT and accepted.get(PREVIEW_FORMATS[fmt][1], 0) > 0:
+            return fmt
+    return FALLBACK_FORMAT
+
+
+def preview_key(digest, width, fmt='WEBP'):
+    """Key of a preview: source digest plus everything the encoder depends on."""
+    signature = ImageOptimizer.encoder_signature(width, fmt)
+    return hashlib.sha256(
+        f"{digest}:{width}:{signature}".encode('utf-8')).hexdigest()[:20]
+
+
+def preview_filename(directory, prefix, width, key, fmt='WEBP'):
+    """Path of the preview identified by `key`."""
+    extension = PREVIEW_FORMATS[fmt][0]
+    return os.path.join(directory, f"{prefix}_{width}_{key}.{extension}")
+
+
+def purge_stale_previews(directory, prefix, width, current_path, fmt='WEBP'):
+    """Remove previews of the same image, width and format built from older sources."""
+    extension = PREVIEW_FORMATS[fmt][0]
+    pattern = os.path.join(directory, f"{prefix}_{width}_*.{extension}")
+    for path in glob.glob(pattern):
+        if path != current_path:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning("Could not remove stale preview %s: %s", path, e)
+
+
+def render_preview_file(source_path, directory, prefix, width, fmt='WEBP',
+                        key=None):
+    """
+    Return the path of a preview, rendering it once if it does not exist.
+
+    Returns:
+        str | None: The preview path, or None if rendering failed.
+    """
+    if key is None:
+        key = preview_key(source_digest(source_path), width, fmt)
+    path = preview_filename(directory, prefix, width, key, fmt)
+    if os.path.exists(path):
+        return path
+
+    rendered = get_or_render(
+        path,
+        lambda temp_path: ImageOptimizer.compress_and_resize(
+            source_path, output_path=temp_path, width=width,
+            output_format=fmt),
+    )
+    if rendered:
+        purge_stale_previews(directory, prefix, width, path, fmt)
+    return rendered
+
+
+def preview_response(request, source_path, directory, prefix, width,
+                     fmt=None):
+    """
+    Serve a preview of `source_path`, honouring conditional request headers.
+
+    Unless `fmt` is given, the format is negotiated with `negotiate_format`.
+    The response carries a strong ETag (the preview key), the source
+    Last-Modified time and a ``Cache-Control`` max-age from
+    ``PREVIEW_CACHE_MAX_AGE``. ``If-None-Match`` / ``If-Modified-Since``
+    matches get a 304 without touching the preview file. The file itself is
+    sent by `utils.file_serving.file_response`, possibly by the web server.
+
+    Raises:
+        Http404: If the source is missing or the preview cannot be rendered.
+    """
+    fmt = fmt or negotiate_format(request)
+    try:
+        stat = os.stat(source_path)
+        key = preview_key(source_digest(source_path, stat), width, fmt)
+    except OSError as exc:
+        raise Http404 from exc
+
+    etag = f'"{key}"'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        path = render_preview_file(
+            source_path, directory, prefix, width, fmt, key=key)
+        if not path:
+            raise Http404
+        try:
+            response = file_response(
+                request, path, PREVIEW_FORMATS[fmt][1], etag, last_modified)
+        except OSError as exc:
+            raise Http404 from exc
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Accept',))
+    patch_cache_control(
+        response, public=True,
+        max_age=getattr(settings, 'PREVIEW_CACHE_MAX_AGE', 60 * 60 * 24))
+    return response
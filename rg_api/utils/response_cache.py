@@ -0,0 +1,339 @@
+"""
+Tagged response cache for read-only API views.
+
+Cached responses are stored under a key that embeds the current *version* of
+each of their tags. A list response is tagged with its model (and the models
+its serializer depends on); a detail response with its object's lookup value.
+Invalidating a tag just replaces its version, so every entry built from the
+old version becomes unreachable at once and expires on its own. Signal
+handlers (see ``gallery.signals`` and ``blog.signals``) invalidate exactly the
+list and detail tags of the instances that changed, once the transaction
+that changed them commits (see `invalidate_on_commit`): purging earlier would
+let a concurrent request re-cache the old rows under the new versions.
+
+Versions are random tokens rather than counters, so an evicted version can
+never be recreated and resurrect stale entries.
+
+Requests from authenticated users bypass the cache.
+
+Entries are served stale-while-revalidate: after `timeout` seconds an entry
+is *stale* but kept for another ``RESPONSE_CACHE_STALE_TTL`` seconds. A stale
+hit is answered from the cache immediately while a single background worker
+(elected with ``cache.add``) re-runs the view and replaces the entry. The
+refresh runs on a detached copy of the request and is not throttled. Refreshes
+also start early with a probability that grows as expiry approaches,
+weighted by how long the response took to compute ("XFetch"), so popular
+entries are renewed before they expire and not all at the same moment.
+"""
+import functools
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from django.http import HttpRequest, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'response-cache'
+
+# A refresh that has not finished after this long may be retried.
+REFRESH_LOCK_TIMEOUT = 60
+
+_executor_lock = threading.Lock()
+_state = threading.local()
+
+# Response headers replayed from the cache.
+STORED_HEADERS = ('Content-Type', 'Content-Language', 'Vary', 'Allow')
+
+# Request headers copied onto the request of a background refresh.
+DETACHED_META = ('HTTP_ACCEPT', 'HTTP_HOST', 'HTTP_X_FORWARDED_HOST',
+                 'SERVER_NAME', 'SERVER_PORT', 'QUERY_STRING')
+
+
+def _cache():
+    """Return the cache holding responses and tag versions."""
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def model_tag(model):
+    """Tag shared by every response listing `model`."""
+    return f"{model._meta.label_lower}"
+
+
+def detail_tag(model, field, value):
+    """Tag of the responses for the `model` object whose `field` is `value`."""
+    return f"{model._meta.label_lower}:{field}={value}"
+
+
+def _tag_key(tag):
+    """Cache key of a tag version."""
+    return f"{KEY_PREFIX}:tag:{tag}"
+
+
+def tag_versions(tags):
+    """Return the current version of each tag, creating missing ones."""
+    cache = _cache()
+    keys = [_tag_key(tag) for tag in tags]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            version = uuid.uuid4().hex
+            # Another process may have created the version meanwhile.
+            if not cache.add(key, version, None):
+                version = cache.get(key) or version
+            found[key] = version
+    return [found[key] for key in keys]
+
+
+def invalidate(*tags):
+    """Drop every cached response carrying any of `tags`."""
+    if tags:
+        _cache().set_many(
+            {_tag_key(tag): uuid.uuid4().hex for tag in tags}, None)
+
+
+def remember_lookups(instance, fields):
+    """
+    Record the stored lookup values of `instance` before it is saved.
+
+    Called from ``pre_save`` so that `invalidate_instance` also drops the
+    responses cached under a value the save is about to change (e.g. a slug).
+    """
+    lookups = [field for field in fields if field != 'pk']
+    if instance.pk is None or not lookups:
+        return
+    stored = type(instance)._default_manager.filter(pk=instance.pk) \
+        .values(*lookups).first()
+    instance._response_cache_lookups = stored or {}
+
+
+def instance_tags(instance, fields=('pk',)):
+    """
+    Tags of the list responses of the instance's model and of its details.
+
+    Args:
+        instance: The saved or deleted model instance.
+        fields: Lookup fields its detail endpoints are addressed by.
+    """
+    model = type(instance)
+    tags = {model_tag(model)}
+    previous = getattr(instance, '_response_cache_lookups', {})
+    for field in fields:
+        tags.add(detail_tag(model, field, getattr(instance, field)))
+        if field in previous:
+            tags.add(detail_tag(model, field, previous[field]))
+    return sorted(tags)
+
+
+def invalidate_instance(instance, fields=('pk',)):
+    """Drop the list responses of the instance's model and its details."""
+    invalidate(*instance_tags(instance, fields))
+
+
+def invalidate_on_commit(*tags):
+    """
+    Drop the responses carrying `tags` once the current transaction commits.
+
+    Immediately when not in a transaction; never if it rolls back.
+    """
+    transaction.on_commit(lambda: invalidate(*tags))
+
+
+def _response_key(request, tags):
+    """Cache key of the response to `request` under the current tag versions."""
+    parts = [
+        request.method,
+        request.build_absolute_uri(),
+        request.META.get('HTTP_ACCEPT', ''),
+        *tags,
+        *tag_versions(tags),
+    ]
+    digest = hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+    return f"{KEY_PREFIX}:response:{digest}"
+
+
+def _is_cacheable(request):
+    """Only anonymous, safe requests are served from the cache."""
+    user = getattr(request, 'user', None)
+    return request.method in ('GET', 'HEAD') and \
+        not (user is not None and user.is_authenticated)
+
+
+def _replay(entry):
+    """Rebuild a response from a cache entry."""
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers'].items():
+        response[header] = value
+    return response
+
+
+def _store(key, response, timeout, started):
+    """Store a rendered response under `key`, fresh for `timeout` seconds."""
+    if response.status_code != 200 or response.streaming:
+        return
+    stale_ttl = getattr(settings, 'RESPONSE_CACHE_STALE_TTL', 60 * 60 * 24)
+    _cache().set(key, {
+        'content': response.content,
+        'status': response.status_code,
+        'headers': {header: response[header] for header in STORED_HEADERS
+                    if header in response},
+        'fresh_until': time.time() + timeout,
+        'delta': time.monotonic() - started,
+    }, timeout + stale_ttl)
+
+
+def _should_refresh(entry):
+    """Whether `entry` is stale, or drawn for an early (XFetch) refresh."""
+    beta = getattr(settings, 'RESPONSE_CACHE_XFETCH_BETA', 1.0)
+    # -log(U) is exponentially distributed: usually small, occasionally large.
+    early = entry.get('delta', 0) * beta * -math.log(1.0 - random.random())
+    return time.time() + early >= entry.get('fresh_until', 0)
+
+
+def _get_executor():
+    """Return the process-wide refresh worker pool."""
+    executor = getattr(_get_executor, 'executor', None)
+    if executor is not None:
+        return executor
+    with _executor_lock:
+        executor = getattr(_get_executor, 'executor', None)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RESPONSE_CACHE_REFRESH_WORKERS', 2),
+                thread_name_prefix='response-cache')
+            _get_executor.executor = executor
+    return executor
+
+
+class _DetachedRequest(HttpRequest):
+    """Bare request keeping the scheme of the request it was copied from."""
+
+    def __init__(self, scheme):
+        super().__init__()
+        self._scheme = scheme
+
+    def _get_scheme(self):
+        return self._scheme
+
+
+def _detached_request(request):
+    """
+    Copy of `request` carrying only what the cached response depends on.
+
+    The refresh runs on a pool thread after the original request has been
+    answered, so it must not share (or mutate) that request's state. The
+    copy is anonymous, like every request served from the cache.
+    """
+    detached = _DetachedRequest(request.scheme)
+    detached.method = 'GET'
+    detached.path = request.path
+    detached.path_info = request.path_info
+    detached.GET = request.GET.copy()
+    detached.META = {key: request.META[key] for key in DETACHED_META
+                     if key in request.META}
+    detached.resolver_match = request.resolver_match
+    detached.user = AnonymousUser()
+    return detached
+
+
+def _refresh_view(func):
+    """
+    The view behind `func`, without throttling.
+
+    A refresh is not a client request: it must neither count against the
+    client's rate limit nor be rejected by it.
+    """
+    view_class = getattr(func, 'cls', None)
+    if view_class is None:
+        return func
+    initkwargs = {**func.initkwargs, 'throttle_classes': ()}
+    actions = getattr(func, 'actions', None)
+    if actions is not None:
+        return view_class.as_view(actions, **initkwargs)
+    return view_class.as_view(**initkwargs)
+
+
+def _refresh(request, lock_key):
+    """Re-run the view for detached `request`; its response replaces the entry."""
+    _state.refreshing = True
+    try:
+        match = request.resolver_match
+        view = _refresh_view(match.func)
+        response = view(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        if response.status_code != 200:
+            logger.warning("Refresh of cached response for %s returned %s",
+                           request.path, response.status_code)
+    except Exception as e:
+        logger.error("Error refreshing cached response for %s: %s",
+                     request.path, e)
+    finally:
+        _state.refreshing = False
+        _cache().delete(lock_key)
+        if not getattr(settings, 'RESPONSE_CACHE_REFRESH_INLINE', False):
+            close_old_connections()
+
+
+def _schedule_refresh(key, request):
+    """Start one refresh of `key`, unless another worker already owns it."""
+    lock_key = f"{key}:refresh"
+    if not _cache().add(lock_key, 1, REFRESH_LOCK_TIMEOUT):
+        return False
+    request = _detached_request(request)
+    if getattr(settings, 'RESPONSE_CACHE_REFRESH_INLINE', False):
+        _refresh(request, lock_key)
+        return True
+    try:
+        _get_executor().submit(_refresh, request, lock_key)
+    except RuntimeError:
+        # Interpreter shutting down; the next request recomputes inline.
+        _cache().delete(lock_key)
+        return False
+    return True
+
+
+def cache_response(timeout, tags):
+    """
+    Decorator caching a viewset method's response under `tags`.
+
+    Args:
+        timeout: Seconds the cached response is fresh; it is then served
+            stale (and refreshed in the background) for
+            ``RESPONSE_CACHE_STALE_TTL`` more seconds.
+        tags: Callable ``(view, kwargs) -> list[str]`` returning the tags.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if not _is_cacheable(request):
+                return method(view, request, *args, **kwargs)
+
+            key = _response_key(request, tags(view, kwargs))
+            if not getattr(_state, 'refreshing', False):
+                entry = _cache().get(key)
+                if entry is not None:
+                    if _should_refresh(entry):
+                        _schedule_refresh(key, request._request)
+                    return _replay(entry)
+
+            started = time.monotonic()
+            response = method(view, request, *args, **kwargs)
+            if hasattr(response, 'add_post_render_callback'):
+                response.add_post_render_callback(
+                    lambda rendered: _store(key, rendered, timeout, started))
+            else:
+                _store(key, response, timeout, started)
+            return response
+
+        return wrapper
+    return decorator
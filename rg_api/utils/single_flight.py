@@ -0,0 +1,192 @@
+"""
+Single-flight production of derived files.
+
+When many requests ask for the same missing file (typically an image preview
+right after a photo is published), only one of them should render it while
+the others wait for the result. `get_or_render` coordinates at three levels:
+
+1. an in-process lock per target path, for threads of the same worker;
+2. an ``flock`` on a lock file dedicated to the target (removed once it is
+   rendered), for worker processes on the same host;
+3. a ``cache.add`` lock, for hosts sharing the media volume.
+
+The file is always rendered to a temporary name and atomically renamed into
+place, so a reader never sees a partially written file.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_locks_guard = threading.Lock()
+_local_locks = {}
+
+
+@contextmanager
+def _local_lock(key):
+    """Hold an in-process lock dedicated to `key`."""
+    with _locks_guard:
+        entry = _local_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _local_locks[key]
+
+
+def _acquire_lock_file(lock_path, deadline):
+    """
+    Open and ``flock`` `lock_path`, retrying until `deadline`.
+
+    The holder removes the lock file when it is done, so a waiter may end up
+    locking a file that is no longer linked; it then starts over on the file
+    now at `lock_path`.
+
+    Returns:
+        The locked file object, or None if `deadline` passed.
+    """
+    while True:
+        lock_file = open(lock_path, 'a+b')
+        try:
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        lock_file.close()
+                        return None
+                    time.sleep(0.05)
+            try:
+                current = os.stat(lock_path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and \
+                    os.path.samestat(current, os.fstat(lock_file.fileno())):
+                return lock_file
+        except BaseException:
+            lock_file.close()
+            raise
+        lock_file.close()
+
+
+@contextmanager
+def _file_lock(path, timeout):
+    """
+    Hold an exclusive ``flock`` on the lock file of `path`.
+
+    Yields True if the lock was acquired, False if `timeout` elapsed (or file
+    locks are unsupported), in which case the caller proceeds unlocked. The
+    lock file is removed on release.
+    """
+    if fcntl is None:
+        yield False
+        return
+
+    lock_dir = os.path.join(os.path.dirname(path), '.locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    lock_path = os.path.join(lock_dir, f"{os.path.basename(path)}.lock")
+    lock_file = _acquire_lock_file(lock_path, time.monotonic() + timeout)
+    if lock_file is None:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        # Unlink before unlocking, so nobody locks the file after its removal
+        # without noticing.
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _wait_for(path, timeout, poll_interval=0.1):
+    """Wait until `path` exists; return True if it appeared in time."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path):
+            return True
+        time.sleep(poll_interval)
+    return os.path.exists(path)
+
+
+def render_atomically(path, render):
+    """
+    Call ``render(temp_path)`` and rename the result over `path`.
+
+    Returns:
+        bool: True if `render` succeeded and the file was moved into place.
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if not render(temp_path) or not os.path.exists(temp_path):
+            return False
+        os.replace(temp_path, path)
+        return True
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def get_or_render(path, render, lock_timeout=60, wait_timeout=30):
+    """
+    Return `path`, rendering it with ``render(temp_path)`` if it is missing.
+
+    Concurrent callers for the same path wait for the one that renders it
+    instead of repeating the work. If the holder of a cache lock does not
+    produce the file within `wait_timeout` seconds (e.g. it crashed on another
+    host), the caller renders the file itself.
+
+    Args:
+        path (str): Final location of the file.
+        render (callable): Writes the file to the given temporary path and
+            returns a truthy value on success.
+        lock_timeout (int): Expiry of the cross-host cache lock, in seconds.
+        wait_timeout (int): Maximum time to wait for another renderer.
+
+    Returns:
+        str | None: `path`, or None if rendering failed.
+    """
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _local_lock(path):
+        if os.path.exists(path):
+            return path
+        with _file_lock(path, wait_timeout):
+            if os.path.exists(path):
+                return path
+
+            cache_key = "single_flight:" + \
+                hashlib.sha1(path.encode('utf-8')).hexdigest()
+            leader = cache.add(cache_key, os.getpid(), lock_timeout)
+            if not leader and _wait_for(path, wait_timeout):
+                return path
+            if not leader:
+                logger.warning("Timed out waiting for %s, rendering it", path)
+            try:
+                if render_atomically(path, render):
+                    return path
+                return None
+            finally:
+                if leader:
+                    cache.delete(cache_key)
@@ -1,24 +1,43 @@
 """
 Decorator utilities for ViewSets.
 """
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from .response_cache import cache_response, detail_tag, model_tag
 
 
-def cached_viewset(list_timeout=60 * 60 * 2, retrieve_timeout=60 * 60 * 24):
+def cached_viewset(list_timeout=60 * 60 * 24, retrieve_timeout=60 * 60 * 24 * 7,
+                   depends_on=()):
     """
     Decorator to apply caching to ViewSet list and retrieve methods.
 
+    Responses are stored in the tagged response cache (see
+    `utils.response_cache`): lists are tagged with the queryset model, details
+    with the object's lookup value, and both with the models in `depends_on`.
+    Saving or deleting an instance purges the matching entries, so the
+    timeouts only bound how long unused entries are kept.
+
     Args:
-        list_timeout: Cache timeout for list view in seconds (default: 2 hours).
-        retrieve_timeout: Cache timeout for retrieve view in seconds (default: 24 hours).
+        list_timeout: Cache timeout for list view in seconds (default: 24 hours).
+        retrieve_timeout: Cache timeout for retrieve view in seconds (default: 7 days).
+        depends_on: Other models whose changes affect the serialized output.
 
     Returns:
         Decorated class with cache applied to list and retrieve methods.
     """
     def decorator(cls):
-        cls = method_decorator(cache_page(list_timeout), name='list')(cls)
-        cls = method_decorator(cache_page(
-            retrieve_timeout), name='retrieve')(cls)
+        model = cls.queryset.model
+        dependency_tags = [model_tag(dependency) for dependency in depends_on]
+
+        def list_tags(_view, _kwargs):
+            return [model_tag(model), *dependency_tags]
+
+        def retrieve_tags(view, kwargs):
+            lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+            return [detail_tag(model, view.lookup_field,
+                               kwargs.get(lookup_url_kwarg)),
+                    *dependency_tags]
+
+        cls.list = cache_response(list_timeout, list_tags)(cls.list)
+        cls.retrieve = cache_response(
+            retrieve_timeout, retrieve_tags)(cls.retrieve)
         return cls
     return decorator